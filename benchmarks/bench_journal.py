@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from tcbot.delivery import DeliveryQueue
+from tcbot.journal import DEFAULT_COMMIT_SECONDS, DeliveryJournal
+
+DEFAULT_MESSAGES = 50000
+CHANNELS = 10
+# Latency of sending a message to Discord
+SEND_SECONDS = 0.001
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+    async def send(self, msg: str):
+        await asyncio.sleep(SEND_SECONDS)
+
+
+class FakeClient:
+    def __init__(self):
+        self.channels = {cid: FakeChannel(cid) for cid in range(CHANNELS)}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channels.get(channel_id)
+
+
+async def _start(queue: DeliveryQueue):
+    queue.start()
+
+
+def deliver(messages: int, journal: Optional[DeliveryJournal]) -> Dict[str, float]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="loop_thread")
+    thread.start()
+    try:
+        queue = DeliveryQueue(
+            FakeClient(),
+            loop,
+            maxsize=messages,
+            coalesce_seconds=0,
+            journal=journal,
+        )
+        asyncio.run_coroutine_threadsafe(_start(queue), loop).result()
+
+        # Messages are submitted on this thread as the stream thread does
+        start = time.perf_counter()
+        for i in range(messages):
+            queue.submit(i % CHANNELS, f"https://twitter.com/user/status/{i}", i)
+        submit_sec = time.perf_counter() - start
+        asyncio.run_coroutine_threadsafe(queue.join(), loop).result()
+        total_sec = time.perf_counter() - start
+        asyncio.run_coroutine_threadsafe(queue.close_journal(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return {
+        "submit_rate": messages / submit_sec,
+        "total_rate": messages / total_sec,
+        "delivered": queue.delivered,
+        "commits": journal.commits if journal else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=DEFAULT_MESSAGES)
+    parser.add_argument(
+        "--commit",
+        type=float,
+        default=DEFAULT_COMMIT_SECONDS,
+        help="seconds of group commit",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'journal':>10} {'submit [/s]':>12} {'total [/s]':>11} "
+        f"{'delivered':>9} {'commits':>7}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in ("memory", "sqlite"):
+            journal = None
+            if name == "sqlite":
+                path = os.path.join(tmp_dir, "journal.db")
+                journal = DeliveryJournal(path, commit_seconds=args.commit)
+            result = deliver(args.messages, journal)
+            print(
+                f"{name:>10} {result['submit_rate']:>12.0f} "
+                f"{result['total_rate']:>11.0f} {result['delivered']:>9} "
+                f"{result['commits']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import re
+import timeit
+from typing import List, Dict, Any
+
+from tcbot.matcher import MonitorMatcher
+
+TWITTER_ID = 7080152
+MONITOR_COUNTS = (1, 100, 10000)
+# Number of different patterns shared by monitors
+DISTINCT_PATTERNS = 50
+
+MATCHED_TEXT = "配信開始 mildom.com/10000001 #live"
+UNMATCHED_TEXT = "今日のご飯はカレーでした．おいしかったです． pic.twitter.com/abcdef"
+
+
+def create_monitors(count: int) -> List[Dict[str, Any]]:
+    monitors = []
+    for i in range(count):
+        # Every 10th monitor has no pattern, others share a small set of patterns
+        match_ptn = None if i % 10 == 0 else rf"mildom\.com/{i % DISTINCT_PATTERNS}\d*"
+        monitors.append(
+            {"channel_id": i, "twitter_id": TWITTER_ID, "match_ptn": match_ptn}
+        )
+    return monitors
+
+
+def match_by_loop(monitors: List[Dict[str, Any]], text: str) -> List[Dict[str, Any]]:
+    # Matching of TweetCollectStream.on_status before MonitorMatcher
+    matched = []
+    for m in monitors:
+        if m["match_ptn"] and not re.search(m["match_ptn"], text):
+            continue
+        matched.append(m)
+    return matched
+
+
+def bench(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+    print(
+        f"{'monitors':>8} {'text':>9} {'loop [us]':>12} {'matcher [us]':>13} {'speedup':>8}"
+    )
+    for count in MONITOR_COUNTS:
+        monitors = create_monitors(count)
+        matcher = MonitorMatcher(monitors)
+        number = max(10, 100000 // count)
+        for label, text in (("matched", MATCHED_TEXT), ("unmatched", UNMATCHED_TEXT)):
+            assert len(match_by_loop(monitors, text)) == len(
+                matcher.match(TWITTER_ID, text)
+            )
+            loop_sec = bench(lambda: match_by_loop(monitors, text), number)
+            matcher_sec = bench(lambda: matcher.match(TWITTER_ID, text), number)
+            print(
+                f"{count:>8} {label:>9} {loop_sec * 1e6:>12.2f} "
+                f"{matcher_sec * 1e6:>13.2f} {loop_sec / matcher_sec:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
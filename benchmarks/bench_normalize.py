@@ -0,0 +1,68 @@
+import timeit
+from typing import Any, Dict, List
+
+from tcbot.normalize import URL_FIELD_DISPLAY, URL_FIELD_EXPANDED, normalize_status
+
+URL_COUNTS = (0, 1, 4, 10)
+# Length of text besides links, over 140 characters as extended tweets
+TEXT_LENGTHS = (40, 280)
+
+
+def create_status(url_count: int, text_length: int) -> Dict[str, Any]:
+    text = "配" * text_length
+    urls = []
+    for i in range(url_count):
+        short = f"https://t.co/abcdef{i:04d}"
+        start = len(text) + 1
+        text += f" {short}"
+        urls.append(
+            {
+                "url": short,
+                "expanded_url": f"https://www.mildom.com/{10000000 + i}",
+                "display_url": f"mildom.com/{10000000 + i}",
+                "indices": [start, start + len(short)],
+            }
+        )
+    return {"text": text, "entities": {"urls": urls}}
+
+
+def expand_by_loop(text: str, urls: List[Dict[str, Any]]) -> str:
+    # Formatting of TweetCollectStream.on_status before normalize_status
+    for e in urls:
+        text = text.replace(e["url"], e["display_url"])
+    return text
+
+
+def bench(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+    print(
+        f"{'urls':>4} {'length':>6} {'loop [us]':>10} "
+        f"{'display [us]':>13} {'expanded [us]':>14}"
+    )
+    number = 100000
+    for url_count in URL_COUNTS:
+        for text_length in TEXT_LENGTHS:
+            status = create_status(url_count, text_length)
+            text, urls = status["text"], status["entities"]["urls"]
+            assert expand_by_loop(text, urls) == normalize_status(
+                status, URL_FIELD_DISPLAY
+            )
+
+            loop_sec = bench(lambda: expand_by_loop(text, urls), number)
+            display_sec = bench(
+                lambda: normalize_status(status, URL_FIELD_DISPLAY), number
+            )
+            expanded_sec = bench(
+                lambda: normalize_status(status, URL_FIELD_EXPANDED), number
+            )
+            print(
+                f"{url_count:>4} {text_length:>6} {loop_sec * 1e6:>10.2f} "
+                f"{display_sec * 1e6:>13.2f} {expanded_sec * 1e6:>14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
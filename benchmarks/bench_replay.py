@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from tcbot.delivery import DeliveryQueue
+from tcbot.normalize import URL_FIELD_EXPANDED
+from tcbot.tcstream import TweetCollectStream
+from tcbot.trace import Tracer
+
+# (monitors, distinct patterns, channels) to sweep
+CASES = (
+    (10, 1, 1),
+    (1000, 50, 10),
+    (10000, 500, 100),
+)
+DEFAULT_TWEETS = 20000
+# Ratio of tweets by users not followed, which the stream also receives
+UNFOLLOWED_RATIO = 0.3
+MATCHED_RATIO = 0.5
+CREATED_AT = "Sat Oct 17 12:00:00 +0000 2026"
+
+# Throughput and latency vary by machine, so they are compared with a
+# baseline recorded on the same machine rather than fixed limits
+DEFAULT_TOLERANCE = 0.3
+# p99 latency of a short run is noisier than the rate
+DEFAULT_LATENCY_TOLERANCE = 1.0
+
+STATUS_ID_PTN = re.compile(r"/status/(\d+)")
+
+
+class FakeAuth:
+    consumer_key = consumer_secret = access_token = access_secret = ""
+
+
+class FakeMonitorDB:
+    def __init__(self, monitors: List[Dict[str, Any]]):
+        self.monitors = monitors
+
+    def select(self, channel_id: int = None, twitter_id: int = None) -> List[Dict]:
+        return [dict(m) for m in self.monitors]
+
+
+class FakeBackfill:
+    def seen(self, twitter_id: int, status_id: int):
+        pass
+
+
+class FakeChannel:
+    def __init__(
+        self, channel_id: int, ingested_at: Dict[int, float], latencies: List[float]
+    ):
+        self.id = channel_id
+        self.ingested_at = ingested_at
+        self.latencies = latencies
+
+    async def send(self, msg: str):
+        now = time.perf_counter()
+        for status_id in STATUS_ID_PTN.findall(msg):
+            self.latencies.append(now - self.ingested_at[int(status_id)])
+
+
+class FakeClient:
+    def __init__(self, channels: int, loop, coalesce_seconds: float):
+        self.ingested_at: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.channels = {
+            cid: FakeChannel(cid, self.ingested_at, self.latencies)
+            for cid in range(channels)
+        }
+        self.backfill = FakeBackfill()
+        self.tracer = Tracer()
+        self.url_field = URL_FIELD_EXPANDED
+        self.delivery = DeliveryQueue(
+            self, loop, maxsize=100000, coalesce_seconds=coalesce_seconds
+        )
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channels.get(channel_id)
+
+
+def create_monitors(
+    monitors: int, patterns: int, channels: int, user_ids: List[int] = None
+) -> List[Dict[str, Any]]:
+    # Every pair of channel and user is unique as in the table
+    rows = {}
+    for i in range(monitors):
+        twitter_id = i // channels
+        if user_ids:
+            twitter_id = user_ids[twitter_id % len(user_ids)]
+        match_ptn = None if i % 10 == 0 else rf"live/{i % patterns}\b"
+        rows[(i % channels, twitter_id)] = {
+            "channel_id": i % channels,
+            "twitter_id": twitter_id,
+            "match_ptn": match_ptn,
+        }
+    return list(rows.values())
+
+
+def create_tweets(
+    count: int, users: int, patterns: int, unfollowed: float = UNFOLLOWED_RATIO
+) -> List[str]:
+    rand = random.Random(0)
+    tweets = []
+    for i in range(count):
+        status_id = 1000000 + i
+        if rand.random() < unfollowed:
+            user_id = users + rand.randrange(1000)
+        else:
+            user_id = rand.randrange(users)
+        if rand.random() < MATCHED_RATIO:
+            text = f"配信開始 https://t.co/abc{i} #live"
+            display_url = f"example.com/live/{rand.randrange(patterns)}"
+        else:
+            text = f"今日のご飯はカレーでした． https://t.co/abc{i}"
+            display_url = f"example.com/photo/{i}"
+        url = f"https://t.co/abc{i}"
+        start = text.index(url)
+        tweets.append(
+            json.dumps(
+                {
+                    "created_at": CREATED_AT,
+                    "id": status_id,
+                    "id_str": str(status_id),
+                    "text": text,
+                    "in_reply_to_status_id": None,
+                    "user": {
+                        "id": user_id,
+                        "id_str": str(user_id),
+                        "screen_name": f"user{user_id}",
+                    },
+                    "entities": {
+                        "urls": [
+                            {
+                                "url": url,
+                                "expanded_url": f"https://{display_url}",
+                                "display_url": display_url,
+                                "indices": [start, start + len(url)],
+                            }
+                        ]
+                    },
+                },
+                ensure_ascii=False,
+            )
+        )
+    return tweets
+
+
+def load_tweets(file_name: str) -> List[str]:
+    # One raw tweet JSON per line as recorded from the stream
+    with open(file_name) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _start(client: FakeClient):
+    client.delivery.start()
+
+
+def replay(
+    monitors: List[Dict[str, Any]],
+    channels: int,
+    tweets: List[str],
+    coalesce_seconds: float,
+) -> Dict[str, float]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="loop_thread")
+    thread.start()
+    try:
+        client = FakeClient(channels, loop, coalesce_seconds)
+        asyncio.run_coroutine_threadsafe(_start(client), loop).result()
+        stream = TweetCollectStream(client, FakeAuth(), FakeMonitorDB(monitors), loop)
+
+        # Tweets are fed on this thread as the stream thread does
+        status_ids = [json.loads(raw)["id"] for raw in tweets]
+        start = time.perf_counter()
+        for status_id, raw in zip(status_ids, tweets):
+            client.ingested_at[status_id] = time.perf_counter()
+            stream.on_data(raw)
+        ingest_sec = time.perf_counter() - start
+        asyncio.run_coroutine_threadsafe(client.delivery.join(), loop).result()
+        total_sec = time.perf_counter() - start
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return {
+        "ingest_rate": len(tweets) / ingest_sec,
+        "total_rate": len(tweets) / total_sec,
+        "delivered": len(client.latencies),
+        "p50": percentile(client.latencies, 0.5),
+        "p99": percentile(client.latencies, 0.99),
+    }
+
+
+def load_baseline(file_name: str) -> Dict[str, Dict[str, float]]:
+    # Results of each case keyed by the number of monitors
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def save_baseline(file_name: str, baseline: Dict[str, Dict[str, float]]):
+    with open(file_name, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def check_baseline(
+    baseline: Optional[Dict[str, float]],
+    result: Dict[str, float],
+    tolerance: float,
+    latency_tolerance: float,
+) -> List[str]:
+    # Return regressions from the baseline recorded on the same machine
+    if not baseline:
+        return []
+
+    violations = []
+    min_rate = baseline["ingest_rate"] * (1 - tolerance)
+    if result["ingest_rate"] < min_rate:
+        violations.append(
+            f"ingest rate {result['ingest_rate']:.0f}/s is under {min_rate:.0f}/s"
+        )
+    max_p99 = baseline["p99_ms"] * (1 + latency_tolerance)
+    if result["p99"] * 1e3 > max_p99:
+        violations.append(f"p99 {result['p99'] * 1e3:.2f}ms is over {max_p99:.2f}ms")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replay tweets through TweetCollectStream with fake Discord and "
+            "MonitorDB. Requires the runtime dependencies including tweepy."
+        )
+    )
+    parser.add_argument(
+        "--tweets", type=int, default=DEFAULT_TWEETS, help="synthetic tweets"
+    )
+    parser.add_argument(
+        "--input", metavar="FILEPATH", help="recorded tweets in JSON lines"
+    )
+    parser.add_argument("--coalesce", type=float, default=0, help="coalesce seconds")
+    parser.add_argument(
+        "--unfollowed",
+        type=float,
+        default=UNFOLLOWED_RATIO,
+        help="ratio of synthetic tweets by users not followed",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        metavar="FILEPATH",
+        help="save the results in JSON as the baseline of this machine",
+    )
+    parser.add_argument(
+        "--baseline",
+        metavar="FILEPATH",
+        help="results saved on the same machine to exit with 1 on regression",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="allowed drop of ingest rate from the baseline",
+    )
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=DEFAULT_LATENCY_TOLERANCE,
+        help="allowed rise of p99 latency from the baseline",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'monitors':>8} {'patterns':>8} {'channels':>8} {'ingest [/s]':>12} "
+        f"{'total [/s]':>11} {'delivered':>9} {'p50 [ms]':>9} {'p99 [ms]':>9}"
+    )
+    recorded = load_tweets(args.input) if args.input else None
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    results = {}
+    violations = []
+    for count, patterns, channels in CASES:
+        if recorded:
+            # Follow users appearing in the recorded tweets
+            user_ids = sorted({json.loads(raw)["user"]["id"] for raw in recorded})
+            monitors = create_monitors(count, patterns, channels, user_ids)
+            tweets = recorded
+        else:
+            monitors = create_monitors(count, patterns, channels)
+            users = max(m["twitter_id"] for m in monitors) + 1
+            tweets = create_tweets(args.tweets, users, patterns, args.unfollowed)
+
+        result = replay(monitors, channels, tweets, args.coalesce)
+        print(
+            f"{count:>8} {patterns:>8} {channels:>8} {result['ingest_rate']:>12.0f} "
+            f"{result['total_rate']:>11.0f} {result['delivered']:>9} "
+            f"{result['p50'] * 1e3:>9.2f} {result['p99'] * 1e3:>9.2f}"
+        )
+        results[str(count)] = {
+            "ingest_rate": result["ingest_rate"],
+            "p99_ms": result["p99"] * 1e3,
+        }
+        for violation in check_baseline(
+            baseline.get(str(count)),
+            result,
+            args.tolerance,
+            args.latency_tolerance,
+        ):
+            violations.append(f"monitors: {count}, {violation}")
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if violations:
+        for violation in violations:
+            print(f"Regressed from baseline. {violation}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from tcbot.backend import OP_DELETE, OP_INSERT, StorageBackend, backend_class
+
+DEFAULT_MONITORS = 1000
+DEFAULT_OPERATIONS = 500
+TABLE_NAME = "bench_monitors"
+
+
+def _latency(func: Callable[[int], None], count: int) -> Dict[str, float]:
+    times: List[float] = []
+    for i in range(count):
+        start = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    return {
+        "mean": statistics.mean(times) * 1e3,
+        "p50": times[len(times) // 2] * 1e3,
+        "p99": times[min(len(times) - 1, int(len(times) * 0.99))] * 1e3,
+    }
+
+
+def measure(backend: StorageBackend, monitors: int, operations: int):
+    backend.create_table()
+    backend.execute_raw(f"DELETE FROM {TABLE_NAME};", None)
+
+    # Table holds the monitors of a typical deployment while measuring
+    backend.write(
+        OP_INSERT,
+        [
+            {"channel_id": i % 100, "twitter_id": i, "match_ptn": None}
+            for i in range(monitors)
+        ],
+    )
+
+    # Inserted rows are deleted in the same order, so the size stays the same
+    def insert(i: int):
+        row = {"channel_id": -1, "twitter_id": i, "match_ptn": r"mildom\.com"}
+        backend.write(OP_INSERT, [row])
+
+    def delete(i: int):
+        backend.write(OP_DELETE, [{"channel_id": -1, "twitter_id": i}])
+
+    results = {
+        "select": _latency(lambda i: backend.select_all(), operations),
+        "insert": _latency(insert, operations),
+        "delete": _latency(delete, operations),
+    }
+    backend.execute_raw(f"DROP TABLE {TABLE_NAME};", None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--monitors", type=int, default=DEFAULT_MONITORS)
+    parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS)
+    parser.add_argument(
+        "--postgres", help="database url to compare with PostgreSQL", default=None
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':>10} {'op':>6} {'mean [ms]':>10} {'p50 [ms]':>9} {'p99 [ms]':>9}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        urls = {"sqlite": f"sqlite:///{os.path.join(tmp_dir, 'monitors.db')}"}
+        if args.postgres:
+            urls["postgres"] = args.postgres
+
+        for name, url in urls.items():
+            backend = backend_class(url)(url, TABLE_NAME)
+            try:
+                results = measure(backend, args.monitors, args.operations)
+            finally:
+                backend.close()
+            for op, result in results.items():
+                print(
+                    f"{name:>10} {op:>6} {result['mean']:>10.3f} "
+                    f"{result['p50']:>9.3f} {result['p99']:>9.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
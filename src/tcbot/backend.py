@@ -0,0 +1,74 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .exception import TCBotError
+
+OP_INSERT = "insert"
+OP_DELETE = "delete"
+OP_RELOAD = "reload"
+
+COLUMNS = "channel_id, twitter_id, match_ptn"
+
+# Backend is selected by the scheme of the database url
+SQLITE_SCHEME = "sqlite://"
+
+# Interval to retry connecting for listening to changes
+LISTEN_RETRY_SECONDS = 5
+
+
+class StorageBackend:
+    # Base class of exceptions raised by the driver
+    Error: Type[Exception] = Exception
+
+    def __init__(self, database_url: str, table_name: str):
+        self.database_url = database_url
+        self.table_name = table_name
+        self.cursor_table_name = f"{table_name}_cursors"
+
+    def close(self):
+        raise NotImplementedError
+
+    def create_table(self):
+        raise NotImplementedError
+
+    def select_all(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def write(self, op: str, rows: List[Dict[str, Any]]):
+        # Insert or delete all rows in one transaction
+        raise NotImplementedError
+
+    def execute_raw(self, query: str, params: Optional[Tuple]) -> Optional[List[Dict]]:
+        # Raw query may change the table, so statements cached are discarded
+        raise NotImplementedError
+
+    def select_cursors(self) -> Dict[int, int]:
+        raise NotImplementedError
+
+    def save_cursors(self, cursors: Dict[int, int]):
+        raise NotImplementedError
+
+    def listen(
+        self,
+        on_notify: Callable[[str], None],
+        on_reload: Callable[[], None],
+        is_closed: Callable[[], bool],
+    ):
+        # Run on the listening thread until closed. on_notify(payload) is called
+        # for each change by other processes, and on_reload() when changes may
+        # have been missed.
+        raise NotImplementedError
+
+
+def backend_class(database_url: str) -> Type[StorageBackend]:
+    # Drivers are imported only when used
+    if database_url.startswith(SQLITE_SCHEME):
+        from .sqlitebackend import SQLiteBackend
+
+        return SQLiteBackend
+
+    # Other urls and connection strings are passed to libpq
+    try:
+        from .pgbackend import PostgresBackend
+    except ImportError as exc:
+        raise TCBotError("psycopg2 is required to use PostgreSQL.") from exc
+    return PostgresBackend
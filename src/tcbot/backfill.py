@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import functools
+import threading
+import time
+from typing import Dict, Iterable, List, Set
+
+import tweepy
+
+from .logger import logger
+from .exception import TCBotError
+from .monitordb import MonitorDB
+from .tcstream import handle_status
+from .twauth import TwitterAuth
+
+# Requests of statuses/user_timeline allowed in a window, less than the limit of 900
+BACKFILL_REQUESTS_PER_WINDOW = 800
+BACKFILL_WINDOW_SECONDS = 15 * 60
+BACKFILL_WORKERS = 4
+# Statuses per page and pages per user fetched in one backfill
+BACKFILL_PAGE_SIZE = 200
+BACKFILL_MAX_PAGES = 4
+
+# Interval to save cursors to database
+CURSOR_FLUSH_SECONDS = 30
+
+
+class RateBudget:
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._calls = collections.deque()
+
+    async def acquire(self):
+        # Wait until a request is allowed in the sliding window
+        while True:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] >= self.window:
+                self._calls.popleft()
+            if len(self._calls) < self.limit:
+                self._calls.append(now)
+                return
+            await asyncio.sleep(self.window - (now - self._calls[0]))
+
+
+class Backfiller:
+    def __init__(
+        self,
+        client,
+        tw_auth: TwitterAuth,
+        monitor_db: MonitorDB,
+        loop,
+        workers: int = BACKFILL_WORKERS,
+        budget: RateBudget = None,
+    ):
+        self.client = client
+        self.tw_auth = tw_auth
+        self.monitor_db = monitor_db
+        self.loop = loop
+        self.workers = workers
+        self.budget = budget or RateBudget(
+            BACKFILL_REQUESTS_PER_WINDOW, BACKFILL_WINDOW_SECONDS
+        )
+
+        # Last status id processed for each user
+        self.cursors: Dict[int, int] = {}
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.backfilled = 0
+
+        self._queue = None
+        self._pending: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def seen(self, twitter_id: int, status_id: int):
+        # May be called from any thread
+        with self._lock:
+            if status_id > self.cursors.get(twitter_id, 0):
+                self.cursors[twitter_id] = status_id
+                self._dirty.add(twitter_id)
+
+    async def start(self):
+        # Must be called on the event loop before streams are started
+        if self._queue is not None:
+            return
+
+        try:
+            cursors = await self.loop.run_in_executor(
+                None, self.monitor_db.select_cursors
+            )
+        except TCBotError:
+            logger.exception("Backfill is disabled until cursors are saved.")
+            cursors = {}
+
+        for twitter_id, status_id in cursors.items():
+            with self._lock:
+                if status_id > self.cursors.get(twitter_id, 0):
+                    self.cursors[twitter_id] = status_id
+
+        self._queue = asyncio.Queue()
+        self._tasks = [self.loop.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(self.loop.create_task(self._flush_periodically()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+    async def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            cursors = {tid: self.cursors[tid] for tid in dirty}
+        if not cursors:
+            return
+
+        try:
+            await self.loop.run_in_executor(None, self.monitor_db.save_cursors, cursors)
+        except TCBotError:
+            logger.exception("Catch Exception")
+            # Saved at the next flush
+            with self._lock:
+                self._dirty |= dirty
+
+    def request(self, twitter_ids: Iterable[int]):
+        # May be called from any thread
+        self.loop.call_soon_threadsafe(self._request, list(twitter_ids))
+
+    def _request(self, twitter_ids: List[int]):
+        if self._queue is None:
+            return
+
+        for twitter_id in twitter_ids:
+            # Users never seen have no known gap
+            if twitter_id in self._pending or twitter_id not in self.cursors:
+                continue
+            self._pending.add(twitter_id)
+            self._queue.put_nowait(twitter_id)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(CURSOR_FLUSH_SECONDS)
+            await self.flush()
+
+    async def _work(self):
+        while True:
+            twitter_id = await self._queue.get()
+            try:
+                await self._backfill(twitter_id)
+            except Exception:
+                logger.exception(f"Failed to backfill. twitter_id: {twitter_id}")
+            finally:
+                self._pending.discard(twitter_id)
+                self._queue.task_done()
+
+    async def _backfill(self, twitter_id: int):
+        with self._lock:
+            since_id = self.cursors.get(twitter_id)
+        statuses = await self._fetch(twitter_id, since_id)
+
+        matcher = self.client.streams.matcher
+        if not statuses or matcher is None:
+            return
+
+        # Matching and submitting may block on backpressure, so they run off
+        # the event loop as on the stream thread
+        await self.loop.run_in_executor(None, self._handle, matcher, statuses)
+        self.backfilled += len(statuses)
+        logger.info(f"Backfilled {len(statuses)} statuses. twitter_id: {twitter_id}")
+
+    def _handle(self, matcher, statuses: List):
+        # Oldest first as the stream does
+        statuses.sort(key=lambda status: status.id)
+        for status in statuses:
+            handle_status(self.client, matcher, status)
+
+    async def _fetch(self, twitter_id: int, since_id: int) -> List:
+        statuses = []
+        max_id = None
+        for _ in range(BACKFILL_MAX_PAGES):
+            kwargs = {
+                "user_id": twitter_id,
+                "since_id": since_id,
+                "count": BACKFILL_PAGE_SIZE,
+                # Full text of tweets longer than 140 characters
+                "tweet_mode": "extended",
+            }
+            if max_id is not None:
+                kwargs["max_id"] = max_id
+
+            await self.budget.acquire()
+            self.requests += 1
+            try:
+                page = await self.loop.run_in_executor(
+                    None, functools.partial(self.tw_auth.api.user_timeline, **kwargs)
+                )
+            except tweepy.RateLimitError:
+                logger.error("Rate limit exceeded on statuses/user_timeline.")
+                break
+            except tweepy.TweepError:
+                # Protected or suspended user
+                logger.exception(f"Failed to get timeline. twitter_id: {twitter_id}")
+                break
+
+            if not page:
+                break
+            statuses.extend(page)
+            max_id = min(status.id for status in page) - 1
+
+        return statuses
@@ -1,141 +1,593 @@
 import asyncio
+import concurrent.futures
+import os
 import re
 import shlex
-from typing import List, Tuple
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
 
 import discord
 import tweepy
 
-from .monitordb import MonitorDB
+from .monitordb import MonitorDB, OP_INSERT
 from .logger import logger
 from .exception import TCBotError
 from .twauth import TwitterAuth
-from .tcstream import TweetCollectStream
+from .matcher import MonitorMatcher, pattern_id
+from .streammgr import StreamManager
+from .backfill import Backfiller
+from .dedup import DedupCache, DEFAULT_DEDUP_SIZE
+from .trace import Tracer
+from .channels import ChannelCache
+from .journal import DeliveryJournal
+from .normalize import URL_FIELD_EXPANDED
+from .patterns import ENGINE_RE, check_pattern
+from .profiler import SamplingProfiler, FORMATS, FORMAT_COLLAPSED
+from .startup import StartupTimer
+from .metrics import (
+    registry,
+    COMMAND_SECONDS,
+    DELIVERY_QUEUE_DEPTH,
+    DISCORD_RATE_LIMITED,
+    DISCORD_SEND_SECONDS,
+    MATCH_SECONDS,
+    TWEETS_MATCHED,
+    TWEETS_RECEIVED,
+    TWEETS_UNMONITORED,
+)
+from .delivery import (
+    DeliveryQueue,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    DEFAULT_COALESCE_SECONDS,
+    BACKPRESSURE_BLOCK,
+)
 
 
 MAIN_CMD = "!tc"
 ADD_CMD = "add"
 REMOVE_CMD = "remove"
 LIST_CMD = "list"
+STATS_CMD = "stats"
+PROFILE_CMD = "profile"
 HELP_CMD = "help"
+COMMANDS = (ADD_CMD, REMOVE_CMD, LIST_CMD, STATS_CMD, PROFILE_CMD, HELP_CMD)
+
+# Separator of accounts given to ADD_CMD and REMOVE_CMD at once
+ACCOUNT_SEPARATOR = ","
+
+# Threads to run commands blocking on Twitter API and database
+COMMAND_WORKERS = 4
+
+# Time to wait for queued tweets to be sent on close
+DELIVERY_CLOSE_TIMEOUT_SECONDS = 10
+
+# Number of the slowest patterns shown by STATS_CMD and exported as metrics
+SLOW_PATTERNS_COUNT = 5
+
+# Interval to retry reconciling monitors of the snapshot with the database
+RECONCILE_RETRY_SECONDS = 30
+
+# Seconds of a profile started by PROFILE_CMD or the signal
+DEFAULT_PROFILE_SECONDS = 30
+MAX_PROFILE_SECONDS = 300
 
 
 class BotClient(discord.Client):
     def __init__(
         self,
-        monitor_db: MonitorDB,
-        tw_auth: TwitterAuth,
+        monitor_db: Optional[MonitorDB],
+        tw_auth: Optional[TwitterAuth],
         loop=None,
+        stream_auths: List[TwitterAuth] = None,
+        delivery_queue_size: int = DEFAULT_QUEUE_SIZE,
+        delivery_workers: int = DEFAULT_WORKERS,
+        delivery_backpressure: str = BACKPRESSURE_BLOCK,
+        delivery_coalesce_seconds: float = DEFAULT_COALESCE_SECONDS,
+        dedup_size: int = DEFAULT_DEDUP_SIZE,
+        dedup_path: str = None,
+        journal_path: str = None,
+        trace_path: str = None,
+        trace_sample_rate: float = 0.0,
+        profile_dir: str = None,
+        url_field: str = URL_FIELD_EXPANDED,
+        regex_engine: str = ENGINE_RE,
+        startup: Optional[StartupTimer] = None,
     ):
         if loop is None:
             self.loop = asyncio.get_event_loop()
         else:
             self.loop = loop
 
-        self.monitor_db = monitor_db
-        self.tw_auth = tw_auth
-        self.stream = None
+        self._stream_started = False
+        # Field of URL entities replacing shortened links before matching
+        self.url_field = url_field
+        # Engine of patterns given by users, re2 matches in linear time
+        self.regex_engine = regex_engine
+
+        # Database and Twitter are connected while logging in to Discord
+        self.monitor_db: Optional[MonitorDB] = None
+        self.tw_auth: Optional[TwitterAuth] = None
+        self.streams: Optional[StreamManager] = None
+        self.backfill: Optional[Backfiller] = None
+        self._attached = asyncio.Event()
+        self.startup = startup or StartupTimer()
+        self.startup_failed = False
+
+        # Commands are run on other threads and serialized per channel
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=COMMAND_WORKERS, thread_name_prefix="command"
+        )
+        self._channel_locks: Dict[int, asyncio.Lock] = {}
+
+        # Channels are resolved once and those gone are quarantined
+        self.channels = ChannelCache(
+            self.get_channel,
+            on_quarantined=self._on_channel_quarantined,
+            on_released=self._on_channel_released,
+        )
+
+        # Sampled tweets are traced from creation to sending
+        self.tracer = Tracer(trace_path, trace_sample_rate)
+
+        # Tweets are handed over from the stream thread to the event loop
+        self.delivery = DeliveryQueue(
+            self,
+            self.loop,
+            maxsize=delivery_queue_size,
+            workers=delivery_workers,
+            backpressure=delivery_backpressure,
+            coalesce_seconds=delivery_coalesce_seconds,
+            dedup=DedupCache(dedup_size, dedup_path),
+            tracer=self.tracer,
+            channels=self.channels,
+            journal=DeliveryJournal(journal_path) if journal_path else None,
+        )
+
+        # Profiles are taken only on demand
+        self.profiler = SamplingProfiler(self.loop)
+        self.profile_dir = profile_dir or tempfile.gettempdir()
+
+        self._register_metrics()
+
+        if monitor_db is not None and tw_auth is not None:
+            self.attach(monitor_db, tw_auth, stream_auths)
 
         super().__init__(loop=self.loop)
 
-    def _resume_stream(self):
-        # Close running stream before
-        if self.stream:
-            self.stream.disconnect()
+    def attach(
+        self,
+        monitor_db: MonitorDB,
+        tw_auth: TwitterAuth,
+        stream_auths: List[TwitterAuth] = None,
+    ):
+        # Must be called on the event loop unless called by __init__
+        self.monitor_db = monitor_db
+        self.tw_auth = tw_auth
 
-        self.stream = TweetCollectStream(
+        # Followed users are split into a stream per credential
+        self.streams = StreamManager(
             self,
-            self.tw_auth,
-            self.monitor_db,
+            stream_auths or [tw_auth],
+            monitor_db,
             self.loop,
         )
-        monitor_users = list(map(str, self.stream.user_id_map.keys()))
-        if monitor_users:
-            self.stream.filter(follow=monitor_users, threaded=True)
 
-    async def _send_message(self, channel_id: int, msg: str):
-        channel = self.get_channel(channel_id)
-        await channel.send(msg)
+        # Tweets missed while streams are down are fetched on reconnection
+        self.backfill = Backfiller(self, tw_auth, monitor_db, self.loop)
+
+        # Follow changes made by other bot instances sharing the table
+        self.monitor_db.add_listener(self._on_monitor_changed)
+        # Changes received before the streams start are kept by StreamManager
+        self.monitor_db.start_listening()
+
+        self._attached.set()
+
+    def _register_metrics(self):
+        # Counted by the queue itself not to slow down submitting
+        DELIVERY_QUEUE_DEPTH.set_function(lambda: self.delivery.depth)
+        for name, help in (
+            ("delivered", "Messages delivered to Discord."),
+            ("failed", "Messages failed to be sent."),
+            ("dropped", "Messages dropped because the queue is full."),
+            ("duplicates", "Messages skipped as already delivered."),
+            ("quarantined", "Messages skipped because the channel is gone."),
+            ("replayed", "Messages replayed from the journal after restart."),
+        ):
+            registry.collector(
+                f"tcbot_delivery_{name}_total",
+                help,
+                "counter",
+                lambda name=name: [({}, getattr(self.delivery, name))],
+            )
+        registry.collector(
+            "tcbot_channels_quarantined",
+            "Channels deleted or not accessible.",
+            "gauge",
+            lambda: [({}, len(self.channels.quarantined))],
+        )
+        registry.collector(
+            "tcbot_stream_follows",
+            "Users followed by each stream.",
+            "gauge",
+            lambda: [({"shard": h["shard"]}, h["follows"]) for h in self._health()],
+        )
+        registry.collector(
+            "tcbot_stream_running",
+            "Whether each stream is running.",
+            "gauge",
+            lambda: [({"shard": h["shard"]}, h["running"]) for h in self._health()],
+        )
+        registry.collector(
+            "tcbot_pattern_match_seconds_sampled",
+            "Time spent by the slowest patterns in sampled tweets.",
+            "gauge",
+            lambda: [
+                ({"pattern_id": pattern_id(ptn)}, stats.seconds)
+                for ptn, stats in self._slow_patterns()
+            ],
+        )
 
-    def _add(self, channel_id: int, args: List[str]) -> Tuple[str, str]:
-        screen_name = args[0] if len(args) > 0 else None
-        match_ptn = args[1] if len(args) > 1 else None
+    def _health(self) -> List[Dict]:
+        if self.streams is None:
+            return []
+        return self.streams.health()
+
+    def _slow_patterns(self):
+        matcher = self.streams.matcher if self.streams is not None else None
+        if matcher is None:
+            return []
+        return matcher.slowest_patterns(SLOW_PATTERNS_COUNT)
+
+    async def _run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    def _channel_lock(self, channel_id: int) -> asyncio.Lock:
+        if channel_id not in self._channel_locks:
+            self._channel_locks[channel_id] = asyncio.Lock()
+        return self._channel_locks[channel_id]
+
+    async def _resume_stream(self):
+        # Monitors come from the snapshot if the database is not loaded yet
+        is_warm = self.monitor_db.is_warm
+        monitors = await self._run_blocking(self.monitor_db.select)
+        matcher = MonitorMatcher(
+            monitors,
+            engine=self.regex_engine,
+            on_disabled=self._on_pattern_disabled,
+        )
+        for channel_id in self.channels.quarantined:
+            matcher.quarantine(channel_id)
+        self.streams.start(matcher)
 
-        if screen_name is None:
-            raise TCBotError("アカウント名が指定されていません．")
+        # Quarantine channels deleted while the bot is down
+        for channel_id in {m["channel_id"] for m in monitors}:
+            self.channels.resolve(channel_id)
 
-        # Raise exception if the account is not exist
-        try:
-            status = self.tw_auth.api.get_user(screen_name=screen_name)
-        except tweepy.TweepError as exc:
-            raise TCBotError(f"存在しないアカウントです．アカウント名: {screen_name}") from exc
-        else:
-            twitter_id = status.id
+        if is_warm:
+            self.loop.create_task(self._reconcile_monitors())
 
-        # Raise exception if the regular expression is invalid
-        if match_ptn:
+    async def _reconcile_monitors(self):
+        # Streams started from the snapshot catch up with the database. The
+        # difference is applied to the streams by the listener of MonitorDB.
+        while not self.is_closed():
             try:
-                re.compile(match_ptn)
-            except re.error as exc:
-                raise TCBotError(f"正規表現が不正です．正規表現: {match_ptn}") from exc
+                fresh = await self._run_blocking(self.monitor_db.reconcile)
+            except TCBotError:
+                logger.exception("Failed to reconcile monitors with database.")
+                await asyncio.sleep(RECONCILE_RETRY_SECONDS)
+                continue
+            logger.info(f"Reconciled {len(fresh)} monitors with database.")
+            return
 
-        # Raise exception if the account is already registered
-        if self.monitor_db.select(channel_id=channel_id, twitter_id=twitter_id):
-            raise TCBotError(f"既に登録されているアカウントです．アカウント名: {screen_name}")
+    def _on_channel_quarantined(self, channel_id: int):
+        # Tweets are no longer matched for monitors of the channel
+        matcher = self.streams.matcher if self.streams is not None else None
+        if matcher is not None:
+            matcher.quarantine(channel_id)
 
-        # Update database
-        self.monitor_db.insert(channel_id, twitter_id, match_ptn)
+    def _on_channel_released(self, channel_id: int):
+        matcher = self.streams.matcher if self.streams is not None else None
+        if matcher is not None:
+            matcher.release(channel_id)
 
-        # Rerun stream
-        self._resume_stream()
+    def _on_pattern_disabled(self, match_ptn: str, monitors: List[Dict]):
+        # Called on the thread matching the tweet
+        for m in monitors:
+            text = (
+                f"正規表現の処理に時間がかかりすぎるため監視を停止しました．"
+                f"アカウント名: id:{m['twitter_id']}, 正規表現: {repr(match_ptn)}"
+                f"\r　削除して別の正規表現で登録し直してください．"
+            )
+            asyncio.run_coroutine_threadsafe(
+                self.send_error(m["channel_id"], text), self.loop
+            )
 
-        return screen_name, match_ptn
+    def _is_admitted(self, match_ptn: str) -> bool:
+        # Patterns already running have been checked
+        matcher = self.streams.matcher
+        if matcher is not None:
+            stats = matcher.pattern_stats.get(match_ptn)
+            if stats is not None and not stats.disabled:
+                return True
+        return check_pattern(match_ptn, self.regex_engine)
+
+    def _on_monitor_changed(self, op: str, monitor: Dict):
+        # Called on the listening thread of MonitorDB
+        if op == OP_INSERT:
+            self.streams.add(monitor)
+        else:
+            self.streams.remove(monitor["channel_id"], monitor["twitter_id"])
 
-    def _remove(self, channel_id: int, args: List[str]) -> str:
-        screen_name = args[0] if len(args) > 0 else None
+    async def _send_message(self, channel_id: int, msg: str):
+        channel = self.channels.resolve(channel_id)
+        if channel is None:
+            logger.error(f"Channel is not found. channel_id: {channel_id}")
+            return
+        await channel.send(msg)
 
-        if screen_name is None:
-            raise TCBotError("アカウント名が指定されていません．")
+    @staticmethod
+    def _split_accounts(args: List[str]) -> List[List[str]]:
+        # Split arguments into groups of each account by separator
+        groups = [[]]
+        for arg in args:
+            if arg == ACCOUNT_SEPARATOR:
+                groups.append([])
+            else:
+                groups[-1].append(arg)
+        return [group for group in groups if group]
 
-        # Raise exception if the account is not exist
+    def _resolve_user_ids(self, screen_names: List[str]) -> Dict[str, int]:
         try:
-            status = self.tw_auth.api.get_user(screen_name=screen_name)
+            return self.tw_auth.lookup_user_ids(screen_names)
         except tweepy.TweepError as exc:
-            raise TCBotError(f"存在しないアカウントです．アカウント名: {screen_name}") from exc
-        else:
-            twitter_id = status.id
+            raise TCBotError("アカウント情報の取得に失敗しました．") from exc
+
+    def _add(
+        self, channel_id: int, args: List[str]
+    ) -> List[Tuple[str, str, Optional[str]]]:
+        # Return (screen_name, match_ptn, error) of each account
+        groups = self._split_accounts(args)
+        if not groups:
+            raise TCBotError("アカウント名が指定されていません．")
 
-        # Raise exception if the account is not registered
-        if not self.monitor_db.select(channel_id=channel_id, twitter_id=twitter_id):
-            raise TCBotError(f"登録されていないアカウントです．アカウント名: {screen_name}")
+        results = []
+        for group in groups:
+            screen_name = group[0]
+            match_ptn = group[1] if len(group) > 1 else None
+            error = None
+
+            if len(group) > 2:
+                error = f"引数が不正です．複数のアカウントは'{ACCOUNT_SEPARATOR}'で区切ってください．"
+            # Error if the regular expression is invalid
+            elif match_ptn:
+                try:
+                    re.compile(match_ptn)
+                except re.error:
+                    error = f"正規表現が不正です．正規表現: {match_ptn}"
+                else:
+                    # Reject patterns which would stall the stream by backtracking
+                    if not self._is_admitted(match_ptn):
+                        error = f"正規表現の処理に時間がかかりすぎます．正規表現: {match_ptn}"
+
+            results.append([screen_name, match_ptn, error])
+
+        # Resolve all accounts at once
+        user_ids = self._resolve_user_ids([r[0] for r in results if r[2] is None])
+        registered = {
+            m["twitter_id"] for m in self.monitor_db.select(channel_id=channel_id)
+        }
+
+        rows = []
+        for result in results:
+            screen_name, match_ptn, error = result
+            if error:
+                continue
+
+            twitter_id = user_ids.get(screen_name.lower())
+            # Error if the account is not exist
+            if twitter_id is None:
+                result[2] = f"存在しないアカウントです．アカウント名: {screen_name}"
+            # Error if the account is already registered
+            elif twitter_id in registered:
+                result[2] = f"既に登録されているアカウントです．アカウント名: {screen_name}"
+            else:
+                registered.add(twitter_id)
+                rows.append((channel_id, twitter_id, match_ptn))
+
+        # Update database in one transaction
+        try:
+            self.monitor_db.insert_many(rows)
+        except TCBotError as exc:
+            logger.exception("Catch Exception")
+            for result in results:
+                result[2] = result[2] or str(exc)
+            return [tuple(result) for result in results]
+
+        # Update monitors and reconnect streams only if the follow list is changed
+        for cid, tid, ptn in rows:
+            self.streams.add({"channel_id": cid, "twitter_id": tid, "match_ptn": ptn})
+
+        return [tuple(result) for result in results]
+
+    def _remove(
+        self, channel_id: int, args: List[str]
+    ) -> List[Tuple[str, Optional[str]]]:
+        # Return (screen_name, error) of each account
+        screen_names = [name for group in self._split_accounts(args) for name in group]
+        if not screen_names:
+            raise TCBotError("アカウント名が指定されていません．")
 
-        # Update database
-        self.monitor_db.delete(channel_id, twitter_id)
+        # Resolve all accounts at once
+        user_ids = self._resolve_user_ids(screen_names)
+        registered = {
+            m["twitter_id"] for m in self.monitor_db.select(channel_id=channel_id)
+        }
+
+        results = []
+        keys = []
+        for screen_name in screen_names:
+            error = None
+            twitter_id = user_ids.get(screen_name.lower())
+            # Error if the account is not exist
+            if twitter_id is None:
+                error = f"存在しないアカウントです．アカウント名: {screen_name}"
+            # Error if the account is not registered
+            elif twitter_id not in registered:
+                error = f"登録されていないアカウントです．アカウント名: {screen_name}"
+            else:
+                registered.remove(twitter_id)
+                keys.append((channel_id, twitter_id))
+            results.append([screen_name, error])
+
+        # Update database in one transaction
+        try:
+            self.monitor_db.delete_many(keys)
+        except TCBotError as exc:
+            logger.exception("Catch Exception")
+            for result in results:
+                result[1] = result[1] or str(exc)
+            return [tuple(result) for result in results]
 
-        # Rerun stream
-        self._resume_stream()
+        # Update monitors and reconnect streams only if the follow list is changed
+        for cid, tid in keys:
+            self.streams.remove(cid, tid)
 
-        return screen_name
+        return [tuple(result) for result in results]
 
     def _list(self, channel_id: int) -> List[Tuple[str, str]]:
         monitor_users = []
 
         monitors = self.monitor_db.select(channel_id=channel_id)
+        try:
+            screen_names = self.tw_auth.lookup_screen_names(
+                [m["twitter_id"] for m in monitors]
+            )
+        except tweepy.TweepError as exc:
+            raise TCBotError("アカウント名の取得に失敗しました．") from exc
+
         for m in monitors:
             twitter_id = m["twitter_id"]
             match_ptn = m["match_ptn"]
-            twitter_name = self.tw_auth.api.get_user(id=twitter_id).screen_name
+            # Show id if the account is suspended or not resolved by rate limit
+            twitter_name = screen_names.get(twitter_id, f"id:{twitter_id}")
             monitor_users.append((twitter_name, match_ptn))
 
         return monitor_users
 
+    def _stats(self) -> str:
+        delivery = self.delivery
+        match_count = MATCH_SECONDS.count()
+        send_count = DISCORD_SEND_SECONDS.count()
+        command_count = sum(COMMAND_SECONDS.count(command=c) for c in COMMANDS)
+        command_sum = sum(COMMAND_SECONDS.sum(command=c) for c in COMMANDS)
+        reconnects = self.streams.reconnect_stats()
+
+        text = "統計情報:"
+        text += (
+            f"\r・受信ツイート: {TWEETS_RECEIVED.get():.0f}"
+            f"（監視対象外: {TWEETS_UNMONITORED.get():.0f}, マッチ: {TWEETS_MATCHED.get():.0f}）"
+        )
+        text += (
+            f"\r・配信: 成功: {delivery.delivered}, 失敗: {delivery.failed}, "
+            f"破棄: {delivery.dropped}, 重複: {delivery.duplicates}, "
+            f"隔離: {delivery.quarantined}, キュー: {delivery.depth}"
+        )
+        text += f"\r・マッチ時間: 平均: {MATCH_SECONDS.sum() / max(match_count, 1) * 1e3:.3f}ms"
+        text += (
+            f"\r・Discord送信時間: 平均: "
+            f"{DISCORD_SEND_SECONDS.sum() / max(send_count, 1) * 1e3:.1f}ms, "
+            f"99%: {DISCORD_SEND_SECONDS.quantile(0.99) * 1e3:.0f}ms以下, "
+            f"429: {DISCORD_RATE_LIMITED.get():.0f}"
+        )
+        text += f"\r・コマンド時間: 平均: {command_sum / max(command_count, 1) * 1e3:.1f}ms"
+        text += (
+            f"\r・再接続: {reconnects['reconnects']}回, "
+            f"最大停止時間: {reconnects['max_duration']:.1f}秒"
+        )
+        for h in self.streams.health():
+            text += (
+                f"\r・ストリーム{h['shard']}: 監視数: {h['follows']}, "
+                f"接続: {'○' if h['running'] else '×'}, 受信: {h['statuses']}"
+            )
+        for ptn, stats in self._slow_patterns():
+            text += (
+                f"\r・正規表現: {repr(ptn)} (id: {pattern_id(ptn)}), "
+                f"合計: {stats.seconds * 1e3:.1f}ms, "
+                f"最大: {stats.max_seconds * 1e3:.3f}ms"
+            )
+        return text
+
+    async def profile(
+        self, seconds: float = DEFAULT_PROFILE_SECONDS, format: str = FORMAT_COLLAPSED
+    ) -> str:
+        # Return the path of the written profile
+        if self.profiler.running:
+            raise TCBotError("プロファイルは実行中です．")
+
+        await self.profiler.run(seconds)
+        file_name = f"tcbot-{time.strftime('%Y%m%d-%H%M%S')}.{format}"
+        path = os.path.join(self.profile_dir, file_name)
+        await self._run_blocking(self.profiler.write, path, format)
+        logger.warning(
+            f"Wrote profile. file_name: {path}, samples: {self.profiler.sample_count}, "
+            f"slow callbacks: {len(self.profiler.slow_callbacks)}"
+        )
+        return path
+
+    def start_profile(self):
+        # Called by the signal handler
+        if self.profiler.running:
+            logger.warning("Profiler is already running.")
+            return
+        self.loop.create_task(self._profile_by_signal())
+
+    async def _profile_by_signal(self):
+        try:
+            await self.profile()
+        except TCBotError as exc:
+            logger.exception("Catch Exception")
+            logger.error(str(exc))
+
+    async def _profile_command(self, channel_id: int, seconds: int, format: str):
+        try:
+            path = await self.profile(seconds, format)
+        except TCBotError as exc:
+            logger.exception("Catch Exception")
+            logger.error(str(exc))
+            await self.send_error(channel_id, str(exc))
+        else:
+            await self.send_info(
+                channel_id,
+                f"プロファイルを出力しました．ファイル: {path}, "
+                f"サンプル数: {self.profiler.sample_count}, "
+                f"遅いコールバック: {len(self.profiler.slow_callbacks)}",
+            )
+
     async def close(self):
         if not self.is_ready():
             raise Exception("Called close() before client is ready.")
 
-        if self.stream:
-            self.stream.disconnect()
-            self.stream = None
+        if self.streams is not None:
+            self.streams.disconnect()
+            await self.backfill.close()
+
+        self.executor.shutdown(wait=False)
+
+        try:
+            await asyncio.wait_for(self.delivery.join(), DELIVERY_CLOSE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(f"Closed with {self.delivery.depth} undelivered tweets.")
+        await self.delivery.save_dedup()
+        await self.delivery.close_journal()
+        self.tracer.close()
+        dedup = self.delivery.dedup
+        logger.info(
+            f"Skipped {dedup.hits} duplicated tweets. hit rate: {dedup.hit_rate:.3f}"
+        )
+
+        await self.profiler.stop()
 
         await super().close()
 
@@ -145,8 +597,63 @@ class BotClient(discord.Client):
     async def send_error(self, channel_id: int, msg: str):
         await self._send_message(channel_id, f"[ERROR] {msg}")
 
+    async def abort(self):
+        # Close without waiting for the ready, e.g. the database is not connected
+        self.startup_failed = True
+        if self.streams is not None:
+            self.streams.disconnect()
+            await self.backfill.close()
+        self.executor.shutdown(wait=False)
+        await self.delivery.close_journal()
+        self.tracer.close()
+        await self.profiler.stop()
+        await super().close()
+
+    async def on_connect(self):
+        self.startup.mark("discord_connected")
+
     async def on_ready(self):
-        self._resume_stream()
+        self.startup.mark("discord_ready")
+        # Objects of channels are rebuilt when the gateway identifies again
+        self.channels.invalidate()
+        self.delivery.start()
+
+        # on_ready is called again on gateway reconnection but the stream is kept
+        if not self._stream_started:
+            self._stream_started = True
+            # Database and Twitter may still be connecting
+            await self._attached.wait()
+            await self.backfill.start()
+            await self._resume_stream()
+            self.startup.mark("streams_started")
+            if not self.startup.reported:
+                self.startup.reported = True
+                logger.warning(self.startup.report())
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.channels.quarantine(channel.id)
+
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        # Permissions may be given back, so the channel is tried again
+        self.channels.release(after.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        for channel in guild.channels:
+            self.channels.quarantine(channel.id)
+
+    async def on_guild_join(self, guild: discord.Guild):
+        for channel in guild.channels:
+            self.channels.release(channel.id)
+
+    async def on_guild_available(self, guild: discord.Guild):
+        for channel in guild.channels:
+            self.channels.release(channel.id)
+
+    async def on_guild_unavailable(self, guild: discord.Guild):
+        # Outage of Discord, channels are resolved again after it
+        self.channels.invalidate(channel.id for channel in guild.channels)
 
     async def on_message(self, msg: discord.Message):
         if msg.author == self.user:
@@ -169,34 +676,82 @@ class BotClient(discord.Client):
         if maincmd != MAIN_CMD:
             return
 
+        # Commands show the channel is alive again
+        self.channels.release(channel_id)
+
+        # Commands need the database and Twitter
+        await self._attached.wait()
+
+        # Commands in a channel are run one by one to keep monitors consistent
+        start = time.perf_counter()
+        try:
+            async with self._channel_lock(channel_id):
+                await self._run_command(channel_id, subcmd, cmdlist[2:])
+        finally:
+            command = subcmd if subcmd in COMMANDS else "invalid"
+            COMMAND_SECONDS.observe(time.perf_counter() - start, command=command)
+
+    async def _run_command(self, channel_id: int, subcmd: str, args: List[str]):
         # Receive ADD_CMD
         if subcmd == ADD_CMD:
             try:
-                twitter_name, match_ptn = self._add(channel_id, cmdlist[2:])
+                results = await self._run_blocking(self._add, channel_id, args)
             except TCBotError as exc:
                 logger.exception("Catch Exception")
                 logger.error(str(exc))
                 await self.send_error(channel_id, str(exc))
             else:
-                await self.send_info(
-                    channel_id,
-                    f"アカウントの登録に成功しました．アカウント名: {twitter_name}, 正規表現: {repr(match_ptn)}",
-                )
+                if len(results) == 1:
+                    twitter_name, match_ptn, error = results[0]
+                    if error:
+                        logger.error(error)
+                        await self.send_error(channel_id, error)
+                    else:
+                        await self.send_info(
+                            channel_id,
+                            f"アカウントの登録に成功しました．アカウント名: {twitter_name}, 正規表現: {repr(match_ptn)}",
+                        )
+                else:
+                    text = f"アカウントの登録結果:"
+                    for twitter_name, match_ptn, error in results:
+                        if error:
+                            logger.error(error)
+                            text += f"\r・失敗: {error}"
+                        else:
+                            text += f"\r・成功: アカウント名: {twitter_name}, 正規表現: {repr(match_ptn)}"
+                    await self.send_info(channel_id, text)
         # Receive REMOVE_CMD
         elif subcmd == REMOVE_CMD:
             try:
-                twitter_name = self._remove(channel_id, cmdlist[2:])
+                results = await self._run_blocking(self._remove, channel_id, args)
             except TCBotError as exc:
                 logger.exception("Catch Exception")
                 logger.error(str(exc))
                 await self.send_error(channel_id, str(exc))
             else:
-                text = f"アカウントの削除に成功しました．アカウント名: {twitter_name}"
-                await self.send_info(channel_id, text)
+                if len(results) == 1:
+                    twitter_name, error = results[0]
+                    if error:
+                        logger.error(error)
+                        await self.send_error(channel_id, error)
+                    else:
+                        text = f"アカウントの削除に成功しました．アカウント名: {twitter_name}"
+                        await self.send_info(channel_id, text)
+                else:
+                    text = f"アカウントの削除結果:"
+                    for twitter_name, error in results:
+                        if error:
+                            logger.error(error)
+                            text += f"\r・失敗: {error}"
+                        else:
+                            text += f"\r・成功: アカウント名: {twitter_name}"
+                    await self.send_info(channel_id, text)
         # Receive LIST_CMD
         elif subcmd == LIST_CMD:
             try:
-                monitor_users: List[Tuple[str, str]] = self._list(channel_id)
+                monitor_users: List[Tuple[str, str]] = await self._run_blocking(
+                    self._list, channel_id
+                )
             except TCBotError as exc:
                 logger.exception("Catch Exception")
                 logger.error(str(exc))
@@ -210,6 +765,31 @@ class BotClient(discord.Client):
                 else:
                     text = f"登録済みのアカウントはありません．"
                     await self.send_info(channel_id, text)
+        # Receive STATS_CMD
+        elif subcmd == STATS_CMD:
+            await self.send_info(channel_id, self._stats())
+        # Receive PROFILE_CMD
+        elif subcmd == PROFILE_CMD:
+            seconds = args[0] if len(args) > 0 else str(DEFAULT_PROFILE_SECONDS)
+            format = args[1] if len(args) > 1 else FORMAT_COLLAPSED
+            if not seconds.isdigit() or not 0 < int(seconds) <= MAX_PROFILE_SECONDS:
+                text = f"秒数が不正です．1から{MAX_PROFILE_SECONDS}の整数を指定してください．"
+                logger.error(text)
+                await self.send_error(channel_id, text)
+            elif format not in FORMATS:
+                text = f"出力形式が不正です．形式: {', '.join(FORMATS)}"
+                logger.error(text)
+                await self.send_error(channel_id, text)
+            elif self.profiler.running:
+                text = "プロファイルは実行中です．"
+                logger.error(text)
+                await self.send_error(channel_id, text)
+            else:
+                # Other commands of the channel are not blocked while profiling
+                self.loop.create_task(
+                    self._profile_command(channel_id, int(seconds), format)
+                )
+                await self.send_info(channel_id, f"プロファイルを開始しました．{seconds}秒後に結果を出力します．")
         # Receive HELP_CMD
         elif subcmd == HELP_CMD:
             text = (
@@ -217,8 +797,13 @@ class BotClient(discord.Client):
                 + f"\r・{MAIN_CMD} {ADD_CMD} <アカウント名> [<正規表現パターン>]: 収集対象のアカウントを登録"
                 + f"\r　例: {MAIN_CMD} {ADD_CMD} moujaatumare %s" % repr(r"mildom\.com")
                 + f"\r　動作: 'mildom.com'を含むなるおのツイートのみ抽出（短縮リンクは展開）"
-                + f"\r・{MAIN_CMD} {REMOVE_CMD} <アカウント名>: 登録済みのアカウントを削除"
+                + f"\r　複数のアカウントは'{ACCOUNT_SEPARATOR}'で区切って一度に登録可能"
+                + f"\r　例: {MAIN_CMD} {ADD_CMD} moujaatumare {ACCOUNT_SEPARATOR} TwitterJP %s"
+                % repr(r"mildom\.com")
+                + f"\r・{MAIN_CMD} {REMOVE_CMD} <アカウント名> [<アカウント名> ...]: 登録済みのアカウントを削除"
                 + f"\r・{MAIN_CMD} {LIST_CMD}: 登録済みのアカウントの一覧表示"
+                + f"\r・{MAIN_CMD} {STATS_CMD}: 統計情報を表示"
+                + f"\r・{MAIN_CMD} {PROFILE_CMD} [<秒数>] [{'|'.join(FORMATS)}]: 処理時間のプロファイルを出力"
                 + f"\r・{MAIN_CMD} {HELP_CMD}: コマンド仕様を表示"
             )
             await self.send_info(channel_id, text)
@@ -0,0 +1,66 @@
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from .logger import logger
+
+
+class ChannelCache:
+    def __init__(
+        self,
+        get_channel: Callable[[int], Any],
+        on_quarantined: Optional[Callable[[int], None]] = None,
+        on_released: Optional[Callable[[int], None]] = None,
+    ):
+        # get_channel of discord.Client searches every guild on each call
+        self._get_channel = get_channel
+        self._on_quarantined = on_quarantined
+        self._on_released = on_released
+
+        self._channels: Dict[int, Any] = {}
+        # Channels deleted or not accessible, read from the stream thread
+        self.quarantined: Set[int] = set()
+
+    def resolve(self, channel_id: int) -> Optional[Any]:
+        # Called on the event loop
+        if channel_id in self.quarantined:
+            return None
+
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._get_channel(channel_id)
+            if channel is None:
+                self.quarantine(channel_id)
+                return None
+            self._channels[channel_id] = channel
+        return channel
+
+    def is_quarantined(self, channel_id: int) -> bool:
+        return channel_id in self.quarantined
+
+    def quarantine(self, channel_id: int):
+        self._channels.pop(channel_id, None)
+        if channel_id in self.quarantined:
+            return
+
+        self.quarantined.add(channel_id)
+        logger.error(f"Quarantined channel. channel_id: {channel_id}")
+        if self._on_quarantined:
+            self._on_quarantined(channel_id)
+
+    def release(self, channel_id: int):
+        # The channel is resolved again on the next message
+        self._channels.pop(channel_id, None)
+        if channel_id not in self.quarantined:
+            return
+
+        self.quarantined.discard(channel_id)
+        logger.info(f"Released channel from quarantine. channel_id: {channel_id}")
+        if self._on_released:
+            self._on_released(channel_id)
+
+    def invalidate(self, channel_ids: Iterable[int] = None):
+        # Objects of channels are rebuilt when the gateway connects again
+        if channel_ids is None:
+            self._channels.clear()
+            return
+        for channel_id in channel_ids:
+            self._channels.pop(channel_id, None)
@@ -2,6 +2,18 @@ import os
 import json
 
 from .exception import TCBotError
+from .delivery import (
+    BACKPRESSURES,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    DEFAULT_COALESCE_SECONDS,
+    BACKPRESSURE_BLOCK,
+)
+from .dedup import DEFAULT_DEDUP_SIZE
+from .normalize import URL_FIELDS, URL_FIELD_EXPANDED
+from .patterns import ENGINES, ENGINE_RE, ENGINE_RE2, re2_available
+
+CREDENTIAL_KEYS = ("consumer_key", "consumer_secret", "access_token", "access_secret")
 
 
 class Config:
@@ -11,6 +23,88 @@ class Config:
         else:
             self._construct_from_file(file_name)
 
+        self._check_optional_params()
+
+    def _check_optional_params(self):
+        for name in ("delivery_queue_size", "delivery_workers", "dedup_size"):
+            value = getattr(self, name)
+            if type(value) is not int or value <= 0:
+                raise TCBotError(f"{name} must be a positive integer. {name}: {value}")
+
+        value = self.delivery_coalesce_seconds
+        if type(value) not in (int, float) or value < 0:
+            raise TCBotError(
+                f"delivery_coalesce_seconds must be a non-negative number. "
+                f"delivery_coalesce_seconds: {value}"
+            )
+
+        # Each credential of stream must have all keys
+        if type(self.stream_credentials) is not list:
+            raise TCBotError("stream_credentials must be a list.")
+        for cred in self.stream_credentials:
+            if type(cred) is not dict or set(cred.keys()) != set(CREDENTIAL_KEYS):
+                raise TCBotError(
+                    "stream_credentials must consist of %s."
+                    % ", ".join(CREDENTIAL_KEYS)
+                )
+
+        value = self.metrics_port
+        if value is not None and (type(value) is not int or not 0 <= value <= 65535):
+            raise TCBotError(
+                f"metrics_port must be a port number. metrics_port: {value}"
+            )
+
+        value = self.trace_sample_rate
+        if type(value) not in (int, float) or not 0 <= value <= 1:
+            raise TCBotError(
+                f"trace_sample_rate must be between 0 and 1. trace_sample_rate: {value}"
+            )
+
+        if self.trace_path is not None and type(self.trace_path) is not str:
+            raise TCBotError(
+                f"trace_path must be a string. trace_path: {self.trace_path}"
+            )
+
+        if self.profile_dir is not None and type(self.profile_dir) is not str:
+            raise TCBotError(
+                f"profile_dir must be a string. profile_dir: {self.profile_dir}"
+            )
+
+        if self.dedup_path is not None and type(self.dedup_path) is not str:
+            raise TCBotError(
+                f"dedup_path must be a string. dedup_path: {self.dedup_path}"
+            )
+
+        if self.journal_path is not None and type(self.journal_path) is not str:
+            raise TCBotError(
+                f"journal_path must be a string. journal_path: {self.journal_path}"
+            )
+
+        if self.snapshot_path is not None and type(self.snapshot_path) is not str:
+            raise TCBotError(
+                f"snapshot_path must be a string. snapshot_path: {self.snapshot_path}"
+            )
+
+        if self.url_field not in URL_FIELDS:
+            raise TCBotError(
+                "url_field must be one of %s. url_field: %s"
+                % (", ".join(URL_FIELDS), self.url_field)
+            )
+
+        if self.regex_engine not in ENGINES:
+            raise TCBotError(
+                "regex_engine must be one of %s. regex_engine: %s"
+                % (", ".join(ENGINES), self.regex_engine)
+            )
+        if self.regex_engine == ENGINE_RE2 and not re2_available():
+            raise TCBotError("regex_engine is re2 but google-re2 is not installed.")
+
+        if self.delivery_backpressure not in BACKPRESSURES:
+            raise TCBotError(
+                "delivery_backpressure must be one of %s. delivery_backpressure: %s"
+                % (", ".join(BACKPRESSURES), self.delivery_backpressure)
+            )
+
     def _construct_from_env(self):
         # raise TCBotError("Not implemented")
 
@@ -21,6 +115,21 @@ class Config:
         ACCESS_SECRET_ENV = "ACCESS_SECRET"
         DB_URL_ENV = "DB_URL"
         DB_TABLE_ENV = "DB_TABLE"
+        DELIVERY_QUEUE_SIZE_ENV = "DELIVERY_QUEUE_SIZE"
+        DELIVERY_WORKERS_ENV = "DELIVERY_WORKERS"
+        DELIVERY_BACKPRESSURE_ENV = "DELIVERY_BACKPRESSURE"
+        DELIVERY_COALESCE_SECONDS_ENV = "DELIVERY_COALESCE_SECONDS"
+        STREAM_CREDENTIALS_ENV = "STREAM_CREDENTIALS"
+        DEDUP_SIZE_ENV = "DEDUP_SIZE"
+        DEDUP_PATH_ENV = "DEDUP_PATH"
+        SNAPSHOT_PATH_ENV = "SNAPSHOT_PATH"
+        JOURNAL_PATH_ENV = "JOURNAL_PATH"
+        METRICS_PORT_ENV = "METRICS_PORT"
+        TRACE_PATH_ENV = "TRACE_PATH"
+        TRACE_SAMPLE_RATE_ENV = "TRACE_SAMPLE_RATE"
+        PROFILE_DIR_ENV = "PROFILE_DIR"
+        URL_FIELD_ENV = "URL_FIELD"
+        REGEX_ENGINE_ENV = "REGEX_ENGINE"
 
         EXPECTED_ENVS = (
             BOT_TOKEN_ENV,
@@ -48,6 +157,40 @@ class Config:
         self.db_url = envs[DB_URL_ENV]
         self.db_table = envs[DB_TABLE_ENV]
 
+        # Optional envs
+        try:
+            self.delivery_queue_size = int(
+                os.getenv(DELIVERY_QUEUE_SIZE_ENV, DEFAULT_QUEUE_SIZE)
+            )
+            self.delivery_workers = int(
+                os.getenv(DELIVERY_WORKERS_ENV, DEFAULT_WORKERS)
+            )
+            self.delivery_coalesce_seconds = float(
+                os.getenv(DELIVERY_COALESCE_SECONDS_ENV, DEFAULT_COALESCE_SECONDS)
+            )
+            self.dedup_size = int(os.getenv(DEDUP_SIZE_ENV, DEFAULT_DEDUP_SIZE))
+            metrics_port = os.getenv(METRICS_PORT_ENV)
+            self.metrics_port = None if metrics_port is None else int(metrics_port)
+            self.trace_sample_rate = float(os.getenv(TRACE_SAMPLE_RATE_ENV, 0.0))
+        except ValueError as exc:
+            raise TCBotError("Numeric environment has invalid value.") from exc
+        try:
+            self.stream_credentials = json.loads(
+                os.getenv(STREAM_CREDENTIALS_ENV, "[]")
+            )
+        except json.JSONDecodeError as exc:
+            raise TCBotError(f"Failed to parse {STREAM_CREDENTIALS_ENV}.") from exc
+        self.delivery_backpressure = os.getenv(
+            DELIVERY_BACKPRESSURE_ENV, BACKPRESSURE_BLOCK
+        )
+        self.dedup_path = os.getenv(DEDUP_PATH_ENV)
+        self.snapshot_path = os.getenv(SNAPSHOT_PATH_ENV)
+        self.journal_path = os.getenv(JOURNAL_PATH_ENV)
+        self.trace_path = os.getenv(TRACE_PATH_ENV)
+        self.profile_dir = os.getenv(PROFILE_DIR_ENV)
+        self.url_field = os.getenv(URL_FIELD_ENV, URL_FIELD_EXPANDED)
+        self.regex_engine = os.getenv(REGEX_ENGINE_ENV, ENGINE_RE)
+
     def _construct_from_file(self, file_name):
         conf_dic = {}
         try:
@@ -65,6 +208,39 @@ class Config:
         ACCESS_SECRET_PARAM = "access_secret"
         DB_URL_PARAM = "db_url"
         DB_TABLE_PARAM = "db_table"
+        DELIVERY_QUEUE_SIZE_PARAM = "delivery_queue_size"
+        DELIVERY_WORKERS_PARAM = "delivery_workers"
+        DELIVERY_BACKPRESSURE_PARAM = "delivery_backpressure"
+        DELIVERY_COALESCE_SECONDS_PARAM = "delivery_coalesce_seconds"
+        STREAM_CREDENTIALS_PARAM = "stream_credentials"
+        DEDUP_SIZE_PARAM = "dedup_size"
+        DEDUP_PATH_PARAM = "dedup_path"
+        SNAPSHOT_PATH_PARAM = "snapshot_path"
+        JOURNAL_PATH_PARAM = "journal_path"
+        METRICS_PORT_PARAM = "metrics_port"
+        TRACE_PATH_PARAM = "trace_path"
+        TRACE_SAMPLE_RATE_PARAM = "trace_sample_rate"
+        PROFILE_DIR_PARAM = "profile_dir"
+        URL_FIELD_PARAM = "url_field"
+        REGEX_ENGINE_PARAM = "regex_engine"
+
+        OPTIONAL_PARAMS = (
+            DELIVERY_QUEUE_SIZE_PARAM,
+            DELIVERY_WORKERS_PARAM,
+            DELIVERY_BACKPRESSURE_PARAM,
+            DELIVERY_COALESCE_SECONDS_PARAM,
+            STREAM_CREDENTIALS_PARAM,
+            DEDUP_SIZE_PARAM,
+            DEDUP_PATH_PARAM,
+            SNAPSHOT_PATH_PARAM,
+            JOURNAL_PATH_PARAM,
+            METRICS_PORT_PARAM,
+            TRACE_PATH_PARAM,
+            TRACE_SAMPLE_RATE_PARAM,
+            PROFILE_DIR_PARAM,
+            URL_FIELD_PARAM,
+            REGEX_ENGINE_PARAM,
+        )
 
         EXPECTED_PARAMS = (
             BOT_TOKEN_PARAM,
@@ -83,7 +259,7 @@ class Config:
 
         # Check invalid parameter exist
         for key in conf_dic.keys():
-            if key not in EXPECTED_PARAMS:
+            if key not in EXPECTED_PARAMS and key not in OPTIONAL_PARAMS:
                 raise TCBotError(f"Invalid parameter is included. param: {key}")
 
         self.bot_token = conf_dic[BOT_TOKEN_PARAM]
@@ -93,3 +269,24 @@ class Config:
         self.access_secret = conf_dic[ACCESS_SECRET_PARAM]
         self.db_url = conf_dic[DB_URL_PARAM]
         self.db_table = conf_dic[DB_TABLE_PARAM]
+        self.delivery_queue_size = conf_dic.get(
+            DELIVERY_QUEUE_SIZE_PARAM, DEFAULT_QUEUE_SIZE
+        )
+        self.delivery_workers = conf_dic.get(DELIVERY_WORKERS_PARAM, DEFAULT_WORKERS)
+        self.delivery_backpressure = conf_dic.get(
+            DELIVERY_BACKPRESSURE_PARAM, BACKPRESSURE_BLOCK
+        )
+        self.delivery_coalesce_seconds = conf_dic.get(
+            DELIVERY_COALESCE_SECONDS_PARAM, DEFAULT_COALESCE_SECONDS
+        )
+        self.stream_credentials = conf_dic.get(STREAM_CREDENTIALS_PARAM, [])
+        self.dedup_size = conf_dic.get(DEDUP_SIZE_PARAM, DEFAULT_DEDUP_SIZE)
+        self.dedup_path = conf_dic.get(DEDUP_PATH_PARAM)
+        self.snapshot_path = conf_dic.get(SNAPSHOT_PATH_PARAM)
+        self.journal_path = conf_dic.get(JOURNAL_PATH_PARAM)
+        self.metrics_port = conf_dic.get(METRICS_PORT_PARAM)
+        self.trace_path = conf_dic.get(TRACE_PATH_PARAM)
+        self.trace_sample_rate = conf_dic.get(TRACE_SAMPLE_RATE_PARAM, 0.0)
+        self.profile_dir = conf_dic.get(PROFILE_DIR_PARAM)
+        self.url_field = conf_dic.get(URL_FIELD_PARAM, URL_FIELD_EXPANDED)
+        self.regex_engine = conf_dic.get(REGEX_ENGINE_PARAM, ENGINE_RE)
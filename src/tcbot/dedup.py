@@ -0,0 +1,94 @@
+import collections
+import os
+import threading
+from typing import Optional, Tuple
+
+from .logger import logger
+from .exception import TCBotError
+
+DEFAULT_DEDUP_SIZE = 50000
+
+
+class DedupCache:
+    def __init__(self, maxsize: int = DEFAULT_DEDUP_SIZE, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.path = path
+
+        self.hits = 0
+        self.misses = 0
+
+        # Ordered from least recently seen
+        self._keys: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is not None:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self._keys
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def check(self, channel_id: int, status_id: int) -> bool:
+        # Return True if the status is already delivered to the channel
+        key = (channel_id, status_id)
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+
+            self._keys[key] = None
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            self.misses += 1
+            return False
+
+    def discard(self, channel_id: int, status_id: int):
+        # Status not delivered is allowed to come again
+        with self._lock:
+            self._keys.pop((channel_id, status_id), None)
+
+    def load(self):
+        # Missing file means the first run
+        try:
+            with open(self.path) as f:
+                lines = f.read().split()
+        except FileNotFoundError:
+            return
+        except OSError as exc:
+            raise TCBotError(f"Failed to open file. file_name: {self.path}") from exc
+
+        with self._lock:
+            for line in lines[-self.maxsize :]:
+                try:
+                    channel_id, status_id = map(int, line.split(","))
+                except ValueError:
+                    logger.error(f"Invalid dedup entry is ignored. entry: {line}")
+                    continue
+                self._keys[(channel_id, status_id)] = None
+                self._keys.move_to_end((channel_id, status_id))
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            lines = [f"{cid},{sid}\n" for cid, sid in self._keys]
+
+        # Replace at once not to leave a broken file
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            raise TCBotError(f"Failed to save file. file_name: {self.path}") from exc
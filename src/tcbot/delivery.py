@@ -0,0 +1,350 @@
+import asyncio
+import collections
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .logger import logger
+from .exception import TCBotError
+from .dedup import DedupCache
+from .channels import ChannelCache
+from .journal import DeliveryJournal
+from .trace import Tracer
+from .metrics import DISCORD_SEND_ERRORS, DISCORD_SEND_SECONDS
+
+# Wait until the queue has room
+BACKPRESSURE_BLOCK = "block"
+# Discard the message being submitted
+BACKPRESSURE_DROP_NEWEST = "drop_newest"
+# Discard the oldest message not yet sent
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"
+BACKPRESSURES = (
+    BACKPRESSURE_BLOCK,
+    BACKPRESSURE_DROP_NEWEST,
+    BACKPRESSURE_DROP_OLDEST,
+)
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_WORKERS = 8
+DEFAULT_BLOCK_TIMEOUT_SECONDS = 10
+DEFAULT_COALESCE_SECONDS = 0.5
+
+# Limit of message length on Discord
+MAX_MESSAGE_LENGTH = 2000
+MESSAGE_SEPARATOR = "\n"
+
+# Status code of Discord when rate limited
+RATE_LIMITED_STATUS = 429
+# Status codes of Discord when the channel is deleted or not accessible
+FORBIDDEN_STATUS = 403
+NOT_FOUND_STATUS = 404
+
+# Interval to save delivered statuses to survive restart
+DEDUP_SAVE_SECONDS = 60
+
+# Entry of lanes, (sequence, message, status id, sequence of journal)
+_Entry = Tuple[int, str, Optional[int], Optional[int]]
+
+
+class DeliveryQueue:
+    def __init__(
+        self,
+        client,
+        loop,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        backpressure: str = BACKPRESSURE_BLOCK,
+        block_timeout: float = DEFAULT_BLOCK_TIMEOUT_SECONDS,
+        coalesce_seconds: float = DEFAULT_COALESCE_SECONDS,
+        dedup: Optional[DedupCache] = None,
+        tracer: Optional[Tracer] = None,
+        channels: Optional[ChannelCache] = None,
+        journal: Optional[DeliveryJournal] = None,
+    ):
+        if backpressure not in BACKPRESSURES:
+            raise TCBotError(f"Invalid backpressure. backpressure: {backpressure}")
+
+        self.client = client
+        self.loop = loop
+        self.maxsize = maxsize
+        self.workers = workers
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.coalesce_seconds = coalesce_seconds
+        self.dedup = dedup
+        self.tracer = tracer or Tracer()
+        self.channels = channels or ChannelCache(client.get_channel)
+        # Messages are journaled until sent to be replayed after restart
+        self.journal = journal
+
+        self.delivered = 0
+        self.sent_messages = 0
+        self.failed = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.quarantined = 0
+        self.replayed = 0
+
+        # Slots are taken on the stream thread and given back on the event loop
+        self._slots = threading.Semaphore(maxsize)
+        self._depth = 0
+        self._depth_lock = threading.Lock()
+        # Set on the event loop when all messages accepted are sent or dropped
+        self._idle = None
+
+        # Messages are queued per channel to keep order of tweets in a channel
+        self._lanes: Dict[int, Deque[_Entry]] = {}
+        self._lane_tasks: Dict[int, asyncio.Task] = {}
+        self._seq = 0
+        self._send_sem = None
+        self._save_task = None
+        self._is_replayed = False
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def start(self):
+        # Must be called on the event loop
+        if self._send_sem is None:
+            self._send_sem = asyncio.Semaphore(self.workers)
+            self._idle = asyncio.Event()
+        if self.dedup is not None and self.dedup.path and self._save_task is None:
+            self._save_task = self.loop.create_task(self._save_dedup_periodically())
+        if self.journal is not None and not self._is_replayed:
+            self._is_replayed = True
+            self._replay()
+
+    def _replay(self):
+        # Messages not sent by the previous run, which may have been sent just
+        # before the crash, so they are not checked as duplicates
+        entries, self.journal.unacked = self.journal.unacked, []
+        for i, (seq, channel_id, msg, status_id) in enumerate(entries):
+            if not self._slots.acquire(blocking=False):
+                # The rest are kept in the journal for the next start
+                logger.error(
+                    f"Delivery queue is full. Deferred {len(entries) - i} messages."
+                )
+                break
+            self._add_depth(1)
+            self._enqueue(channel_id, msg, status_id, seq)
+            self.replayed += 1
+        if self.replayed:
+            logger.warning(f"Replayed {self.replayed} messages from journal.")
+
+    def _append_journal(
+        self, channel_id: int, msg: str, status_id: Optional[int]
+    ) -> Optional[int]:
+        if self.journal is None:
+            return None
+        return self.journal.append(channel_id, msg, status_id)
+
+    def _ack_journal(self, journal_seqs: List[Optional[int]]):
+        if self.journal is None:
+            return
+        self.journal.ack(seq for seq in journal_seqs if seq is not None)
+
+    def submit(self, channel_id: int, msg: str, status_id: Optional[int] = None):
+        # Called from the stream thread, never waits for sending
+        # Channels gone are skipped without taking a slot
+        if self.channels.is_quarantined(channel_id):
+            self.quarantined += 1
+            self.tracer.sent(status_id, channel_id, ok=False)
+            logger.debug(f"Channel is quarantined. Skipped message: {msg}")
+            return
+
+        # Same status may come from overlapping streams and backfill. The status
+        # is forgotten again if it is dropped or fails to be sent.
+        if status_id is not None and self.dedup is not None:
+            if self.dedup.check(channel_id, status_id):
+                self.duplicates += 1
+                self.tracer.sent(status_id, channel_id, ok=False)
+                logger.debug(f"Duplicated message is skipped. message: {msg}")
+                return
+
+        if self.backpressure == BACKPRESSURE_BLOCK:
+            acquired = self._slots.acquire(timeout=self.block_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+
+        if acquired:
+            self._add_depth(1)
+            journal_seq = self._append_journal(channel_id, msg, status_id)
+            self.loop.call_soon_threadsafe(
+                self._enqueue, channel_id, msg, status_id, journal_seq
+            )
+        elif self.backpressure == BACKPRESSURE_DROP_OLDEST:
+            journal_seq = self._append_journal(channel_id, msg, status_id)
+            self.loop.call_soon_threadsafe(
+                self._replace_oldest, channel_id, msg, status_id, journal_seq
+            )
+        else:
+            self.dropped += 1
+            self.tracer.sent(status_id, channel_id, ok=False)
+            self._forget(channel_id, status_id)
+            logger.error(f"Delivery queue is full. Dropped message: {msg}")
+
+    def _forget(self, channel_id: int, status_id: Optional[int]):
+        if status_id is not None and self.dedup is not None:
+            self.dedup.discard(channel_id, status_id)
+
+    def _add_depth(self, n: int):
+        with self._depth_lock:
+            self._depth += n
+
+    def _release(self):
+        # Called on the event loop
+        self._add_depth(-1)
+        self._slots.release()
+        if self._depth == 0:
+            self._idle.set()
+
+    def _enqueue(
+        self,
+        channel_id: int,
+        msg: str,
+        status_id: Optional[int] = None,
+        journal_seq: Optional[int] = None,
+    ):
+        self._seq += 1
+        if channel_id not in self._lanes:
+            self._lanes[channel_id] = collections.deque()
+        self._lanes[channel_id].append((self._seq, msg, status_id, journal_seq))
+        self.tracer.enqueued(status_id, channel_id)
+
+        if channel_id not in self._lane_tasks:
+            self._lane_tasks[channel_id] = self.loop.create_task(
+                self._drain(channel_id)
+            )
+
+    def _replace_oldest(
+        self,
+        channel_id: int,
+        msg: str,
+        status_id: Optional[int] = None,
+        journal_seq: Optional[int] = None,
+    ):
+        lanes = [(cid, lane) for cid, lane in self._lanes.items() if lane]
+        if not lanes:
+            # All slots are being sent now
+            self.dropped += 1
+            self.tracer.sent(status_id, channel_id, ok=False)
+            self._forget(channel_id, status_id)
+            self._ack_journal([journal_seq])
+            logger.error(f"Delivery queue is full. Dropped message: {msg}")
+            return
+
+        # The new message takes over the slot of the dropped one
+        oldest_cid, oldest = min(lanes, key=lambda item: item[1][0][0])
+        _, dropped_msg, dropped_sid, dropped_seq = oldest.popleft()
+        self.dropped += 1
+        self.tracer.sent(dropped_sid, oldest_cid, ok=False)
+        self._forget(oldest_cid, dropped_sid)
+        self._ack_journal([dropped_seq])
+        logger.error(f"Delivery queue is full. Dropped message: {dropped_msg}")
+        self._enqueue(channel_id, msg, status_id, journal_seq)
+
+    def _pack(self, lane: Deque[_Entry]) -> List[_Entry]:
+        # Take entries from the head of lane as long as they fit in one message
+        entries = [lane.popleft()]
+        length = len(entries[0][1])
+        while lane:
+            next_length = length + len(MESSAGE_SEPARATOR) + len(lane[0][1])
+            if next_length > MAX_MESSAGE_LENGTH:
+                break
+            entries.append(lane.popleft())
+            length = next_length
+        return entries
+
+    async def _drain(self, channel_id: int):
+        lane = self._lanes[channel_id]
+        try:
+            # Wait a burst of tweets to send them in one message
+            if self.coalesce_seconds > 0:
+                await asyncio.sleep(self.coalesce_seconds)
+
+            while lane:
+                entries = self._pack(lane)
+                ok = False
+                try:
+                    async with self._send_sem:
+                        ok = await self._send(channel_id, [e[1] for e in entries])
+                finally:
+                    for _, _, status_id, _ in entries:
+                        self.tracer.sent(status_id, channel_id, ok)
+                        if not ok:
+                            self._forget(channel_id, status_id)
+                        self._release()
+                # Messages failed by errors of Discord are sent again after restart
+                if ok or self.channels.is_quarantined(channel_id):
+                    self._ack_journal([e[3] for e in entries])
+        finally:
+            # Give back slots of messages left by cancellation, which are kept
+            # in the journal
+            for _, _, status_id, _ in lane:
+                self._forget(channel_id, status_id)
+                self._release()
+            del self._lane_tasks[channel_id]
+            del self._lanes[channel_id]
+
+    async def _send(self, channel_id: int, msgs: List[str]) -> bool:
+        # Messages queued before the channel is quarantined fail fast
+        if self.channels.is_quarantined(channel_id):
+            self.quarantined += len(msgs)
+            return False
+
+        channel = self.channels.resolve(channel_id)
+        if channel is None:
+            self.failed += len(msgs)
+            DISCORD_SEND_ERRORS.inc(reason="not_found")
+            logger.error(f"Channel is not found. channel_id: {channel_id}")
+            return False
+
+        start = time.perf_counter()
+        try:
+            await channel.send(MESSAGE_SEPARATOR.join(msgs))
+        except Exception as exc:
+            self.failed += len(msgs)
+            status = getattr(exc, "status", None)
+            if status == RATE_LIMITED_STATUS:
+                DISCORD_SEND_ERRORS.inc(reason="rate_limited")
+            elif status in (FORBIDDEN_STATUS, NOT_FOUND_STATUS):
+                # Deleted channel or lost permission
+                DISCORD_SEND_ERRORS.inc(
+                    reason="forbidden" if status == FORBIDDEN_STATUS else "not_found"
+                )
+                self.channels.quarantine(channel_id)
+            else:
+                DISCORD_SEND_ERRORS.inc(reason="error")
+            logger.exception(f"Failed to send message. channel_id: {channel_id}")
+            return False
+
+        DISCORD_SEND_SECONDS.observe(time.perf_counter() - start)
+        self.delivered += len(msgs)
+        self.sent_messages += 1
+        return True
+
+    async def _save_dedup_periodically(self):
+        while True:
+            await asyncio.sleep(DEDUP_SAVE_SECONDS)
+            await self.save_dedup()
+
+    async def save_dedup(self):
+        if self.dedup is None:
+            return
+        try:
+            await self.loop.run_in_executor(None, self.dedup.save)
+        except TCBotError:
+            logger.exception("Catch Exception")
+
+    async def close_journal(self):
+        if self.journal is None:
+            return
+        await self.loop.run_in_executor(None, self.journal.close)
+
+    async def join(self):
+        # Messages accepted by submit but not yet enqueued on the loop are
+        # counted in depth
+        while self._depth:
+            self._idle.clear()
+            await self._idle.wait()
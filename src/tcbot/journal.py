@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .logger import logger
+from .exception import TCBotError
+
+# Appends and acks made within the interval are written in one transaction
+DEFAULT_COMMIT_SECONDS = 0.05
+# Interval to retry writing after the journal failed to be written
+WRITE_RETRY_SECONDS = 1
+# Interval to truncate the WAL file after acknowledged entries are deleted
+CHECKPOINT_SECONDS = 60
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS deliveries("
+    "seq INTEGER PRIMARY KEY,"
+    "channel_id INTEGER NOT NULL,"
+    "status_id INTEGER,"
+    "message TEXT NOT NULL"
+    ");"
+)
+
+
+class DeliveryJournal:
+    def __init__(self, path: str, commit_seconds: float = DEFAULT_COMMIT_SECONDS):
+        self.path = path
+        self.commit_seconds = commit_seconds
+
+        try:
+            self._conn = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            # Each group commit is synced to survive power loss
+            self._conn.execute("PRAGMA synchronous=FULL;")
+            self._conn.execute(SCHEMA)
+            rows = self._conn.execute(
+                "SELECT seq, channel_id, message, status_id FROM deliveries ORDER BY seq;"
+            ).fetchall()
+        except sqlite3.Error as exc:
+            raise TCBotError(f"Failed to open journal. file_name: {path}") from exc
+
+        # Entries left by the previous run, (seq, channel_id, message, status_id)
+        self.unacked: List[Tuple[int, int, str, Optional[int]]] = rows
+        self._seq = rows[-1][0] if rows else 0
+
+        self.appended = 0
+        self.acked = 0
+        self.commits = 0
+
+        # Operations not written yet, taken by the writer thread at once
+        self._inserts: Dict[int, Tuple] = {}
+        self._deletes: List[int] = []
+        self._lock = threading.Lock()
+        # Set by operations to wake up the writer thread
+        self._wakeup = threading.Event()
+        self._is_closed = False
+        self._thread = threading.Thread(
+            target=self._write_periodically, name="journal_thread", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        # Operations waiting for the next commit
+        return len(self._inserts) + len(self._deletes)
+
+    def append(self, channel_id: int, msg: str, status_id: Optional[int] = None) -> int:
+        # Return the sequence number to acknowledge the entry
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._inserts[seq] = (seq, channel_id, status_id, msg)
+            self.appended += 1
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+        return seq
+
+    def ack(self, seqs: Iterable[int]):
+        # Entries never acknowledged, e.g. of messages failed to be sent, are
+        # not retried in process but replayed by the next start
+        with self._lock:
+            for seq in seqs:
+                # Entries delivered before the commit never reach the disk
+                if self._inserts.pop(seq, None) is None:
+                    self._deletes.append(seq)
+                self.acked += 1
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _write_periodically(self):
+        checkpointed_at = time.monotonic()
+        while True:
+            self._wakeup.wait()
+
+            # Wait for more operations to share the sync of the commit
+            if not self._is_closed:
+                time.sleep(self.commit_seconds)
+            self._wakeup.clear()
+            if not self._write():
+                # Operations are kept and written with the next ones
+                time.sleep(WRITE_RETRY_SECONDS)
+                self._wakeup.set()
+            # Operations after closing are written by close
+            if self._is_closed:
+                return
+
+            if time.monotonic() - checkpointed_at > CHECKPOINT_SECONDS:
+                self._checkpoint()
+                checkpointed_at = time.monotonic()
+
+    def _write(self) -> bool:
+        # Called on the writer thread, or on close after the thread stops.
+        # Return False if the operations failed to be written.
+        with self._lock:
+            inserts, self._inserts = self._inserts, {}
+            deletes, self._deletes = self._deletes, []
+        if not inserts and not deletes:
+            return True
+
+        try:
+            self._conn.execute("BEGIN;")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO deliveries "
+                "(seq, channel_id, status_id, message) VALUES (?, ?, ?, ?);",
+                list(inserts.values()),
+            )
+            self._conn.executemany(
+                "DELETE FROM deliveries WHERE seq BETWEEN ? AND ?;",
+                self._ranges(deletes),
+            )
+            self._conn.execute("COMMIT;")
+        except sqlite3.Error:
+            logger.exception(
+                f"Failed to write journal. inserts: {len(inserts)}, deletes: {len(deletes)}"
+            )
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK;")
+            # Entries acknowledged meanwhile are deleted after they are inserted
+            with self._lock:
+                inserts.update(self._inserts)
+                self._inserts = inserts
+                self._deletes = deletes + self._deletes
+            return False
+        self.commits += 1
+        return True
+
+    @staticmethod
+    def _ranges(seqs: List[int]) -> List[Tuple[int, int]]:
+        # Messages are acknowledged almost in order, so they are deleted by ranges
+        ranges = []
+        for seq in sorted(seqs):
+            if ranges and ranges[-1][1] + 1 >= seq:
+                ranges[-1][1] = seq
+            else:
+                ranges.append([seq, seq])
+        return ranges
+
+    def _checkpoint(self):
+        # Acknowledged entries are removed from the WAL file
+        try:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        except sqlite3.Error:
+            logger.exception("Failed to checkpoint journal.")
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._wakeup.set()
+        self._thread.join()
+
+        if not self._write():
+            logger.error(f"Closed journal with {self.pending} entries not written.")
+        self._checkpoint()
+        self._conn.close()
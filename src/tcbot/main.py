@@ -1,12 +1,64 @@
+import time
+
+# Startup is timed from the start of importing modules
+START = time.perf_counter()
+
 import sys
+import signal
 import argparse
+import asyncio
+import concurrent.futures
+from typing import Dict, List
 
 from .logger import logger
 from .exception import TCBotError
 from .config import Config
-from .monitordb import MonitorDB
-from .twauth import TwitterAuth
-from .botcli import BotClient
+from .metrics import MetricsServer, count_discord_rate_limits
+from .startup import StartupTimer
+
+# Modules importing discord, tweepy and psycopg2 are imported on demand,
+# so that the imports overlap with connecting to the services
+
+
+def _connect_db(config: Config, timer: StartupTimer):
+    with timer.phase("db"):
+        from .monitordb import MonitorDB
+
+        # Listening is started by the bot after its listener is added
+        return MonitorDB(
+            config.db_url, config.db_table, snapshot_path=config.snapshot_path
+        )
+
+
+def _authenticate(cred: Dict[str, str], timer: StartupTimer, name: str):
+    with timer.phase(name):
+        from .twauth import TwitterAuth
+
+        return TwitterAuth(
+            cred["consumer_key"],
+            cred["consumer_secret"],
+            cred["access_token"],
+            cred["access_secret"],
+        )
+
+
+async def _attach(bot_cli, db_future, auth_futures: List):
+    # Run while logging in to Discord
+    try:
+        monitor_db = await asyncio.wrap_future(db_future)
+        auths = [await asyncio.wrap_future(f) for f in auth_futures]
+
+        # Streams use the main credential unless credentials for streams are given
+        bot_cli.attach(monitor_db, auths[0], stream_auths=auths[1:])
+        return
+    except TCBotError as exc:
+        logger.exception("Catch Exception")
+        logger.error(str(exc))
+    except Exception:
+        logger.exception("Failed to start.")
+
+    # Commands and streams waiting for the attachment never run, so the bot exits
+    await bot_cli.abort()
 
 
 def main():
@@ -25,17 +77,73 @@ def main():
         logger.error(str(exc))
         sys.exit(1)
 
-    monitor_db = MonitorDB(config.db_url, config.db_table)
-    tw_auth = TwitterAuth(
-        config.consumer_key,
-        config.consumer_secret,
-        config.access_token,
-        config.access_secret,
+    timer = StartupTimer(START)
+    timer.mark("config")
+
+    # Export metrics only if the port is given
+    if config.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(config.metrics_port)
+        except OSError as exc:
+            logger.exception("Catch Exception")
+            logger.error(f"Failed to listen metrics port. port: {config.metrics_port}")
+            sys.exit(1)
+        metrics_server.start()
+    count_discord_rate_limits()
+
+    # Database and every credential of Twitter are connected at once
+    creds = [
+        {
+            "consumer_key": config.consumer_key,
+            "consumer_secret": config.consumer_secret,
+            "access_token": config.access_token,
+            "access_secret": config.access_secret,
+        }
+    ] + list(config.stream_credentials)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1 + len(creds), thread_name_prefix="startup"
     )
+    db_future = executor.submit(_connect_db, config, timer)
+    auth_futures = [
+        executor.submit(_authenticate, cred, timer, f"twitter{i}" if i else "twitter")
+        for i, cred in enumerate(creds)
+    ]
+    executor.shutdown(wait=False)
+
+    with timer.phase("import"):
+        from .botcli import BotClient
 
     # Run bot
-    bot_cli = BotClient(monitor_db, tw_auth)
+    bot_cli = BotClient(
+        None,
+        None,
+        delivery_queue_size=config.delivery_queue_size,
+        delivery_workers=config.delivery_workers,
+        delivery_backpressure=config.delivery_backpressure,
+        delivery_coalesce_seconds=config.delivery_coalesce_seconds,
+        dedup_size=config.dedup_size,
+        dedup_path=config.dedup_path,
+        journal_path=config.journal_path,
+        trace_path=config.trace_path,
+        trace_sample_rate=config.trace_sample_rate,
+        profile_dir=config.profile_dir,
+        url_field=config.url_field,
+        regex_engine=config.regex_engine,
+        startup=timer,
+    )
+    bot_cli.loop.create_task(_attach(bot_cli, db_future, auth_futures))
+
+    # Profile the running bot by `kill -USR1 <pid>`
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            bot_cli.loop.add_signal_handler(signal.SIGUSR1, bot_cli.start_profile)
+        except NotImplementedError:
+            logger.error("Failed to set signal handler of profiler.")
+
+    # Discord is logged in while the database and Twitter are connected
     bot_cli.run(config.bot_token)
+    if bot_cli.startup_failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
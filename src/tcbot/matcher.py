@@ -0,0 +1,293 @@
+import hashlib
+import re
+import threading
+import time
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+
+from .logger import logger
+from .patterns import ENGINE_RE, compile_pattern
+
+# Patterns referring to groups by number or name can not be merged into one regex
+BACKREF_PTN = re.compile(r"\\[1-9]|\(\?P=")
+
+# Patterns are timed once per the interval of tweets to keep matching fast
+PATTERN_TIMING_INTERVAL = 10
+
+# Matching a tweet longer than this charges the slow patterns with a violation
+PATTERN_BUDGET_SECONDS = 0.05
+# Patterns are disabled after the violations not to stall the stream
+PATTERN_BUDGET_VIOLATIONS = 3
+
+
+def pattern_id(match_ptn: str) -> str:
+    # Stable id of a pattern to be shown instead of the pattern given by users
+    return hashlib.sha1(match_ptn.encode()).hexdigest()[:12]
+
+
+class PatternStats:
+    __slots__ = ("evaluations", "seconds", "max_seconds", "violations", "disabled")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.violations = 0
+        self.disabled = False
+
+
+class _UserMatcher:
+    def __init__(
+        self,
+        monitors: List[Dict[str, Any]],
+        stats: Dict[str, PatternStats] = None,
+        engine: str = ENGINE_RE,
+        on_slow: Optional[Callable[[str], None]] = None,
+    ):
+        self.monitors = monitors
+        if stats is None:
+            stats = {}
+        self._on_slow = on_slow
+
+        # Monitors without pattern are matched with any tweet
+        self.unconditional: List[Dict[str, Any]] = []
+
+        # Group monitors by pattern to compile and evaluate same pattern only once
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for m in monitors:
+            ptn = m["match_ptn"]
+            if not ptn:
+                self.unconditional.append(m)
+                continue
+            if ptn not in groups:
+                groups[ptn] = []
+            groups[ptn].append(m)
+
+        self.patterns: List[Any] = []
+        for ptn, ms in groups.items():
+            # Monitors of disabled patterns are not matched with any tweet
+            if ptn in stats and stats[ptn].disabled:
+                continue
+            try:
+                regex = compile_pattern(ptn, engine)
+            except re.error:
+                logger.error(f"Failed to compile regular expression. pattern: {ptn}")
+                continue
+            if ptn not in stats:
+                stats[ptn] = PatternStats()
+            self.patterns.append((ptn, regex, ms, stats[ptn]))
+
+        self.prefilter = self._build_prefilter(engine)
+        self._calls = 0
+        self._timing_due = False
+
+    def _build_prefilter(self, engine: str) -> Optional[Any]:
+        # Combine all patterns into one alternation to reject unmatched text in one scan
+        if len(self.patterns) < 2:
+            return None
+
+        for ptn, _, _, _ in self.patterns:
+            if BACKREF_PTN.search(ptn):
+                return None
+
+        try:
+            return compile_pattern(
+                "|".join(f"(?:{ptn})" for ptn, _, _, _ in self.patterns), engine
+            )
+        except re.error:
+            # e.g. global flags or duplicated group names
+            return None
+
+    def match(self, text: str) -> List[Dict[str, Any]]:
+        matched = list(self.unconditional)
+        if not self.patterns:
+            return matched
+
+        if self._timing_due:
+            # Prefilter is skipped since it may be the slow part
+            self._timing_due = False
+            return self._match_timed(text, matched)
+
+        start = time.perf_counter()
+        if self.prefilter is not None and not self.prefilter.search(text):
+            self._check_budget(start)
+            return matched
+
+        self._calls += 1
+        if not self._calls % PATTERN_TIMING_INTERVAL:
+            return self._match_timed(text, matched)
+
+        for _, regex, ms, _ in self.patterns:
+            if regex.search(text):
+                matched.extend(ms)
+        self._check_budget(start)
+        return matched
+
+    def _match_timed(
+        self, text: str, matched: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        # Statistics are updated without lock and may lose a few counts
+        for ptn, regex, ms, stats in self.patterns:
+            start = time.perf_counter()
+            found = regex.search(text)
+            elapsed = time.perf_counter() - start
+            stats.evaluations += 1
+            stats.seconds += elapsed
+            if elapsed > stats.max_seconds:
+                stats.max_seconds = elapsed
+
+            if found:
+                matched.extend(ms)
+            if elapsed > PATTERN_BUDGET_SECONDS and self._on_slow:
+                self._on_slow(ptn)
+
+        return matched
+
+    def _check_budget(self, start: float):
+        # Untimed matching over the budget is not run again to find the slow
+        # pattern, which would stall the stream twice
+        if time.perf_counter() - start <= PATTERN_BUDGET_SECONDS:
+            return
+        if len(self.patterns) == 1 and self._on_slow:
+            self._on_slow(self.patterns[0][0])
+        else:
+            # Next tweet is timed pattern by pattern instead
+            self._timing_due = True
+
+
+class MonitorMatcher:
+    def __init__(
+        self,
+        monitors: List[Dict[str, Any]],
+        engine: str = ENGINE_RE,
+        on_disabled: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+    ):
+        # Create a monitor dictonary searched from twitter id
+        user_id_map: Dict[int, List[Dict[str, Any]]] = {}
+        for m in monitors:
+            tid = m["twitter_id"]
+            if tid not in user_id_map:
+                user_id_map[tid] = []
+            user_id_map[tid].append(m)
+
+        self.user_id_map = user_id_map
+        self._lock = threading.Lock()
+        self.engine = engine
+        # Called with the pattern and its monitors when the pattern is disabled
+        self._on_disabled = on_disabled
+
+        # Monitors of channels gone are not matched
+        self.quarantined: Set[int] = set()
+
+        # Time spent by each pattern, shared by users with the same pattern
+        self.pattern_stats: Dict[str, PatternStats] = {}
+        self._matchers: Dict[int, _UserMatcher] = {
+            tid: self._user_matcher(ms) for tid, ms in user_id_map.items()
+        }
+
+    def _user_matcher(self, monitors: List[Dict[str, Any]]) -> _UserMatcher:
+        if self.quarantined:
+            monitors = [m for m in monitors if m["channel_id"] not in self.quarantined]
+        return _UserMatcher(monitors, self.pattern_stats, self.engine, self._on_slow)
+
+    def _rebuild_channel(self, channel_id: int):
+        # Must be called with lock
+        for tid, monitors in self.user_id_map.items():
+            if any(m["channel_id"] == channel_id for m in monitors):
+                self._matchers[tid] = self._user_matcher(monitors)
+
+    def quarantine(self, channel_id: int):
+        with self._lock:
+            if channel_id in self.quarantined:
+                return
+            self.quarantined.add(channel_id)
+            self._rebuild_channel(channel_id)
+
+    def release(self, channel_id: int):
+        with self._lock:
+            if channel_id not in self.quarantined:
+                return
+            self.quarantined.discard(channel_id)
+            self._rebuild_channel(channel_id)
+
+    def _on_slow(self, ptn: str):
+        # Called on the thread matching the tweet
+        with self._lock:
+            stats = self.pattern_stats[ptn]
+            if stats.disabled:
+                return
+            stats.violations += 1
+            logger.warning(
+                f"Pattern exceeded the budget. pattern: {ptn}, "
+                f"violations: {stats.violations}"
+            )
+            if stats.violations < PATTERN_BUDGET_VIOLATIONS:
+                return
+
+            stats.disabled = True
+            disabled = []
+            for tid, monitors in self.user_id_map.items():
+                if any(m["match_ptn"] == ptn for m in monitors):
+                    self._matchers[tid] = self._user_matcher(monitors)
+                    disabled.extend(m for m in monitors if m["match_ptn"] == ptn)
+
+        logger.error(f"Disabled slow pattern. pattern: {ptn}")
+        if self._on_disabled:
+            self._on_disabled(ptn, disabled)
+
+    def disabled_patterns(self) -> List[str]:
+        return [ptn for ptn, stats in self.pattern_stats.items() if stats.disabled]
+
+    def follow_ids(self) -> List[str]:
+        with self._lock:
+            return list(map(str, self.user_id_map.keys()))
+
+    def add(self, monitor: Dict[str, Any]) -> bool:
+        # Return True if the twitter id is newly followed
+        tid = monitor["twitter_id"]
+        with self._lock:
+            is_new = tid not in self.user_id_map
+
+            # Replace lists instead of appending because the stream thread reads them
+            monitors = [
+                m
+                for m in self.user_id_map.get(tid, [])
+                if m["channel_id"] != monitor["channel_id"]
+            ]
+            monitors.append(monitor)
+            self._matchers[tid] = self._user_matcher(monitors)
+            self.user_id_map[tid] = monitors
+
+        return is_new
+
+    def remove(self, channel_id: int, twitter_id: int) -> bool:
+        # Return True if the twitter id is no longer followed
+        with self._lock:
+            if twitter_id not in self.user_id_map:
+                return False
+
+            monitors = [
+                m for m in self.user_id_map[twitter_id] if m["channel_id"] != channel_id
+            ]
+            if monitors:
+                self._matchers[twitter_id] = self._user_matcher(monitors)
+                self.user_id_map[twitter_id] = monitors
+                return False
+
+            del self.user_id_map[twitter_id]
+            del self._matchers[twitter_id]
+            return True
+
+    def __contains__(self, twitter_id: int) -> bool:
+        return twitter_id in self._matchers
+
+    def match(self, twitter_id: int, text: str) -> List[Dict[str, Any]]:
+        matcher = self._matchers.get(twitter_id)
+        if matcher is None:
+            return []
+        return matcher.match(text)
+
+    def slowest_patterns(self, count: int) -> List[Tuple[str, PatternStats]]:
+        # Patterns ordered by total time spent
+        items = list(self.pattern_stats.items())
+        items.sort(key=lambda item: item[1].seconds, reverse=True)
+        return items[:count]
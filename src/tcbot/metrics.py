@@ -0,0 +1,341 @@
+import bisect
+import http.server
+import logging
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .logger import logger
+
+# Buckets in seconds from sub-millisecond matching to slow Discord sends
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+    10,
+)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    items = []
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        items.append(f'{key}="{value}"')
+    return "{" + ",".join(items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        # Most metrics have no labels and are updated for every tweet
+        if not labels and not self.labelnames:
+            return ()
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Invalid labels. metric: {self.name}, labels: {labels}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        # Exported as zero before the first increment
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        # Value is read on export, e.g. depth of a queue
+        self._function = function
+
+    def get(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        if self._function is not None:
+            return [(self.name, {}, self._function())]
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Counts of each bucket, the last one is +Inf
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._counts[()] = [0] * (len(self.buckets) + 1)
+            self._sums[()] = 0.0
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def quantile(self, q: float, **labels) -> float:
+        # Upper bound of the bucket where the quantile falls
+        counts = self._counts.get(self._key(labels))
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [
+                (key, list(counts), self._sums[key])
+                for key, counts in self._counts.items()
+            ]
+
+        samples = []
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        dict(labels, le=_format_value(bound)),
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Collector(_Metric):
+    def __init__(
+        self, name: str, help: str, type: str, function: Callable[[], Iterable]
+    ):
+        # function returns (labels, value) of each sample on export
+        super().__init__(name, help)
+        self.type = type
+        self.function = function
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, labels, value) for labels, value in self.function()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Registering again replaces the metric, e.g. for a new client
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(
+        self, name: str, help: str, type: str, function: Callable[[], Iterable]
+    ) -> Collector:
+        return self.register(Collector(name, help, type, function))
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception:
+                logger.exception(f"Failed to collect metric. metric: {metric.name}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+TWEETS_RECEIVED = registry.counter(
+    "tcbot_tweets_received_total", "Tweets received from streams."
+)
+TWEETS_UNMONITORED = registry.counter(
+    "tcbot_tweets_unmonitored_total",
+    "Tweets dropped because the author is not monitored.",
+)
+TWEETS_MATCHED = registry.counter(
+    "tcbot_tweets_matched_total", "Tweets matched with at least one monitor."
+)
+MATCH_SECONDS = registry.histogram(
+    "tcbot_match_seconds", "Time to match a tweet with monitors of the author."
+)
+DELIVERY_QUEUE_DEPTH = registry.gauge(
+    "tcbot_delivery_queue_depth", "Messages waiting in the delivery queue."
+)
+DISCORD_SEND_SECONDS = registry.histogram(
+    "tcbot_discord_send_seconds", "Time to send a message to Discord."
+)
+DISCORD_SEND_ERRORS = registry.counter(
+    "tcbot_discord_send_errors_total", "Failed sends to Discord.", ("reason",)
+)
+DISCORD_RATE_LIMITED = registry.counter(
+    "tcbot_discord_rate_limited_total", "Responses of 429 from Discord."
+)
+STREAM_RECONNECTS = registry.counter(
+    "tcbot_stream_reconnects_total", "Reconnections of streams.", ("error",)
+)
+STREAM_RECONNECT_SECONDS = registry.histogram(
+    "tcbot_stream_reconnect_seconds",
+    "Time from losing a stream to connecting again.",
+    buckets=(0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+COMMAND_SECONDS = registry.histogram(
+    "tcbot_command_seconds", "Time to run a command.", ("command",)
+)
+
+
+class RateLimitLogHandler(logging.Handler):
+    # discord.py retries 429 by itself and only logs it
+    def emit(self, record: logging.LogRecord):
+        if str(record.msg).startswith("We are being rate limited"):
+            DISCORD_RATE_LIMITED.inc()
+
+
+def count_discord_rate_limits():
+    http_logger = logging.getLogger("discord.http")
+    if not http_logger.isEnabledFor(logging.WARNING):
+        http_logger.setLevel(logging.WARNING)
+    http_logger.addHandler(RateLimitLogHandler(logging.WARNING))
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MetricsServer:
+    def __init__(self, port: int, host: str = "127.0.0.1"):
+        self.server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics_thread", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,68 +1,305 @@
-from typing import List, Dict
-
-import psycopg2
-from psycopg2.extras import DictCursor
+import json
+import threading
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple
 
+from .logger import logger
 from .exception import TCBotError
+from .snapshot import MonitorSnapshot
+from .backend import (
+    LISTEN_RETRY_SECONDS,
+    OP_DELETE,
+    OP_INSERT,
+    OP_RELOAD,
+    StorageBackend,
+    backend_class,
+)
 
 
 class MonitorDB:
-    def __init__(self, database_url: str, table_name: str):
+    def __init__(
+        self, database_url: str, table_name: str, snapshot_path: Optional[str] = None
+    ):
+        self.database_url = database_url
+        self.table_name = table_name
+
+        # Storage is selected by the scheme of the url
+        self._backend_class = backend_class(database_url)
+        self._error = self._backend_class.Error
+
+        # Write-through cache of the whole table
+        self._cache_lock = threading.RLock()
+        self._is_loaded = False
+        self._by_twitter_id: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self._by_channel_id: Dict[int, Dict[int, Dict[str, Any]]] = {}
+
+        # Changes made by other processes are received by LISTEN
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._listen_thread = None
+        self._is_closed = False
+
+        # Monitors saved on disk to start streams without waiting for the database
+        self.snapshot = None
+        self.is_warm = False
+        if snapshot_path is not None:
+            self.snapshot = MonitorSnapshot(snapshot_path, table_name)
+            self._warm_start()
+
+        self.backend: Optional[StorageBackend] = None
+        self._backend_lock = threading.Lock()
         try:
-            self.connection = psycopg2.connect(database_url)
-        except psycopg2.OperationalError as exc:
-            raise TCBotError(
-                f"Failed to connect database. url: {database_url}"
-            ) from exc
-        else:
-            self.connection.autocommit = True
+            self._connect()
+        except self._error as exc:
+            # Connected later on demand if the bot can start from the snapshot
+            if not self.is_warm:
+                raise TCBotError(
+                    f"Failed to connect database. url: {database_url}"
+                ) from exc
+            logger.exception(
+                f"Failed to connect database. Started from snapshot. url: {database_url}"
+            )
 
-        self.table_name = table_name
+    def _connect(self) -> StorageBackend:
+        with self._backend_lock:
+            if self.backend is None:
+                self.backend = self._backend_class(self.database_url, self.table_name)
+            return self.backend
+
+    def _warm_start(self):
+        rows = self.snapshot.load()
+        if rows is None:
+            return
+
+        # Cache is reconciled with the database by the first reload
+        with self._cache_lock:
+            for row in rows:
+                self._cache_insert(row)
+            self._is_loaded = True
+            self.is_warm = True
+        logger.info(f"Loaded {len(rows)} monitors from snapshot.")
+
+    def _save_snapshot(self):
+        # Must be called with the cache lock after the database is changed
+        if self.snapshot is None or not self._is_loaded:
+            return
+        try:
+            self.snapshot.save(self._rows(self._by_twitter_id))
+        except TCBotError:
+            logger.exception("Failed to save snapshot of monitors.")
+
+    def close(self):
+        # Listening thread is a daemon and stops at the next wake up
+        self._is_closed = True
+        if self.backend is not None:
+            self.backend.close()
+
+    def add_listener(self, callback: Callable[[str, Dict[str, Any]], None]):
+        # callback(op, row) is called on the listening thread for each row
+        # changed by other processes
+        self._listeners.append(callback)
+
+    def start_listening(self):
+        if self._listen_thread is None:
+            self._listen_thread = threading.Thread(
+                target=self._listen, name="listen_thread", daemon=True
+            )
+            self._listen_thread.start()
+
+    def _listen(self):
+        while not self._is_closed:
+            try:
+                backend = self._connect()
+            except self._error:
+                logger.exception("Failed to connect database for LISTEN.")
+                time.sleep(LISTEN_RETRY_SECONDS)
+                continue
+
+            backend.listen(self._on_notify, self._reload, lambda: self._is_closed)
+
+    def _on_notify(self, notify_payload: str):
+        try:
+            payload = json.loads(notify_payload)
+            op = payload.pop("op")
+        except (ValueError, KeyError):
+            logger.error(f"Invalid notification. payload: {notify_payload}")
+            return
+
+        if op == OP_RELOAD:
+            self._reload()
+        elif op == OP_INSERT:
+            with self._cache_lock:
+                if self._is_loaded and self._cache_insert(payload):
+                    self._save_snapshot()
+                    self._emit(OP_INSERT, payload)
+        elif op == OP_DELETE:
+            with self._cache_lock:
+                if self._is_loaded:
+                    row = self._cache_delete(
+                        payload["channel_id"], payload["twitter_id"]
+                    )
+                    if row:
+                        self._save_snapshot()
+                        self._emit(OP_DELETE, row)
+
+    def _emit(self, op: str, row: Dict[str, Any]):
+        for callback in self._listeners:
+            try:
+                callback(op, dict(row))
+            except Exception:
+                logger.exception("Catch Exception in monitor listener")
+
+    def _cache_insert(self, row: Dict[str, Any]) -> bool:
+        cid, tid = row["channel_id"], row["twitter_id"]
+        if tid in self._by_twitter_id and cid in self._by_twitter_id[tid]:
+            return False
+
+        row = dict(row)
+        self._by_twitter_id.setdefault(tid, {})[cid] = row
+        self._by_channel_id.setdefault(cid, {})[tid] = row
+        return True
+
+    def _cache_delete(self, channel_id: int, twitter_id: int) -> Dict[str, Any]:
+        row = self._by_twitter_id.get(twitter_id, {}).pop(channel_id, None)
+        if row is None:
+            return None
+
+        del self._by_channel_id[channel_id][twitter_id]
+        if not self._by_twitter_id[twitter_id]:
+            del self._by_twitter_id[twitter_id]
+        if not self._by_channel_id[channel_id]:
+            del self._by_channel_id[channel_id]
+        return row
+
+    def _load(self):
+        if self._is_loaded:
+            return
+
+        try:
+            rows = self._connect().select_all()
+        except self._error as exc:
+            raise TCBotError("Failed to select rows.") from exc
 
-    def _do_sql(self, query: str) -> List[Dict]:
-        with self.connection.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute(query)
+        self._by_twitter_id = {}
+        self._by_channel_id = {}
+        for row in rows:
+            self._cache_insert(row)
+        self._is_loaded = True
+        self.is_warm = False
+        self._save_snapshot()
+
+    def _reload(self):
+        # Reload whole table and tell listeners the difference
+        with self._cache_lock:
+            was_loaded = self._is_loaded
+            old_rows = self._rows(self._by_twitter_id)
+            self._is_loaded = False
             try:
-                rows = []
-                for row in cursor.fetchall():
-                    rows.append(dict(row))
-                return rows
-            except psycopg2.ProgrammingError:
-                return None
+                self._load()
+            except TCBotError:
+                # Cache of the snapshot is kept while the database is down
+                self._is_loaded = was_loaded
+                raise
+            if not was_loaded:
+                return
+            new_rows = self._rows(self._by_twitter_id)
+
+        old_keys = {(r["channel_id"], r["twitter_id"]): r for r in old_rows}
+        new_keys = {(r["channel_id"], r["twitter_id"]): r for r in new_rows}
+        for key, row in old_keys.items():
+            if new_keys.get(key) != row:
+                self._emit(OP_DELETE, row)
+        for key, row in new_keys.items():
+            if old_keys.get(key) != row:
+                self._emit(OP_INSERT, row)
+
+    @staticmethod
+    def _rows(index: Dict[int, Dict[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        return [dict(row) for rows in index.values() for row in rows.values()]
+
+    def reconcile(self) -> List[Dict]:
+        # Replace the cache with the database and return all monitors
+        self._reload()
+        return self.select()
+
+    def _do_sql(self, query: str, params: Tuple = None) -> List[Dict]:
+        # Raw query may change the table, so cache is recreated
+        with self._cache_lock:
+            self._is_loaded = False
+        return self._connect().execute_raw(query, params)
+
+    def create_table(self):
+        try:
+            self._connect().create_table()
+        except self._error as exc:
+            raise TCBotError(
+                f"Failed to create table. table: {self.table_name}"
+            ) from exc
 
     def select(self, channel_id: int = None, twitter_id: int = None) -> List[Dict]:
-        table_name = self.table_name
         monitors: List[Dict] = []
 
-        if channel_id is None and twitter_id is None:
-            monitors = self._do_sql(f"SELECT * FROM {table_name};")
-        elif channel_id is None:
-            monitors = self._do_sql(
-                f"SELECT * FROM {table_name} WHERE twitter_id = {twitter_id};"
-            )
-        elif twitter_id is None:
-            monitors = self._do_sql(
-                f"SELECT * FROM {table_name} WHERE channel_id = {channel_id};"
-            )
-        else:
-            monitors = self._do_sql(
-                f"SELECT * FROM {table_name} "
-                f"WHERE channel_id = {channel_id} AND twitter_id = {twitter_id};"
-            )
+        with self._cache_lock:
+            self._load()
+            if channel_id is None and twitter_id is None:
+                monitors = self._rows(self._by_twitter_id)
+            elif channel_id is None:
+                rows = self._by_twitter_id.get(twitter_id, {})
+                monitors = [dict(row) for row in rows.values()]
+            elif twitter_id is None:
+                rows = self._by_channel_id.get(channel_id, {})
+                monitors = [dict(row) for row in rows.values()]
+            else:
+                row = self._by_twitter_id.get(twitter_id, {}).get(channel_id)
+                monitors = [dict(row)] if row else []
 
         return monitors
 
+    def insert_many(self, rows: List[Tuple[int, int, str]]):
+        # Insert all rows or nothing
+        if not rows:
+            return
+
+        rows = [
+            {"channel_id": cid, "twitter_id": tid, "match_ptn": ptn}
+            for cid, tid, ptn in rows
+        ]
+        try:
+            self._connect().write(OP_INSERT, rows)
+        except self._error as exc:
+            raise TCBotError(f"Failed to insert {len(rows)} rows.") from exc
+
+        with self._cache_lock:
+            if self._is_loaded:
+                for row in rows:
+                    self._cache_insert(row)
+                self._save_snapshot()
+
+    def delete_many(self, keys: List[Tuple[int, int]]):
+        # Delete all rows or nothing
+        if not keys:
+            return
+
+        rows = [{"channel_id": cid, "twitter_id": tid} for cid, tid in keys]
+        try:
+            self._connect().write(OP_DELETE, rows)
+        except self._error as exc:
+            raise TCBotError(f"Failed to delete {len(rows)} rows.") from exc
+
+        with self._cache_lock:
+            if self._is_loaded:
+                for cid, tid in keys:
+                    self._cache_delete(cid, tid)
+                self._save_snapshot()
+
     def insert(self, channel_id: int, twitter_id: int, match_ptn: str):
+        row = {
+            "channel_id": channel_id,
+            "twitter_id": twitter_id,
+            "match_ptn": match_ptn,
+        }
         try:
-            self._do_sql(
-                f"INSERT INTO {self.table_name} VALUES (%s, %s, %s);"
-                % (
-                    "null" if channel_id is None else channel_id,
-                    "null" if twitter_id is None else twitter_id,
-                    "null" if match_ptn is None else f"'{match_ptn}'",
-                )
-            )
-        except psycopg2.Error as exc:
+            self._connect().write(OP_INSERT, [row])
+        except self._error as exc:
             raise TCBotError(
                 "Failed to insert a row. row: (%s, %s, %s)"
                 % (
@@ -72,13 +309,37 @@ class MonitorDB:
                 )
             ) from exc
 
+        with self._cache_lock:
+            if self._is_loaded:
+                self._cache_insert(row)
+                self._save_snapshot()
+
     def delete(self, channel_id: int, twitter_id: int):
+        row = {"channel_id": channel_id, "twitter_id": twitter_id}
         try:
-            self._do_sql(
-                f"DELETE FROM {self.table_name} "
-                f"WHERE channel_id = {channel_id} AND twitter_id = {twitter_id};"
-            )
-        except psycopg2.Error as exc:
+            self._connect().write(OP_DELETE, [row])
+        except self._error as exc:
             raise TCBotError(
-                "Failed to delete a row. key: ({channel_id}, {twitter_id})"
+                f"Failed to delete a row. key: ({channel_id}, {twitter_id})"
             ) from exc
+
+        with self._cache_lock:
+            if self._is_loaded:
+                self._cache_delete(channel_id, twitter_id)
+                self._save_snapshot()
+
+    def select_cursors(self) -> Dict[int, int]:
+        try:
+            return self._connect().select_cursors()
+        except self._error as exc:
+            raise TCBotError("Failed to select cursors.") from exc
+
+    def save_cursors(self, cursors: Dict[int, int]):
+        # Cursors never go back even if older ids are saved
+        if not cursors:
+            return
+
+        try:
+            self._connect().save_cursors(cursors)
+        except self._error as exc:
+            raise TCBotError(f"Failed to save {len(cursors)} cursors.") from exc
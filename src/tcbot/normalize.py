@@ -0,0 +1,88 @@
+import re
+from typing import Any, Dict, List, Optional, Union
+
+URL_FIELD_EXPANDED = "expanded_url"
+URL_FIELD_DISPLAY = "display_url"
+URL_FIELDS = (URL_FIELD_EXPANDED, URL_FIELD_DISPLAY)
+
+# Separator between the text of a tweet and the text quoted by it
+QUOTE_SEPARATOR = "\n"
+
+# User objects in a tweet, with the id if it is the first field. Quotes in
+# JSON strings are escaped, so only keys match.
+USER_ID_PTN = re.compile(r'"user":\s*\{(?:\s*"id":\s*(\d+))?')
+USER_ID_BYTES_PTN = re.compile(USER_ID_PTN.pattern.encode())
+
+
+def peek_user_ids(raw_data: Union[str, bytes]) -> Optional[List[int]]:
+    # Ids of all users in a tweet, one of which is the author, without parsing
+    # the whole JSON. Fields are not ordered, so the author can not be told
+    # from users of retweeted and quoted tweets. None for other messages, or
+    # if the id of a user is not found.
+    if isinstance(raw_data, bytes):
+        ids = USER_ID_BYTES_PTN.findall(raw_data)
+    else:
+        ids = USER_ID_PTN.findall(raw_data)
+    if not ids or not all(ids):
+        return None
+    return [int(i) for i in ids]
+
+
+def _expand_by_replace(text: str, urls: List[Dict[str, Any]], url_field: str) -> str:
+    for e in urls:
+        text = text.replace(e["url"], e.get(url_field) or e["url"])
+    return text
+
+
+def expand_urls(
+    text: str, urls: List[Dict[str, Any]], url_field: str = URL_FIELD_EXPANDED
+) -> str:
+    # Replace shortened links in one pass by the indices of entities
+    if not urls:
+        return text
+
+    parts = []
+    pos = 0
+    try:
+        for e in urls:
+            start, end = e["indices"]
+            short = e["url"]
+            # Entities are ordered by the position in the text
+            if start < pos or not text.startswith(short, start):
+                raise ValueError(f"Invalid indices. url: {short}")
+            parts.append(text[pos:start])
+            parts.append(e.get(url_field) or short)
+            pos = end
+    except (KeyError, ValueError):
+        # Indices do not point at the links, e.g. entities edited by hand
+        return _expand_by_replace(text, urls, url_field)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _status_text(data: Dict[str, Any], url_field: str) -> str:
+    # Tweets longer than 140 characters are truncated in "text" of the stream
+    if "extended_tweet" in data:
+        data = data["extended_tweet"]
+    text = data.get("full_text") or data.get("text") or ""
+    entities = data.get("entities")
+    if not entities or not entities.get("urls"):
+        return text
+    return expand_urls(text, entities["urls"], url_field)
+
+
+def normalize_status(data: Dict[str, Any], url_field: str = URL_FIELD_EXPANDED) -> str:
+    # Text to be matched from the JSON of a tweet
+    if "retweeted_status" in data:
+        # Text of retweets is truncated after the prefix, so the original is used
+        retweeted = data["retweeted_status"]
+        screen_name = retweeted.get("user", {}).get("screen_name", "")
+        text = f"RT @{screen_name}: " + _status_text(retweeted, url_field)
+        quoted = retweeted.get("quoted_status")
+    else:
+        text = _status_text(data, url_field)
+        quoted = data.get("quoted_status")
+
+    if quoted is not None:
+        text += QUOTE_SEPARATOR + _status_text(quoted, url_field)
+    return text
@@ -0,0 +1,114 @@
+import multiprocessing
+import re
+import time
+from typing import Any, List
+
+from .logger import logger
+
+# re2 matches in linear time but is an optional dependency
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+ENGINE_RE = "re"
+ENGINE_RE2 = "re2"
+ENGINES = (ENGINE_RE, ENGINE_RE2)
+
+# Inputs for the admission check are as long as a tweet with expanded links and a quote
+ADVERSARIAL_LENGTH = 1000
+# Characters tried besides those in the pattern
+ADVERSARIAL_CHARS = "a0 "
+# Characters breaking a match at the end of inputs
+ADVERSARIAL_TAILS = ("!", "\n", "")
+LITERAL_PTN = re.compile(r"[\w.:/#@-]{2,}")
+
+# Patterns taking longer than this on any input are rejected
+ADMISSION_MAX_SECONDS = 0.05
+# Including the start of the process, catastrophic patterns never finish
+ADMISSION_TIMEOUT_SECONDS = 2.0
+
+
+def re2_available() -> bool:
+    return re2 is not None
+
+
+def compile_pattern(ptn: str, engine: str = ENGINE_RE) -> Any:
+    # Patterns re2 does not support, e.g. backreferences, are compiled by re
+    if engine == ENGINE_RE2 and re2 is not None:
+        try:
+            return re2.compile(ptn)
+        except re2.error:
+            logger.debug(f"Compiled by re instead of re2. pattern: {ptn}")
+    return re.compile(ptn)
+
+
+def is_linear(ptn: str, engine: str = ENGINE_RE) -> bool:
+    if engine != ENGINE_RE2 or re2 is None:
+        return False
+    try:
+        re2.compile(ptn)
+    except re2.error:
+        return False
+    return True
+
+
+def adversarial_inputs(ptn: str) -> List[str]:
+    # Long runs of characters and literals of the pattern ending with a mismatch,
+    # which make backtracking engines try every way to split the run
+    runs = set(ADVERSARIAL_CHARS)
+    runs.update(c for c in ptn if c.isalnum() or c in " .:/#@-_")
+    runs.update(LITERAL_PTN.findall(ptn))
+
+    inputs = []
+    for run in sorted(runs):
+        text = run * (ADVERSARIAL_LENGTH // len(run))
+        inputs.extend(text + tail for tail in ADVERSARIAL_TAILS)
+    return inputs
+
+
+def _measure(ptn: str, conn):
+    # Run in a child process to be killed on timeout
+    regex = re.compile(ptn)
+    worst = 0.0
+    for text in adversarial_inputs(ptn):
+        start = time.perf_counter()
+        regex.search(text)
+        worst = max(worst, time.perf_counter() - start)
+    conn.send(worst)
+    conn.close()
+
+
+def check_pattern(
+    ptn: str,
+    engine: str = ENGINE_RE,
+    timeout: float = ADMISSION_TIMEOUT_SECONDS,
+    max_seconds: float = ADMISSION_MAX_SECONDS,
+) -> bool:
+    # Return True if the pattern is fast enough to be matched with every tweet
+    if is_linear(ptn, engine):
+        return True
+
+    # Forking a process with running threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(ptn, child_conn), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            logger.error(f"Pattern timed out in admission check. pattern: {ptn}")
+            return False
+        worst = parent_conn.recv()
+    except EOFError:
+        logger.error(f"Failed to check pattern. pattern: {ptn}")
+        return False
+    finally:
+        process.kill()
+        process.join()
+        parent_conn.close()
+
+    if worst > max_seconds:
+        logger.error(f"Pattern is too slow. pattern: {ptn}, seconds: {worst:.3f}")
+        return False
+    return True
@@ -0,0 +1,275 @@
+import json
+import select
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+from .logger import logger
+from .exception import TCBotError
+from .backend import COLUMNS, LISTEN_RETRY_SECONDS, OP_RELOAD, StorageBackend
+
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 8
+# Times to retry a query on a new connection when the connection is lost
+RECONNECT_RETRIES = 1
+
+# Interval to check that the listening connection is alive
+LISTEN_TIMEOUT_SECONDS = 60
+# Maximum payload size of NOTIFY
+MAX_NOTIFY_PAYLOAD_BYTES = 8000
+
+STATEMENTS = {
+    "select_all": f"SELECT {COLUMNS} FROM {{table}}",
+    "insert": f"INSERT INTO {{table}} ({COLUMNS}) VALUES ($1, $2, $3)",
+    "delete": "DELETE FROM {table} WHERE channel_id = $1 AND twitter_id = $2",
+    "notify": "SELECT pg_notify($1, $2)",
+    "select_cursors": "SELECT twitter_id, status_id FROM {cursor_table}",
+    "upsert_cursor": (
+        "INSERT INTO {cursor_table} (twitter_id, status_id) VALUES ($1, $2) "
+        "ON CONFLICT (twitter_id) DO UPDATE "
+        "SET status_id = GREATEST({cursor_table}.status_id, EXCLUDED.status_id)"
+    ),
+}
+
+TABLE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS {table}("
+    "channel_id bigint not null,"
+    "twitter_id bigint not null,"
+    "match_ptn text,"
+    "PRIMARY KEY(channel_id, twitter_id)"
+    ");"
+)
+
+# Last status id processed for each followed user
+CURSOR_TABLE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS {cursor_table}("
+    "twitter_id bigint PRIMARY KEY,"
+    "status_id bigint not null"
+    ");"
+)
+
+
+class _Connection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.autocommit = True
+
+        # Statements prepared in this session
+        self.prepared = set()
+        self.generation = 0
+
+
+class PostgresBackend(StorageBackend):
+    Error = psycopg2.Error
+
+    def __init__(self, database_url: str, table_name: str):
+        super().__init__(database_url, table_name)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            POOL_MIN_CONNECTIONS,
+            POOL_MAX_CONNECTIONS,
+            database_url,
+            connection_factory=_Connection,
+        )
+
+        self.notify_channel = f"tcbot_{table_name}".lower()
+        self._has_cursor_table = False
+
+        # Prepared statements older than the generation are discarded
+        self._generation = 0
+
+        # Notifications carry the origin to ignore writes by this instance.
+        # Pids of backends can not be used since they are reused.
+        self.origin = uuid.uuid4().hex
+
+    def close(self):
+        self.pool.closeall()
+
+    def listen(
+        self,
+        on_notify: Callable[[str], None],
+        on_reload: Callable[[], None],
+        is_closed: Callable[[], bool],
+    ):
+        while not is_closed():
+            try:
+                conn = psycopg2.connect(self.database_url)
+            except psycopg2.OperationalError:
+                logger.exception("Failed to connect database for LISTEN.")
+                time.sleep(LISTEN_RETRY_SECONDS)
+                continue
+
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.notify_channel};")
+
+                # Notifications may be missed while not listening
+                on_reload()
+
+                while not is_closed():
+                    readable, _, _ = select.select(
+                        [conn], [], [], LISTEN_TIMEOUT_SECONDS
+                    )
+                    if not readable:
+                        # Check connection on timeout
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1;")
+                        continue
+
+                    conn.poll()
+                    while conn.notifies:
+                        payload = self._foreign_payload(conn.notifies.pop(0).payload)
+                        if payload is not None:
+                            on_notify(payload)
+            except (psycopg2.Error, TCBotError):
+                logger.exception("Lost connection to database for LISTEN.")
+                time.sleep(LISTEN_RETRY_SECONDS)
+            finally:
+                conn.close()
+
+    def _notify_payload(self, op: str, row: Dict[str, Any]) -> str:
+        payload = json.dumps(dict(row, op=op, origin=self.origin))
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD_BYTES:
+            payload = json.dumps({"op": OP_RELOAD, "origin": self.origin})
+        return payload
+
+    def _foreign_payload(self, payload: str) -> Optional[str]:
+        # Return the payload without the origin, or None for changes by this
+        # instance, which are already in cache
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            # Reported by the receiver
+            return payload
+        if not isinstance(data, dict):
+            return payload
+        if data.pop("origin", None) == self.origin:
+            return None
+        return json.dumps(data)
+
+    @staticmethod
+    def _fetch(cursor) -> Optional[List[Dict[str, Any]]]:
+        # Statement returns no rows
+        if cursor.description is None:
+            return None
+
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _run(self, func, *args):
+        # Run func with a pooled connection and reconnect if the connection is lost
+        retry = 0
+        while True:
+            conn = self.pool.getconn()
+            try:
+                result = func(conn, *args)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.pool.putconn(conn, close=True)
+                if retry >= RECONNECT_RETRIES:
+                    raise
+                retry += 1
+                logger.error("Lost connection to database. Reconnecting.")
+            except BaseException:
+                self.pool.putconn(conn)
+                raise
+            else:
+                self.pool.putconn(conn)
+                return result
+
+    def _prepare(self, conn: _Connection, cursor, name: str):
+        if conn.generation != self._generation:
+            cursor.execute("DEALLOCATE ALL;")
+            conn.prepared.clear()
+            conn.generation = self._generation
+
+        if name not in conn.prepared:
+            statement = STATEMENTS[name].format(
+                table=self.table_name, cursor_table=self.cursor_table_name
+            )
+            cursor.execute(f"PREPARE tcbot_{name} AS {statement};")
+            conn.prepared.add(name)
+
+    def _execute_prepared(self, conn: _Connection, name: str, params: Tuple):
+        with conn.cursor() as cursor:
+            self._prepare(conn, cursor, name)
+            if params:
+                placeholders = ", ".join(["%s"] * len(params))
+                cursor.execute(f"EXECUTE tcbot_{name} ({placeholders});", params)
+            else:
+                cursor.execute(f"EXECUTE tcbot_{name};")
+            return self._fetch(cursor)
+
+    def _execute(self, name: str, *params) -> Optional[List[Dict[str, Any]]]:
+        return self._run(self._execute_prepared, name, params)
+
+    def _execute_raw(self, conn: _Connection, query: str, params: Optional[Tuple]):
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return self._fetch(cursor)
+
+    def execute_raw(self, query: str, params: Optional[Tuple]) -> Optional[List[Dict]]:
+        self._generation += 1
+        return self._run(self._execute_raw, query, params)
+
+    def create_table(self):
+        query = TABLE_SCHEMA.format(table=self.table_name)
+        self._run(self._execute_raw, query, None)
+
+    def select_all(self) -> List[Dict[str, Any]]:
+        return self._execute("select_all")
+
+    def _write(self, conn: _Connection, name: str, op: str, rows: List[Dict]):
+        # Write all rows and notify them to other processes in one transaction
+        with conn.cursor() as cursor:
+            self._prepare(conn, cursor, name)
+            self._prepare(conn, cursor, "notify")
+
+            placeholders = ", ".join(["%s"] * len(rows[0]))
+            cursor.execute("BEGIN;")
+            try:
+                psycopg2.extras.execute_batch(
+                    cursor,
+                    f"EXECUTE tcbot_{name} ({placeholders});",
+                    [tuple(row.values()) for row in rows],
+                )
+                psycopg2.extras.execute_batch(
+                    cursor,
+                    "EXECUTE tcbot_notify (%s, %s);",
+                    [(self.notify_channel, self._notify_payload(op, r)) for r in rows],
+                )
+            except psycopg2.Error:
+                if not conn.closed:
+                    cursor.execute("ROLLBACK;")
+                raise
+            cursor.execute("COMMIT;")
+
+    def write(self, op: str, rows: List[Dict[str, Any]]):
+        # Statements are named after the operation
+        self._run(self._write, op, op, rows)
+
+    def _ensure_cursor_table(self):
+        if not self._has_cursor_table:
+            query = CURSOR_TABLE_SCHEMA.format(cursor_table=self.cursor_table_name)
+            self._run(self._execute_raw, query, None)
+            self._has_cursor_table = True
+
+    def _write_cursors(self, conn: _Connection, cursors: Dict[int, int]):
+        with conn.cursor() as cursor:
+            self._prepare(conn, cursor, "upsert_cursor")
+            psycopg2.extras.execute_batch(
+                cursor, "EXECUTE tcbot_upsert_cursor (%s, %s);", list(cursors.items())
+            )
+
+    def select_cursors(self) -> Dict[int, int]:
+        self._ensure_cursor_table()
+        rows = self._execute("select_cursors")
+        return {row["twitter_id"]: row["status_id"] for row in rows}
+
+    def save_cursors(self, cursors: Dict[int, int]):
+        self._ensure_cursor_table()
+        self._run(self._write_cursors, cursors)
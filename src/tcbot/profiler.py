@@ -0,0 +1,204 @@
+import asyncio
+import collections
+import marshal
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from .logger import logger
+from .exception import TCBotError
+
+FORMAT_COLLAPSED = "collapsed"
+FORMAT_PSTATS = "pstats"
+FORMATS = (FORMAT_COLLAPSED, FORMAT_PSTATS)
+
+# Sampling every 10ms costs a few percent of a core at most
+SAMPLE_INTERVAL_SECONDS = 0.01
+
+# Callbacks blocking the event loop longer than this are reported with the stack
+SLOW_CALLBACK_SECONDS = 0.1
+HEARTBEAT_SECONDS = 0.05
+
+# (filename, first line, function) as keys of pstats
+FrameKey = Tuple[str, int, str]
+
+
+def _frame_keys(frame) -> Tuple[FrameKey, ...]:
+    # From the outermost frame to the innermost one
+    keys = []
+    while frame is not None:
+        code = frame.f_code
+        keys.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    keys.reverse()
+    return tuple(keys)
+
+
+def _collapsed_name(key: FrameKey) -> str:
+    filename, lineno, name = key
+    # Last two components are enough to tell modules apart
+    short = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{name} ({short}:{lineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float = SAMPLE_INTERVAL_SECONDS,
+        slow_callback_seconds: float = SLOW_CALLBACK_SECONDS,
+    ):
+        self.loop = loop
+        self.interval = interval
+        self.slow_callback_seconds = slow_callback_seconds
+
+        # Counts of (thread name, stack)
+        self.samples: collections.Counter = collections.Counter()
+        # (duration, formatted stack) of each slow callback
+        self.slow_callbacks: List[Tuple[float, str]] = []
+        self.duration = 0.0
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        # (start of the stall, stack) found by the sampling thread
+        self._stall: Optional[Tuple[float, str]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def start(self):
+        # Called on the event loop
+        if self.running:
+            raise TCBotError("Profiler is already running.")
+
+        self.samples.clear()
+        self.slow_callbacks = []
+        self.duration = 0.0
+        self._stall = None
+        self._stop.clear()
+        self._tick()
+        self._thread = threading.Thread(
+            target=self._sample, name="profiler_thread", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        await self.loop.run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    async def run(self, seconds: float):
+        self.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await self.stop()
+
+    def _tick(self):
+        # Delayed when a callback blocks the event loop
+        now = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = now
+        stall, self._stall = self._stall, None
+        if stall is not None:
+            duration = now - stall[0]
+            self.slow_callbacks.append((duration, stall[1]))
+            logger.warning(
+                f"Event loop was blocked for {duration:.3f} seconds.\n{stall[1]}"
+            )
+
+        if not self._stop.is_set():
+            self.loop.call_later(HEARTBEAT_SECONDS, self._tick)
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        start = time.monotonic()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                name = names.get(thread_id, str(thread_id))
+                self.samples[(name, _frame_keys(frame))] += 1
+
+            self._check_stall(frames)
+        self.duration = time.monotonic() - start
+
+    def _check_stall(self, frames: Dict):
+        last_tick = self._last_tick
+        blocked = time.monotonic() - last_tick - HEARTBEAT_SECONDS
+        if self._stall is not None or blocked < self.slow_callback_seconds:
+            return
+
+        frame = frames.get(self._loop_thread_id)
+        # The event loop may have just been unblocked
+        if frame is not None and self._last_tick == last_tick:
+            stack = "".join(traceback.format_stack(frame))
+            self._stall = (last_tick + HEARTBEAT_SECONDS, stack)
+
+    def write(self, path: str, format: str = FORMAT_COLLAPSED):
+        if format not in FORMATS:
+            raise TCBotError(f"Invalid profile format. format: {format}")
+
+        try:
+            if format == FORMAT_COLLAPSED:
+                with open(path, "w") as f:
+                    f.writelines(self._collapsed())
+            else:
+                with open(path, "wb") as f:
+                    marshal.dump(self._pstats(), f)
+        except OSError as exc:
+            raise TCBotError(f"Failed to write profile. file_name: {path}") from exc
+
+    def _collapsed(self) -> List[str]:
+        # Lines of flamegraph.pl and speedscope, rooted at the thread name
+        lines = []
+        for (name, stack), count in self.samples.most_common():
+            frames = ";".join(_collapsed_name(key) for key in stack)
+            lines.append(f"{name.replace(';', ':')};{frames} {count}\n")
+        return lines
+
+    def _pstats(self) -> Dict:
+        # Same layout as cProfile, loadable by pstats.Stats
+        # Call counts are sample counts and times are estimated from them
+        stats: Dict[FrameKey, list] = {}
+        for (_, stack), count in self.samples.items():
+            seconds = count * self.interval
+            for i, key in enumerate(stack):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                # Recursive calls are counted once
+                if key not in stack[:i]:
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if i > 0:
+                    caller = entry[4].setdefault(stack[i - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[3] += seconds
+            if stack:
+                stats[stack[-1]][2] += seconds
+
+        return {
+            key: (
+                cc,
+                nc,
+                tt,
+                ct,
+                {caller: tuple(values) for caller, values in callers.items()},
+            )
+            for key, (cc, nc, tt, ct, callers) in stats.items()
+        }
@@ -0,0 +1,179 @@
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .logger import logger
+from .metrics import STREAM_RECONNECT_SECONDS, STREAM_RECONNECTS
+
+# Kinds of errors, backed off as Twitter recommends for streaming connections
+ERROR_NETWORK = "network"
+ERROR_HTTP = "http"
+ERROR_RATE_LIMIT = "rate_limit"
+
+# Ratio of random delay added to each backoff
+JITTER_RATIO = 0.2
+MAX_CONCURRENT_RECONNECTS = 2
+# Reconnection holds the slot until the stream is connected or for this time
+CONNECT_TIMEOUT_SECONDS = 30
+
+
+class Backoff:
+    def __init__(
+        self, initial: float, maximum: float, factor: float = 2, step: float = 0
+    ):
+        # Grows linearly by step if step is given, otherwise exponentially by factor
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.step = step
+        self.attempts = 0
+
+    def next(self) -> float:
+        if self.step:
+            delay = self.initial + self.step * self.attempts
+        else:
+            delay = self.initial * self.factor ** self.attempts
+        self.attempts += 1
+        delay = min(delay, self.maximum)
+        return delay + random.uniform(0, delay * JITTER_RATIO)
+
+    def reset(self):
+        self.attempts = 0
+
+
+def create_backoff(kind: str) -> Backoff:
+    if kind == ERROR_NETWORK:
+        # Linearly by 250ms up to 16 seconds
+        return Backoff(0.25, 16, step=0.25)
+    elif kind == ERROR_RATE_LIMIT:
+        # Exponentially from 1 minute
+        return Backoff(60, 960)
+    else:
+        # Exponentially from 5 seconds up to 320 seconds
+        return Backoff(5, 320)
+
+
+class ReconnectScheduler:
+    def __init__(
+        self,
+        loop,
+        max_concurrent: int = MAX_CONCURRENT_RECONNECTS,
+        connect_timeout: float = CONNECT_TIMEOUT_SECONDS,
+    ):
+        self.loop = loop
+        self.max_concurrent = max_concurrent
+        self.connect_timeout = connect_timeout
+
+        self.reconnects = 0
+        self.last_duration = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+        self._sem = None
+        self._backoffs: Dict[Hashable, Dict[str, Backoff]] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        # Set when the stream reconnected is connected
+        self._waiting: Dict[Hashable, asyncio.Event] = {}
+        # Time when the connection is lost
+        self._lost_at: Dict[Hashable, float] = {}
+
+    def schedule(self, key: Hashable, kind: str, reconnect: Callable[[], Any]):
+        # May be called from any thread
+        self.loop.call_soon_threadsafe(self._schedule, key, kind, reconnect)
+
+    def connected(self, key: Hashable):
+        # May be called from any thread
+        self.loop.call_soon_threadsafe(self._connected, key)
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    def in_progress(self) -> int:
+        return len(self._lost_at)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            "reconnects": self.reconnects,
+            "in_progress": self.in_progress(),
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "total_duration": self.total_duration,
+        }
+
+    def _schedule(self, key: Hashable, kind: str, reconnect: Callable[[], Any]):
+        # Lost again before connected, so the slot is given to others
+        waiting = self._waiting.pop(key, None)
+        if waiting is not None:
+            waiting.set()
+            self._tasks.pop(key, None)
+
+        # Attempt for the key is already scheduled
+        if key in self._tasks:
+            return
+
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+
+        backoffs = self._backoffs.setdefault(key, {})
+        if kind not in backoffs:
+            backoffs[kind] = create_backoff(kind)
+        delay = backoffs[kind].next()
+
+        self._lost_at.setdefault(key, time.monotonic())
+        logger.error(f"Reconnecting in {delay:.2f} seconds. key: {key}, error: {kind}")
+        STREAM_RECONNECTS.inc(error=kind)
+        self._tasks[key] = self.loop.create_task(self._reconnect(key, delay, reconnect))
+
+    async def _reconnect(
+        self, key: Hashable, delay: float, reconnect: Callable[[], Any]
+    ):
+        task = asyncio.current_task()
+        connected = asyncio.Event()
+        try:
+            await asyncio.sleep(delay)
+            async with self._sem:
+                self.reconnects += 1
+                self._waiting[key] = connected
+                result = reconnect()
+                if asyncio.iscoroutine(result):
+                    await result
+
+                # Streams run on their own threads, so the slot is held until
+                # connected not to open all streams at once
+                try:
+                    await asyncio.wait_for(connected.wait(), self.connect_timeout)
+                except asyncio.TimeoutError:
+                    logger.error(
+                        f"Stream is not connected in {self.connect_timeout} seconds. "
+                        f"key: {key}"
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Failed to reconnect. key: {key}")
+        finally:
+            # Entries may already be replaced by the next attempt
+            if self._waiting.get(key) is connected:
+                del self._waiting[key]
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def _connected(self, key: Hashable):
+        waiting = self._waiting.pop(key, None)
+        if waiting is not None:
+            waiting.set()
+
+        # Backoffs start over once connected
+        for backoff in self._backoffs.get(key, {}).values():
+            backoff.reset()
+
+        lost_at = self._lost_at.pop(key, None)
+        if lost_at is not None:
+            duration = time.monotonic() - lost_at
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+            self.total_duration += duration
+            STREAM_RECONNECT_SECONDS.observe(duration)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from .logger import logger
+from .exception import TCBotError
+
+# Snapshots of other versions are ignored and replaced with the database
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FORMAT = "tcbot-monitors"
+
+
+class MonitorSnapshot:
+    def __init__(self, path: str, table_name: str):
+        self.path = path
+        self.table_name = table_name
+        self.saved_at: Optional[float] = None
+
+    @staticmethod
+    def _encode(rows: List[Dict[str, Any]]) -> bytes:
+        # Rows are sorted to make the same map the same bytes
+        body = sorted([r["channel_id"], r["twitter_id"], r["match_ptn"]] for r in rows)
+        return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def save(self, rows: List[Dict[str, Any]]):
+        body = self._encode(rows)
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "table": self.table_name,
+            "count": len(rows),
+            "saved_at": time.time(),
+            "sha256": hashlib.sha256(body).hexdigest(),
+        }
+
+        # Replace at once not to leave a broken file
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(header).encode() + b"\n" + body + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            raise TCBotError(f"Failed to save file. file_name: {self.path}") from exc
+        self.saved_at = header["saved_at"]
+
+    def load(self) -> Optional[List[Dict[str, Any]]]:
+        # Return None if there is no usable snapshot
+        try:
+            with open(self.path, "rb") as f:
+                header_line = f.readline()
+                body = f.read().rstrip(b"\n")
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logger.exception(f"Failed to open file. file_name: {self.path}")
+            return None
+
+        try:
+            header = json.loads(header_line)
+            if header.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError("format")
+            if header.get("version") != SNAPSHOT_VERSION:
+                logger.error(
+                    f"Snapshot of another version is ignored. "
+                    f"version: {header.get('version')}"
+                )
+                return None
+            if header.get("table") != self.table_name:
+                logger.error(
+                    f"Snapshot of another table is ignored. table: {header.get('table')}"
+                )
+                return None
+            if hashlib.sha256(body).hexdigest() != header.get("sha256"):
+                raise ValueError("sha256")
+            rows = [
+                {"channel_id": cid, "twitter_id": tid, "match_ptn": ptn}
+                for cid, tid, ptn in json.loads(body)
+            ]
+            if len(rows) != header.get("count"):
+                raise ValueError("count")
+        except (ValueError, TypeError, AttributeError):
+            logger.exception(f"Broken snapshot is ignored. file_name: {self.path}")
+            return None
+
+        self.saved_at = header.get("saved_at")
+        return rows
@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .logger import logger
+from .exception import TCBotError
+from .backend import (
+    COLUMNS,
+    LISTEN_RETRY_SECONDS,
+    OP_DELETE,
+    OP_INSERT,
+    SQLITE_SCHEME,
+    StorageBackend,
+)
+
+# Interval to check whether other processes changed the database
+LISTEN_POLL_SECONDS = 1
+# Time to wait for the lock held by other processes
+BUSY_TIMEOUT_SECONDS = 5
+
+STATEMENTS = {
+    OP_INSERT: f"INSERT INTO {{table}} ({COLUMNS}) VALUES (?, ?, ?);",
+    OP_DELETE: "DELETE FROM {table} WHERE channel_id = ? AND twitter_id = ?;",
+}
+
+# Ids are checked because SQLite stores values of any type in any column
+TABLE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS {table}("
+    "channel_id INTEGER NOT NULL CHECK(typeof(channel_id) = 'integer'),"
+    "twitter_id INTEGER NOT NULL CHECK(typeof(twitter_id) = 'integer'),"
+    "match_ptn TEXT,"
+    "PRIMARY KEY(channel_id, twitter_id)"
+    ");"
+)
+
+# Last status id processed for each followed user
+CURSOR_TABLE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS {cursor_table}("
+    "twitter_id INTEGER PRIMARY KEY,"
+    "status_id INTEGER NOT NULL"
+    ");"
+)
+
+
+def sqlite_path(database_url: str) -> str:
+    # sqlite:///monitors.db is relative, sqlite:////var/tcbot/monitors.db is absolute
+    path = database_url[len(SQLITE_SCHEME) :]
+    if not path.startswith("/"):
+        raise TCBotError(f"Invalid SQLite url. url: {database_url}")
+    return path[1:] or ":memory:"
+
+
+class SQLiteBackend(StorageBackend):
+    Error = sqlite3.Error
+
+    def __init__(self, database_url: str, table_name: str):
+        super().__init__(database_url, table_name)
+        self.path = sqlite_path(database_url)
+
+        # One connection is shared by threads, since SQLite serializes writes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self.create_table()
+        except sqlite3.Error:
+            self._conn.close()
+            raise
+
+        self._has_cursor_table = False
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, query: str, params: Tuple = ()) -> Optional[List[Dict]]:
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            # Statement returns no rows
+            if cursor.description is None:
+                return None
+
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def create_table(self):
+        self._query(TABLE_SCHEMA.format(table=self.table_name))
+
+    def select_all(self) -> List[Dict[str, Any]]:
+        return self._query(f"SELECT {COLUMNS} FROM {self.table_name};")
+
+    def execute_raw(self, query: str, params: Optional[Tuple]) -> Optional[List[Dict]]:
+        return self._query(query, params or ())
+
+    def write(self, op: str, rows: List[Dict[str, Any]]):
+        # Other processes find the changes by polling, so nothing is notified
+        statement = STATEMENTS[op].format(table=self.table_name)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                self._conn.executemany(statement, [tuple(row.values()) for row in rows])
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK;")
+                raise
+            self._conn.execute("COMMIT;")
+
+    def _ensure_cursor_table(self):
+        if not self._has_cursor_table:
+            query = CURSOR_TABLE_SCHEMA.format(cursor_table=self.cursor_table_name)
+            self._query(query)
+            self._has_cursor_table = True
+
+    def select_cursors(self) -> Dict[int, int]:
+        self._ensure_cursor_table()
+        rows = self._query(
+            f"SELECT twitter_id, status_id FROM {self.cursor_table_name};"
+        )
+        return {row["twitter_id"]: row["status_id"] for row in rows}
+
+    def save_cursors(self, cursors: Dict[int, int]):
+        self._ensure_cursor_table()
+        table = self.cursor_table_name
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO {table} (twitter_id, status_id) VALUES (?, ?) "
+                    "ON CONFLICT(twitter_id) DO UPDATE "
+                    f"SET status_id = MAX({table}.status_id, excluded.status_id);",
+                    list(cursors.items()),
+                )
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK;")
+                raise
+            self._conn.execute("COMMIT;")
+
+    def _data_version(self) -> int:
+        # Changed only by commits of other connections
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version;").fetchone()[0]
+
+    def listen(
+        self,
+        on_notify: Callable[[str], None],
+        on_reload: Callable[[], None],
+        is_closed: Callable[[], bool],
+    ):
+        # SQLite has no notifications, so the whole table is reloaded on changes
+        version = None
+        while not is_closed():
+            try:
+                current = self._data_version()
+                if current != version:
+                    on_reload()
+                    version = current
+            except (sqlite3.Error, TCBotError):
+                # Connection is closed by close while polling
+                if is_closed():
+                    return
+                logger.exception("Failed to check changes of database.")
+                time.sleep(LISTEN_RETRY_SECONDS)
+                continue
+            time.sleep(LISTEN_POLL_SECONDS)
@@ -0,0 +1,54 @@
+import contextlib
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class StartupTimer:
+    def __init__(self, origin: Optional[float] = None):
+        # Offsets are measured from the origin, e.g. the start of the process
+        self.origin = time.perf_counter() if origin is None else origin
+        # Phases run on several threads at once
+        self._phases: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.reported = False
+
+    def _record(self, name: str, start: float, end: float):
+        with self._lock:
+            # Only the first run is recorded, e.g. on_ready is called on reconnection
+            if name not in self._phases:
+                self._phases[name] = (start - self.origin, end - self.origin)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter())
+
+    def mark(self, name: str):
+        # Milestone reached at this time
+        now = time.perf_counter()
+        self._record(name, now, now)
+
+    def phases(self) -> List[Tuple[str, float, float]]:
+        # (name, start, end) ordered by start
+        with self._lock:
+            items = [(name, s, e) for name, (s, e) in self._phases.items()]
+        items.sort(key=lambda item: (item[1], item[2]))
+        return items
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def report(self) -> str:
+        phases = self.phases()
+        total = max((e for _, _, e in phases), default=0.0)
+        parts = []
+        for name, start, end in phases:
+            if start == end:
+                parts.append(f"{name}: at {end:.3f}s")
+            else:
+                parts.append(f"{name}: {end - start:.3f}s ({start:.3f}-{end:.3f}s)")
+        return f"Started in {total:.3f}s. " + ", ".join(parts)
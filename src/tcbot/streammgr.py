@@ -0,0 +1,239 @@
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .logger import logger
+from .monitordb import MonitorDB
+from .matcher import MonitorMatcher
+from .reconnect import ReconnectScheduler
+from .tcstream import TweetCollectStream
+from .twauth import TwitterAuth
+
+# Maximum number of users followed by one streaming connection
+FOLLOW_LIMIT_PER_STREAM = 5000
+
+# Delay to collect a burst of monitor changes into one stream reconnection
+RESTART_DELAY_SECONDS = 5
+
+
+class StreamShard:
+    def __init__(self, index: int, tw_auth: TwitterAuth):
+        self.index = index
+        self.tw_auth = tw_auth
+        self.follow_ids: Set[int] = set()
+        self.stream: Optional[TweetCollectStream] = None
+        self.restarts = 0
+        self.reconnects = 0
+        self.started_at = None
+        self.connected_at = None
+
+    def health(self) -> Dict[str, Any]:
+        stream = self.stream
+        return {
+            "shard": self.index,
+            "follows": len(self.follow_ids),
+            "running": bool(stream and stream.running),
+            "restarts": self.restarts,
+            "reconnects": self.reconnects,
+            "started_at": self.started_at,
+            "connected_at": self.connected_at,
+            "statuses": stream.status_count if stream else 0,
+            "last_status_at": stream.last_status_at if stream else None,
+        }
+
+
+class StreamManager:
+    def __init__(
+        self,
+        client,
+        stream_auths: List[TwitterAuth],
+        monitor_db: MonitorDB,
+        loop,
+    ):
+        self.client = client
+        self.monitor_db = monitor_db
+        self.loop = loop
+        self.matcher: Optional[MonitorMatcher] = None
+
+        # One streaming connection per credential
+        self.shards = [StreamShard(i, auth) for i, auth in enumerate(stream_auths)]
+        self._shard_of: Dict[int, StreamShard] = {}
+        # Users not followed because all shards are full
+        self._unplaced: Set[int] = set()
+        self._dirty: Set[int] = set()
+        # Changes received before start, which are applied on top of the
+        # monitors given to start since they may be selected before the changes
+        self._pending: List[Callable[[], bool]] = []
+        self._lock = threading.Lock()
+        self._restart_handle = None
+        self.reconnector = ReconnectScheduler(loop)
+
+    def start(self, matcher: MonitorMatcher):
+        # Must be called on the event loop
+        with self._lock:
+            self.matcher = matcher
+            for tid in matcher.user_id_map:
+                self._assign(tid)
+            for change in self._pending:
+                change()
+            self._pending = []
+
+        for shard in self.shards:
+            self._restart_shard(shard)
+
+    def disconnect(self):
+        if self._restart_handle:
+            self._restart_handle.cancel()
+            self._restart_handle = None
+        self.reconnector.cancel()
+
+        for shard in self.shards:
+            if shard.stream:
+                shard.stream.disconnect()
+                shard.stream = None
+
+    def add(self, monitor: Dict[str, Any]):
+        # May be called from any thread
+        with self._lock:
+            if not self._add(monitor):
+                return
+        self.loop.call_soon_threadsafe(self._schedule_restart)
+
+    def remove(self, channel_id: int, twitter_id: int):
+        # May be called from any thread
+        with self._lock:
+            if not self._remove(channel_id, twitter_id):
+                return
+        self.loop.call_soon_threadsafe(self._schedule_restart)
+
+    def _add(self, monitor: Dict[str, Any]) -> bool:
+        # Must be called with the lock. Return True if a shard is changed.
+        if self.matcher is None:
+            self._pending.append(partial(self._add, monitor))
+            return False
+        if not self.matcher.add(monitor):
+            return False
+        shard = self._assign(monitor["twitter_id"])
+        if shard:
+            self._dirty.add(shard.index)
+        return True
+
+    def _remove(self, channel_id: int, twitter_id: int) -> bool:
+        # Must be called with the lock. Return True if a shard is changed.
+        if self.matcher is None:
+            self._pending.append(partial(self._remove, channel_id, twitter_id))
+            return False
+        if not self.matcher.remove(channel_id, twitter_id):
+            return False
+        shard = self._unassign(twitter_id)
+        if shard:
+            self._dirty.add(shard.index)
+
+        # Follow users left over by full shards
+        for tid in list(self._unplaced):
+            placed = self._assign(tid)
+            if placed is None:
+                break
+            self._dirty.add(placed.index)
+        return True
+
+    def health(self) -> List[Dict[str, Any]]:
+        return [shard.health() for shard in self.shards]
+
+    def reconnect_stats(self) -> Dict[str, Any]:
+        return self.reconnector.stats()
+
+    def _on_stream_connected(self, shard: StreamShard, stream: TweetCollectStream):
+        # Called from the stream thread
+        if shard.stream is not stream:
+            return
+        shard.connected_at = time.time()
+        self.reconnector.connected(shard.index)
+
+        # Fetch tweets posted while the shard was disconnected
+        with self._lock:
+            follow_ids = list(shard.follow_ids)
+        self.client.backfill.request(follow_ids)
+
+    def _on_stream_lost(
+        self, shard: StreamShard, stream: TweetCollectStream, kind: str
+    ):
+        # Called from the stream thread
+        if shard.stream is not stream:
+            return
+        self.reconnector.schedule(
+            shard.index, kind, lambda: self._reconnect_shard(shard, stream)
+        )
+
+    def _reconnect_shard(self, shard: StreamShard, stream: TweetCollectStream):
+        # Stream is already replaced by a restart
+        if shard.stream is not stream:
+            return
+        shard.reconnects += 1
+        self._restart_shard(shard)
+
+    def _assign(self, twitter_id: int) -> Optional[StreamShard]:
+        # Follow by the least loaded shard
+        self._unplaced.discard(twitter_id)
+        candidates = [
+            s for s in self.shards if len(s.follow_ids) < FOLLOW_LIMIT_PER_STREAM
+        ]
+        if not candidates:
+            logger.error(
+                f"Exceeded follow limit of all streams. twitter_id: {twitter_id}"
+            )
+            self._unplaced.add(twitter_id)
+            return None
+
+        shard = min(candidates, key=lambda s: len(s.follow_ids))
+        shard.follow_ids.add(twitter_id)
+        self._shard_of[twitter_id] = shard
+        return shard
+
+    def _unassign(self, twitter_id: int) -> Optional[StreamShard]:
+        self._unplaced.discard(twitter_id)
+        shard = self._shard_of.pop(twitter_id, None)
+        if shard:
+            shard.follow_ids.discard(twitter_id)
+        return shard
+
+    def _schedule_restart(self):
+        # Changes made while a restart is pending are applied by that restart
+        if self._restart_handle is None:
+            self._restart_handle = self.loop.call_later(
+                RESTART_DELAY_SECONDS, self._restart_dirty
+            )
+
+    def _restart_dirty(self):
+        self._restart_handle = None
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+
+        # Only shards whose follow list is changed are reconnected
+        for index in sorted(dirty):
+            self._restart_shard(self.shards[index])
+
+    def _restart_shard(self, shard: StreamShard):
+        if shard.stream:
+            shard.stream.disconnect()
+            shard.stream = None
+
+        with self._lock:
+            follow_ids = list(map(str, shard.follow_ids))
+        if not follow_ids:
+            return
+
+        shard.stream = TweetCollectStream(
+            self.client,
+            shard.tw_auth,
+            self.monitor_db,
+            self.loop,
+            matcher=self.matcher,
+            on_connected=lambda stream: self._on_stream_connected(shard, stream),
+            on_lost=lambda stream, kind: self._on_stream_lost(shard, stream, kind),
+        )
+        shard.stream.start(follow_ids)
+        shard.restarts += 1
+        shard.started_at = time.time()
+        logger.info(f"Started stream. shard: {shard.index}, follows: {len(follow_ids)}")
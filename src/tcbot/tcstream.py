@@ -1,17 +1,61 @@
-import asyncio
-import threading
 import time
-import re
 import requests
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 
 import tweepy
 import discord
 
 from .logger import logger
 from .monitordb import MonitorDB
+from .matcher import MonitorMatcher
+from .normalize import normalize_status, peek_user_ids
+from .metrics import MATCH_SECONDS, TWEETS_MATCHED, TWEETS_RECEIVED, TWEETS_UNMONITORED
+from .reconnect import ERROR_HTTP, ERROR_NETWORK, ERROR_RATE_LIMIT
 from .twauth import TwitterAuth
 
+# Status codes to back off as rate limited
+RATE_LIMIT_STATUS_CODES = (420, 429)
+
+
+def classify_error(exception: Exception) -> str:
+    if isinstance(exception, requests.exceptions.HTTPError):
+        response = exception.response
+        if response is not None and response.status_code in RATE_LIMIT_STATUS_CODES:
+            return ERROR_RATE_LIMIT
+        return ERROR_HTTP
+    elif isinstance(exception, requests.exceptions.RequestException):
+        # Connection reset, timeout, broken chunk and so on
+        return ERROR_NETWORK
+    return ERROR_HTTP
+
+
+def handle_status(client: discord.Client, matcher: MonitorMatcher, status):
+    # Shared by statuses of the stream and the backfill
+    # For some reason, get tweets of other users
+    user_id = status.user.id
+    if user_id not in matcher:
+        TWEETS_UNMONITORED.inc()
+        return
+
+    client.backfill.seen(user_id, status.id)
+
+    # Format tweet with full text, expanded links and quoted tweet
+    expand_text = normalize_status(status._json, client.url_field)
+
+    start = time.perf_counter()
+    matched = matcher.match(user_id, expand_text)
+    MATCH_SECONDS.observe(time.perf_counter() - start)
+    if client.tracer.enabled:
+        client.tracer.matched(status.id, [m["channel_id"] for m in matched])
+    if not matched:
+        logger.debug("status.text is not matched with regular expression")
+        return
+
+    TWEETS_MATCHED.inc()
+    url = f"https://twitter.com/{status.user.screen_name}/status/{status.id}"
+    for m in matched:
+        client.delivery.submit(m["channel_id"], url, status.id)
+
 
 class TweetCollectStream(tweepy.Stream):
     def __init__(
@@ -20,6 +64,9 @@ class TweetCollectStream(tweepy.Stream):
         tw_auth: TwitterAuth,
         monitor_db: MonitorDB,
         loop,
+        matcher: MonitorMatcher = None,
+        on_connected: Optional[Callable[["TweetCollectStream"], None]] = None,
+        on_lost: Optional[Callable[["TweetCollectStream", str], None]] = None,
     ):
         super().__init__(
             tw_auth.consumer_key,
@@ -31,62 +78,59 @@ class TweetCollectStream(tweepy.Stream):
         self.client = client
         self.loop = loop
         self.thread = None
-        self.user_id_map = None
-
-        # Create a monitor dictonary searched from twitter id
-        monitors: List[Dict[str:Any]] = monitor_db.select()
-        user_id_map: Dict[int : List[Dict[str:Any]]] = {}
-        for m in monitors:
-            tid = m["twitter_id"]
-            if tid not in user_id_map:
-                user_id_map[tid] = []
-            user_id_map[tid].append(m)
-
-        self.user_id_map = user_id_map
-
-    async def _reconnect(self, timeout_seconds):
-        monitor_users = list(map(str, self.user_id_map.keys()))
-        if monitor_users:
-            # Wait stream is disconnected
-            count = 0
-            while self.running:
-                time.sleep(1)
-                count += 1
-                if count >= timeout_seconds:
-                    logger.error("Reconnection is canceled because timed out.")
-                    return
-            self.filter(follow=monitor_users, threaded=True)
+        # Called from the stream thread to let the owner reconnect
+        self._on_connected = on_connected
+        self._on_lost = on_lost
 
-    def on_status(self, status):
-        # Get new tweet
-        # For some reason, get tweets of other users
-        user_id = status.user.id
-        if user_id not in self.user_id_map:
-            return
+        # Precompile patterns of all monitors unless the running matcher is taken over
+        if matcher is None:
+            monitors: List[Dict[str, Any]] = monitor_db.select()
+            matcher = MonitorMatcher(monitors)
+
+        self.matcher = matcher
+        self.user_id_map = self.matcher.user_id_map
 
-        # Format tweet
-        expand_text = status.text
-        for e in status.entities["urls"]:
-            expand_text = expand_text.replace(e["url"], e["display_url"])
+        # Users followed by this connection
+        self.follow_ids: List[str] = []
+        self.status_count = 0
+        self.last_status_at = None
 
-        for m in self.user_id_map[user_id]:
-            # Not matched
-            if m["match_ptn"] and not re.search(m["match_ptn"], expand_text):
-                logger.debug("status.text is not matched with regular expression")
-                continue
+    def start(self, follow_ids: List[str]):
+        self.follow_ids = follow_ids
+        self.filter(follow=follow_ids, threaded=True)
 
-            url = f"https://twitter.com/{status.user.screen_name}/status/{status.id}"
-            channel = self.client.get_channel(m["channel_id"])
-            future = asyncio.run_coroutine_threadsafe(channel.send(url), self.loop)
-            future.result()
+    def on_connect(self):
+        super().on_connect()
+        if self._on_connected:
+            self._on_connected(self)
+
+    def on_data(self, raw_data):
+        # Tweets of other users, e.g. replies to followed users, are most of the
+        # stream, so they are dropped before tweepy builds the models. Only
+        # dropped if no user is monitored, since the author is one of them.
+        user_ids = peek_user_ids(raw_data)
+        if user_ids is not None and not any(u in self.matcher for u in user_ids):
+            self.status_count += 1
+            self.last_status_at = time.time()
+            TWEETS_RECEIVED.inc()
+            TWEETS_UNMONITORED.inc()
+            return
+        return super().on_data(raw_data)
+
+    def on_status(self, status):
+        self.status_count += 1
+        self.last_status_at = time.time()
+        TWEETS_RECEIVED.inc()
+        self.client.tracer.received(status.id)
+        handle_status(self.client, self.matcher, status)
 
     def on_exception(self, exception):
         # Stream is already disconnected
         super().on_exception(exception)
 
-        if isinstance(exception, requests.exceptions.ChunkedEncodingError):
-            # Recconect stream because connection is reset by peer
-            logger.info("Running _recconect() asynchronously.")
-            asyncio.run_coroutine_threadsafe(self._reconnect(60), self.loop)
+        kind = classify_error(exception)
+        if self._on_lost:
+            # Owner reconnects by a new stream after backoff
+            self._on_lost(self, kind)
         else:
-            logger.error("Catch not expected exception")
+            logger.error(f"Stream is lost and not reconnected. error: {kind}")
@@ -0,0 +1,204 @@
+import argparse
+import collections
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .logger import logger
+from .exception import TCBotError
+
+# Status ids are snowflakes holding milliseconds since the epoch of Twitter
+TWITTER_EPOCH_MS = 1288834974657
+TIMESTAMP_SHIFT = 22
+
+# Traces waiting for the next stage, the oldest are discarded beyond this
+MAX_ACTIVE_TRACES = 10000
+
+# Stages in a line of trace log, written in microseconds since the Unix epoch
+STAGES = ("created", "received", "matched", "enqueued", "sent")
+# Segments between stages reported by the summary
+SEGMENTS = (
+    ("twitter", "created", "received"),
+    ("matcher", "received", "matched"),
+    ("handover", "matched", "enqueued"),
+    ("discord", "enqueued", "sent"),
+    ("total", "created", "sent"),
+)
+MISSING = "-"
+
+
+def snowflake_to_ms(status_id: int) -> int:
+    return (status_id >> TIMESTAMP_SHIFT) + TWITTER_EPOCH_MS
+
+
+def _now_us() -> int:
+    return int(time.time() * 1e6)
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 0.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.enabled = path is not None and sample_rate > 0
+
+        self._lock = threading.Lock()
+        self._file = None
+        # Ordered from the oldest trace
+        self._traces: collections.OrderedDict = collections.OrderedDict()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def received(self, status_id: int):
+        # Called for every tweet, so return quickly unless sampled
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+
+        with self._lock:
+            self._traces[status_id] = {"received": _now_us(), "channels": {}}
+            while len(self._traces) > MAX_ACTIVE_TRACES:
+                self._traces.popitem(last=False)
+
+    def matched(self, status_id: int, channel_ids: List[int]):
+        if not self._traces:
+            return
+
+        with self._lock:
+            trace = self._traces.get(status_id)
+            if trace is None:
+                return
+
+            trace["matched"] = _now_us()
+            if not channel_ids:
+                # Unmatched tweets are traced up to matching
+                self._write(status_id, None, trace, None, None)
+                del self._traces[status_id]
+                return
+            trace["channels"] = {cid: None for cid in channel_ids}
+
+    def enqueued(self, status_id: int, channel_id: int):
+        if not self._traces:
+            return
+
+        with self._lock:
+            trace = self._traces.get(status_id)
+            if trace is not None and channel_id in trace["channels"]:
+                trace["channels"][channel_id] = _now_us()
+
+    def sent(self, status_id: int, channel_id: int, ok: bool = True):
+        # ok is False when the tweet is dropped, skipped or failed to be sent
+        if not self._traces:
+            return
+
+        with self._lock:
+            trace = self._traces.get(status_id)
+            if trace is None or channel_id not in trace["channels"]:
+                return
+
+            enqueued = trace["channels"].pop(channel_id)
+            self._write(
+                status_id, channel_id, trace, enqueued, _now_us() if ok else None
+            )
+            if not trace["channels"]:
+                del self._traces[status_id]
+
+    def _write(
+        self,
+        status_id: int,
+        channel_id: Optional[int],
+        trace: Dict,
+        enqueued: Optional[int],
+        sent: Optional[int],
+    ):
+        values = [
+            status_id,
+            channel_id,
+            snowflake_to_ms(status_id) * 1000,
+            trace["received"],
+            trace.get("matched"),
+            enqueued,
+            sent,
+        ]
+        line = " ".join(MISSING if v is None else str(v) for v in values) + "\n"
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+        except OSError:
+            # Tracing never stops delivery
+            logger.exception(f"Failed to write trace. file_name: {self.path}")
+            self.enabled = False
+
+
+def parse(lines: Iterable[str]) -> List[Dict[str, Optional[int]]]:
+    records = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        values = line.split()
+        if len(values) != len(STAGES) + 2:
+            raise TCBotError(f"Invalid trace line. line: {line}")
+        values = [None if v == MISSING else int(v) for v in values]
+        record = {"status_id": values[0], "channel_id": values[1]}
+        record.update(zip(STAGES, values[2:]))
+        records.append(record)
+    return records
+
+
+def _percentile(values: List[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(records: List[Dict[str, Optional[int]]]) -> Dict[str, Dict[str, float]]:
+    # Percentiles of each segment in milliseconds
+    summary = {}
+    for name, start, end in SEGMENTS:
+        values = sorted(
+            (r[end] - r[start]) / 1000
+            for r in records
+            if r[start] is not None and r[end] is not None
+        )
+        if not values:
+            continue
+        summary[name] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.5),
+            "p90": _percentile(values, 0.9),
+            "p99": _percentile(values, 0.99),
+            "max": values[-1],
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize trace log of tweets")
+    parser.add_argument("files", metavar="FILEPATH", nargs="+", help="trace log file")
+    args = parser.parse_args()
+
+    records = []
+    for file_name in args.files:
+        with open(file_name) as f:
+            records.extend(parse(f))
+
+    unsent = sum(
+        1 for r in records if r["channel_id"] is not None and r["sent"] is None
+    )
+    print(f"traces: {len(records)}, unsent: {unsent}")
+    print(
+        f"{'segment':>9} {'count':>7} {'p50 [ms]':>10} {'p90 [ms]':>10} {'p99 [ms]':>10} {'max [ms]':>10}"
+    )
+    for name, stats in summarize(records).items():
+        print(
+            f"{name:>9} {stats['count']:>7} {stats['p50']:>10.1f} {stats['p90']:>10.1f} "
+            f"{stats['p99']:>10.1f} {stats['max']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
+from typing import Dict, Iterable, List, Optional
+
 import tweepy
 
+from .logger import logger
 from .exception import TCBotError
+from .cache import TTLCache
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 60 * 60
+# Maximum number of users per request of users/lookup
+LOOKUP_USERS_BATCH_SIZE = 100
+# Error code returned when no user in the request exists
+NO_USER_MATCHES_CODE = 17
 
 
 class TwitterAuth:
@@ -26,3 +37,92 @@ class TwitterAuth:
 
         self.api = api
         self.auth = auth
+
+        # Cache of twitter id <-> screen name
+        self._screen_names = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+        self._user_ids = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+    def _cache_user(self, user):
+        self._screen_names.set(user.id, user.screen_name)
+        self._user_ids.set(user.screen_name.lower(), user.id)
+
+    def _lookup_users(self, **kwargs) -> List:
+        try:
+            return self.api.lookup_users(**kwargs)
+        except tweepy.RateLimitError:
+            raise
+        except tweepy.TweepError as exc:
+            # No user in the batch exists
+            if getattr(exc, "api_code", None) == NO_USER_MATCHES_CODE:
+                return []
+            raise
+
+    def lookup_user_ids(self, screen_names: Iterable[str]) -> Dict[str, int]:
+        # Return ids of existing users keyed by lower-cased screen name
+        user_ids: Dict[str, int] = {}
+        misses: List[str] = []
+        for name in screen_names:
+            key = name.lower()
+            user_id = self._user_ids.get(key)
+            if user_id is None:
+                misses.append(key)
+            else:
+                user_ids[key] = user_id
+
+        misses = list(dict.fromkeys(misses))
+        for i in range(0, len(misses), LOOKUP_USERS_BATCH_SIZE):
+            batch = misses[i : i + LOOKUP_USERS_BATCH_SIZE]
+            try:
+                users = self._lookup_users(screen_names=batch)
+            except tweepy.RateLimitError as exc:
+                # Resolve by expired entries while rate limited
+                logger.error("Rate limit exceeded on users/lookup.")
+                for key in misses[i:]:
+                    user_id = self._user_ids.get(key, stale=True)
+                    if user_id is None:
+                        raise TCBotError(
+                            f"Failed to resolve user by rate limit. screen_name: {key}"
+                        ) from exc
+                    user_ids[key] = user_id
+                break
+
+            for user in users:
+                self._cache_user(user)
+                user_ids[user.screen_name.lower()] = user.id
+
+        return user_ids
+
+    def lookup_screen_names(self, user_ids: Iterable[int]) -> Dict[int, str]:
+        # Return screen names of existing users. Unresolved ids are omitted
+        screen_names: Dict[int, str] = {}
+        misses: List[int] = []
+        for user_id in user_ids:
+            name = self._screen_names.get(user_id)
+            if name is None:
+                misses.append(user_id)
+            else:
+                screen_names[user_id] = name
+
+        misses = list(dict.fromkeys(misses))
+        for i in range(0, len(misses), LOOKUP_USERS_BATCH_SIZE):
+            batch = misses[i : i + LOOKUP_USERS_BATCH_SIZE]
+            try:
+                users = self._lookup_users(user_ids=batch)
+            except tweepy.RateLimitError:
+                # Resolve by expired entries while rate limited
+                logger.error("Rate limit exceeded on users/lookup.")
+                for user_id in misses[i:]:
+                    name = self._screen_names.get(user_id, stale=True)
+                    if name is not None:
+                        screen_names[user_id] = name
+                break
+
+            for user in users:
+                self._cache_user(user)
+                screen_names[user.id] = user.screen_name
+
+        return screen_names
+
+    def get_user_id(self, screen_name: str) -> Optional[int]:
+        # Return None if the user does not exist
+        return self.lookup_user_ids([screen_name]).get(screen_name.lower())
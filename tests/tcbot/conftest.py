@@ -0,0 +1,25 @@
+import asyncio
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def loop():
+    # Event loop running on its own thread as the bot does
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="loop_thread")
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def run(loop):
+    # Run a coroutine on the loop and wait for the result
+    def _run(coro, timeout: float = 5):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=timeout)
+
+    return _run
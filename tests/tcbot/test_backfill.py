@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from tcbot.backfill import Backfiller, RateBudget
+from tcbot.matcher import MonitorMatcher
+from tcbot.normalize import URL_FIELD_EXPANDED
+from tcbot.trace import Tracer
+
+
+def _status(twitter_id, status_id, text="text"):
+    user = SimpleNamespace(id=twitter_id, screen_name=f"user{twitter_id}")
+    # Timelines are fetched with full_text instead of text
+    data = {"id": status_id, "full_text": text, "entities": {"urls": []}}
+    return SimpleNamespace(id=status_id, user=user, _json=data)
+
+
+class FakeAPI:
+    def __init__(self, timelines):
+        self.timelines = timelines
+        self.calls = []
+
+    def user_timeline(self, user_id, since_id, count, max_id=None, tweet_mode=None):
+        self.calls.append((user_id, since_id, max_id))
+        statuses = [
+            s
+            for s in self.timelines.get(user_id, [])
+            if s.id > since_id and (max_id is None or s.id <= max_id)
+        ]
+        # Newest first as the API does
+        return sorted(statuses, key=lambda s: s.id, reverse=True)[:count]
+
+
+class FakeMonitorDB:
+    def __init__(self, cursors=None):
+        self.cursors = dict(cursors or {})
+
+    def select_cursors(self):
+        return dict(self.cursors)
+
+    def save_cursors(self, cursors):
+        for tid, sid in cursors.items():
+            self.cursors[tid] = max(sid, self.cursors.get(tid, 0))
+
+
+class FakeDelivery:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, channel_id, msg, status_id=None):
+        self.submitted.append((channel_id, msg))
+
+
+class FakeClient:
+    def __init__(self, monitors):
+        self.streams = SimpleNamespace(matcher=MonitorMatcher(monitors))
+        self.delivery = FakeDelivery()
+        self.tracer = Tracer()
+        self.url_field = URL_FIELD_EXPANDED
+        self.backfill = None
+
+
+@pytest.fixture
+def create_backfiller(loop, run):
+    backfillers = []
+
+    def _create(monitors, timelines, cursors):
+        client = FakeClient(monitors)
+        tw_auth = SimpleNamespace(api=FakeAPI(timelines))
+        monitor_db = FakeMonitorDB(cursors)
+        backfill = Backfiller(client, tw_auth, monitor_db, loop)
+        client.backfill = backfill
+        run(backfill.start())
+        backfillers.append(backfill)
+        return backfill
+
+    yield _create
+    for backfill in backfillers:
+        run(backfill.close())
+
+
+def _wait_until(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+class TestBackfiller:
+    def test_backfill_in_order(self, create_backfiller):
+        monitors = [{"channel_id": 1, "twitter_id": 10, "match_ptn": None}]
+        timelines = {10: [_status(10, i) for i in range(100, 106)]}
+        backfill = create_backfiller(monitors, timelines, {10: 102})
+
+        backfill.request([10])
+        _wait_until(lambda: backfill.backfilled == 3)
+        submitted = backfill.client.delivery.submitted
+        assert submitted == [
+            (1, f"https://twitter.com/user10/status/{i}") for i in (103, 104, 105)
+        ]
+        assert backfill.cursors[10] == 105
+
+    def test_backfill_through_matcher(self, create_backfiller):
+        monitors = [{"channel_id": 1, "twitter_id": 10, "match_ptn": "foo"}]
+        timelines = {10: [_status(10, 101, "foo"), _status(10, 102, "bar")]}
+        backfill = create_backfiller(monitors, timelines, {10: 100})
+
+        backfill.request([10])
+        _wait_until(lambda: backfill.backfilled == 2)
+        assert backfill.client.delivery.submitted == [
+            (1, "https://twitter.com/user10/status/101")
+        ]
+
+    def test_skip_user_never_seen(self, create_backfiller):
+        monitors = [{"channel_id": 1, "twitter_id": 10, "match_ptn": None}]
+        timelines = {10: [_status(10, 101)]}
+        backfill = create_backfiller(monitors, timelines, {})
+
+        backfill.request([10])
+        time.sleep(0.1)
+        assert backfill.tw_auth.api.calls == []
+
+    def test_paginate(self, create_backfiller, monkeypatch):
+        monkeypatch.setattr("tcbot.backfill.BACKFILL_PAGE_SIZE", 2)
+        monitors = [{"channel_id": 1, "twitter_id": 10, "match_ptn": None}]
+        timelines = {10: [_status(10, i) for i in range(100, 106)]}
+        backfill = create_backfiller(monitors, timelines, {10: 100})
+
+        backfill.request([10])
+        _wait_until(lambda: backfill.backfilled == 5)
+        assert [c[2] for c in backfill.tw_auth.api.calls] == [None, 103, 101, 100]
+
+    def test_blocking_submit_keeps_loop_running(self, create_backfiller, run):
+        monitors = [{"channel_id": 1, "twitter_id": 10, "match_ptn": None}]
+        timelines = {10: [_status(10, 101)]}
+        backfill = create_backfiller(monitors, timelines, {10: 100})
+
+        # Submit blocks as on a full queue with block backpressure
+        entered = threading.Event()
+        release = threading.Event()
+
+        def _submit(channel_id, msg, status_id=None):
+            entered.set()
+            release.wait(5)
+
+        backfill.client.delivery.submit = _submit
+        backfill.request([10])
+        assert entered.wait(5)
+        run(asyncio.sleep(0))
+        release.set()
+        _wait_until(lambda: backfill.backfilled == 1)
+
+    def test_flush_cursors(self, create_backfiller, run):
+        backfill = create_backfiller([], {}, {10: 100})
+        backfill.seen(10, 105)
+        backfill.seen(10, 103)
+        backfill.seen(20, 200)
+        run(backfill.flush())
+        assert backfill.monitor_db.cursors == {10: 105, 20: 200}
+
+
+class TestRateBudget:
+    def test_wait_for_window(self):
+        budget = RateBudget(2, 0.1)
+
+        async def _acquire():
+            start = time.monotonic()
+            for _ in range(3):
+                await budget.acquire()
+            return time.monotonic() - start
+
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(_acquire()) >= 0.1
+        finally:
+            loop.close()
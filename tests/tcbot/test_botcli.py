@@ -61,6 +61,15 @@ class TestBotClient:
             5,
         )
 
+    def test_add_account_with_slow_regular_expression(self, config, empty_monitor_db):
+        assert eval_send_messages(
+            config,
+            empty_monitor_db,
+            [r"!tc add tt4bot '(a+)+$'"],
+            [r"^\[ERROR\] 正規表現の処理に時間がかかりすぎます．正規表現: \(a\+\)\+\$$"],
+            10,
+        )
+
     def test_add_not_exist_account(self, config, empty_monitor_db):
         assert eval_send_messages(
             config,
@@ -93,6 +102,22 @@ class TestBotClient:
             5,
         )
 
+    def test_add_multiple_accounts(self, config, empty_monitor_db):
+        assert eval_send_messages(
+            config,
+            empty_monitor_db,
+            [
+                r"!tc add tt4bot , TwitterJP 'mildom\.com' , NON_EXSITING_ACCOUNT_202102212056"
+            ],
+            [
+                r"^\[INFO\] アカウントの登録結果:"
+                r"\r・成功: アカウント名: tt4bot, 正規表現: None"
+                r"\r・成功: アカウント名: TwitterJP, 正規表現: 'mildom\\\\\.com'"
+                r"\r・失敗: 存在しないアカウントです．アカウント名: NON_EXSITING_ACCOUNT_202102212056$"
+            ],
+            5,
+        )
+
     # remove command
     def test_remove_added_account(self, config, empty_monitor_db):
         assert eval_send_messages(
@@ -132,6 +157,23 @@ class TestBotClient:
             5,
         )
 
+    def test_remove_multiple_accounts(self, config, empty_monitor_db):
+        db = empty_monitor_db
+        db.insert(config.test_channel_id, TT4BOT_USER_ID, None)
+        db.insert(config.test_channel_id, TWITTER_JP_USER_ID, r"mildom\.com")
+        assert eval_send_messages(
+            config,
+            db,
+            ["!tc remove tt4bot TwitterJP tt4bot"],
+            [
+                r"^\[INFO\] アカウントの削除結果:"
+                r"\r・成功: アカウント名: tt4bot"
+                r"\r・成功: アカウント名: TwitterJP"
+                r"\r・失敗: 登録されていないアカウントです．アカウント名: tt4bot$"
+            ],
+            5,
+        )
+
     # list command
     def test_list_with_empty_accounts(self, config, empty_monitor_db):
         assert eval_send_messages(
@@ -180,6 +222,24 @@ class TestBotClient:
             5,
         )
 
+    def test_stats(self, config, empty_monitor_db):
+        assert eval_send_messages(
+            config,
+            empty_monitor_db,
+            ["!tc stats"],
+            [r"^\[INFO\] 統計情報:\r・受信ツイート: \d+（監視対象外: \d+, マッチ: \d+）\r"],
+            5,
+        )
+
+    def test_profile_with_invalid_seconds(self, config, empty_monitor_db):
+        assert eval_send_messages(
+            config,
+            empty_monitor_db,
+            ["!tc profile 0"],
+            [r"^\[ERROR\] 秒数が不正です．1から300の整数を指定してください．$"],
+            5,
+        )
+
     def test_help(self, config, empty_monitor_db):
         assert eval_send_messages(
             config,
@@ -190,8 +250,12 @@ class TestBotClient:
                 r"\r・!tc add <アカウント名> \[<正規表現パターン>\]: 収集対象のアカウントを登録"
                 r"\r　例: !tc add moujaatumare 'mildom\\\\\.com'"
                 r"\r　動作: 'mildom\.com'を含むなるおのツイートのみ抽出（短縮リンクは展開）"
-                r"\r・!tc remove <アカウント名>: 登録済みのアカウントを削除"
+                r"\r　複数のアカウントは','で区切って一度に登録可能"
+                r"\r　例: !tc add moujaatumare , TwitterJP 'mildom\\\\\.com'"
+                r"\r・!tc remove <アカウント名> \[<アカウント名> \.\.\.\]: 登録済みのアカウントを削除"
                 r"\r・!tc list: 登録済みのアカウントの一覧表示"
+                r"\r・!tc stats: 統計情報を表示"
+                r"\r・!tc profile \[<秒数>\] \[collapsed\|pstats\]: 処理時間のプロファイルを出力"
                 r"\r・!tc help: コマンド仕様を表示$"
             ],
             5,
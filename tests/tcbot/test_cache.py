@@ -0,0 +1,39 @@
+import time
+
+from tcbot.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_set_and_get(self):
+        cache = TTLCache(10, 60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert "a" in cache
+        assert cache.get("b") is None
+        assert cache.get("b", 0) == 0
+
+    def test_expire(self):
+        cache = TTLCache(10, 0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert "a" not in cache
+        assert cache.get("a", stale=True) == 1
+
+    def test_evict_least_recently_used(self):
+        cache = TTLCache(2, 60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_pop(self):
+        cache = TTLCache(10, 60)
+        cache.set("a", 1)
+        assert cache.pop("a") == 1
+        assert cache.pop("a") is None
+        assert len(cache) == 0
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from tcbot.channels import ChannelCache
+
+
+class FakeClient:
+    def __init__(self, channel_ids):
+        self.channels = {cid: SimpleNamespace(id=cid) for cid in channel_ids}
+        self.calls = 0
+
+    def get_channel(self, channel_id):
+        self.calls += 1
+        return self.channels.get(channel_id)
+
+
+class TestChannelCache:
+    def test_resolve_once(self):
+        client = FakeClient([1])
+        cache = ChannelCache(client.get_channel)
+        assert cache.resolve(1) is client.channels[1]
+        assert cache.resolve(1) is client.channels[1]
+        assert client.calls == 1
+
+    def test_quarantine_not_found_channel(self):
+        client = FakeClient([])
+        quarantined = []
+        cache = ChannelCache(client.get_channel, on_quarantined=quarantined.append)
+        assert cache.resolve(1) is None
+        assert cache.resolve(1) is None
+        assert client.calls == 1
+        assert cache.is_quarantined(1)
+        assert quarantined == [1]
+
+    def test_release(self):
+        client = FakeClient([1])
+        released = []
+        cache = ChannelCache(client.get_channel, on_released=released.append)
+        cache.quarantine(1)
+        assert cache.resolve(1) is None
+
+        cache.release(1)
+        cache.release(1)
+        assert released == [1]
+        assert cache.resolve(1) is client.channels[1]
+
+    def test_invalidate(self):
+        client = FakeClient([1, 2])
+        cache = ChannelCache(client.get_channel)
+        cache.resolve(1)
+        cache.resolve(2)
+        cache.invalidate([1])
+        cache.resolve(1)
+        cache.resolve(2)
+        assert client.calls == 3
+
+        cache.invalidate()
+        cache.resolve(2)
+        assert client.calls == 4
@@ -62,3 +62,103 @@ class TestConfig:
             TCBotError, match=r"Invalid parameter is included. param: .+$"
         ):
             Config(cpath / "config/with_invalid_param.json")
+
+    def test_initialize_with_delivery_params(self):
+        config = Config(cpath / "config/with_delivery_params.json")
+        assert config.delivery_queue_size == 100
+        assert config.delivery_workers == 2
+        assert config.delivery_backpressure == "drop_oldest"
+        assert config.delivery_coalesce_seconds == 1.5
+
+    def test_initialize_with_default_delivery_params(self):
+        config = Config(cpath / "config/valid_json_file.json")
+        assert config.delivery_queue_size == 1000
+        assert config.delivery_workers == 8
+        assert config.delivery_backpressure == "block"
+        assert config.delivery_coalesce_seconds == 0.5
+
+    def test_initialize_with_invalid_delivery_backpressure(self):
+        with pytest.raises(
+            TCBotError, match=r"^delivery_backpressure must be one of .+$"
+        ):
+            Config(cpath / "config/with_invalid_delivery_backpressure.json")
+
+    def test_initialize_with_invalid_delivery_queue_size(self):
+        with pytest.raises(
+            TCBotError, match=r"^delivery_queue_size must be a positive integer\..*$"
+        ):
+            Config(cpath / "config/with_invalid_delivery_queue_size.json")
+
+    def test_initialize_with_stream_credentials(self):
+        config = Config(cpath / "config/with_stream_credentials.json")
+        assert len(config.stream_credentials) == 2
+
+    def test_initialize_with_invalid_stream_credentials(self):
+        with pytest.raises(
+            TCBotError, match=r"^stream_credentials must consist of .+\.$"
+        ):
+            Config(cpath / "config/with_invalid_stream_credentials.json")
+
+    def test_initialize_with_dedup_params(self):
+        config = Config(cpath / "config/with_dedup_params.json")
+        assert config.dedup_size == 10
+        assert config.dedup_path == "/tmp/tcbot_dedup.txt"
+
+    def test_initialize_with_invalid_dedup_size(self):
+        with pytest.raises(
+            TCBotError, match=r"^dedup_size must be a positive integer\..*$"
+        ):
+            Config(cpath / "config/with_invalid_dedup_size.json")
+
+    def test_initialize_with_metrics_port(self):
+        config = Config(cpath / "config/with_metrics_port.json")
+        assert config.metrics_port == 9100
+
+    def test_initialize_with_invalid_metrics_port(self):
+        with pytest.raises(
+            TCBotError, match=r"^metrics_port must be a port number\..*$"
+        ):
+            Config(cpath / "config/with_invalid_metrics_port.json")
+
+    def test_initialize_with_trace_params(self):
+        config = Config(cpath / "config/with_trace_params.json")
+        assert config.trace_path == "/tmp/tcbot_trace.log"
+        assert config.trace_sample_rate == 0.1
+
+    def test_initialize_with_invalid_trace_sample_rate(self):
+        with pytest.raises(
+            TCBotError, match=r"^trace_sample_rate must be between 0 and 1\..*$"
+        ):
+            Config(cpath / "config/with_invalid_trace_sample_rate.json")
+
+    def test_initialize_with_profile_dir(self):
+        config = Config(cpath / "config/with_profile_dir.json")
+        assert config.profile_dir == "/tmp/tcbot_profiles"
+
+    def test_initialize_with_url_field(self):
+        config = Config(cpath / "config/with_url_field.json")
+        assert config.url_field == "display_url"
+
+    def test_initialize_with_invalid_url_field(self):
+        with pytest.raises(TCBotError, match=r"^url_field must be one of .*$"):
+            Config(cpath / "config/with_invalid_url_field.json")
+
+    def test_initialize_with_invalid_regex_engine(self):
+        with pytest.raises(TCBotError, match=r"^regex_engine must be one of .*$"):
+            Config(cpath / "config/with_invalid_regex_engine.json")
+
+    def test_initialize_with_snapshot_path(self):
+        config = Config(cpath / "config/with_snapshot_path.json")
+        assert config.snapshot_path == "/tmp/tcbot_monitors.snapshot"
+
+    def test_initialize_with_invalid_snapshot_path(self):
+        with pytest.raises(TCBotError, match=r"^snapshot_path must be a string\..*$"):
+            Config(cpath / "config/with_invalid_snapshot_path.json")
+
+    def test_initialize_with_journal_path(self):
+        config = Config(cpath / "config/with_journal_path.json")
+        assert config.journal_path == "/tmp/tcbot_journal.db"
+
+    def test_initialize_with_invalid_journal_path(self):
+        with pytest.raises(TCBotError, match=r"^journal_path must be a string\..*$"):
+            Config(cpath / "config/with_invalid_journal_path.json")
@@ -0,0 +1,56 @@
+from tcbot.dedup import DedupCache
+
+
+class TestDedupCache:
+    def test_check(self):
+        dedup = DedupCache(10)
+        assert not dedup.check(1, 100)
+        assert dedup.check(1, 100)
+        assert not dedup.check(2, 100)
+        assert dedup.hits == 1
+        assert dedup.misses == 2
+        assert dedup.hit_rate == 1 / 3
+
+    def test_discard(self):
+        dedup = DedupCache(10)
+        dedup.check(1, 100)
+        dedup.discard(1, 100)
+        dedup.discard(2, 200)
+        assert not dedup.check(1, 100)
+
+    def test_evict_least_recently_seen(self):
+        dedup = DedupCache(2)
+        dedup.check(1, 100)
+        dedup.check(1, 101)
+        dedup.check(1, 100)
+        dedup.check(1, 102)
+        assert len(dedup) == 2
+        assert (1, 101) not in dedup
+        assert (1, 100) in dedup
+
+    def test_save_and_load(self, tmp_path):
+        path = str(tmp_path / "dedup.txt")
+        dedup = DedupCache(10, path)
+        dedup.check(1, 100)
+        dedup.check(2, 200)
+        dedup.save()
+
+        loaded = DedupCache(10, path)
+        assert loaded.check(1, 100)
+        assert loaded.check(2, 200)
+
+    def test_load_most_recent_entries(self, tmp_path):
+        path = str(tmp_path / "dedup.txt")
+        dedup = DedupCache(10, path)
+        for i in range(5):
+            dedup.check(1, i)
+        dedup.save()
+
+        loaded = DedupCache(2, path)
+        assert len(loaded) == 2
+        assert (1, 4) in loaded
+        assert (1, 0) not in loaded
+
+    def test_load_missing_file(self, tmp_path):
+        dedup = DedupCache(10, str(tmp_path / "dedup.txt"))
+        assert len(dedup) == 0
@@ -0,0 +1,291 @@
+import asyncio
+
+import pytest
+
+from tcbot.delivery import DeliveryQueue
+from tcbot.dedup import DedupCache
+from tcbot.journal import DeliveryJournal
+from tcbot.trace import Tracer, parse
+from tcbot.exception import TCBotError
+
+
+class FakeHTTPException(Exception):
+    def __init__(self, status):
+        super().__init__(f"status: {status}")
+        self.status = status
+
+
+class FakeChannel:
+    def __init__(self, channel_id, gate=None, status=None):
+        self.id = channel_id
+        self.gate = gate
+        # Status of error raised on sending
+        self.status = status
+        self.sent = []
+        self.messages = []
+
+    async def send(self, msg):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.status is not None:
+            raise FakeHTTPException(self.status)
+        self.sent.append(msg)
+        self.messages.extend(msg.split("\n"))
+
+
+class FakeClient:
+    def __init__(self, channels):
+        self.channels = {c.id: c for c in channels}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+async def _start(queue):
+    queue.start()
+
+
+@pytest.fixture
+def create_queue(loop, run):
+    def _create(channels, **kwargs):
+        kwargs.setdefault("coalesce_seconds", 0)
+        queue = DeliveryQueue(FakeClient(channels), loop, **kwargs)
+        run(_start(queue))
+        return queue
+
+    return _create
+
+
+class TestDeliveryQueue:
+    def test_invalid_backpressure(self, loop):
+        with pytest.raises(TCBotError, match=r"^Invalid backpressure\. .+$"):
+            DeliveryQueue(FakeClient([]), loop, backpressure="INVALID")
+
+    def test_deliver_in_order_per_channel(self, run, create_queue):
+        ch1, ch2 = FakeChannel(1), FakeChannel(2)
+        queue = create_queue([ch1, ch2])
+        for i in range(10):
+            queue.submit(1, f"a{i}")
+            queue.submit(2, f"b{i}")
+        run(queue.join())
+
+        assert ch1.messages == [f"a{i}" for i in range(10)]
+        assert ch2.messages == [f"b{i}" for i in range(10)]
+        assert queue.delivered == 20
+        assert queue.depth == 0
+
+    def test_join_waits_for_messages_not_enqueued(self, run, create_queue):
+        ch = FakeChannel(1)
+        queue = create_queue([ch])
+
+        async def _submit_and_join():
+            # Enqueued by the next iteration of the loop
+            queue.submit(1, "m0")
+            await queue.join()
+            return list(ch.messages), queue.depth
+
+        assert run(_submit_and_join()) == (["m0"], 0)
+
+    def test_slow_channel_does_not_block_others(self, loop, run, create_queue):
+        gate = run(_create_event())
+        slow, fast = FakeChannel(1, gate), FakeChannel(2)
+        queue = create_queue([slow, fast])
+        queue.submit(1, "slow")
+        queue.submit(2, "fast")
+        run(_wait_for(lambda: fast.messages == ["fast"]))
+        assert slow.messages == []
+        assert queue.depth == 1
+
+        loop.call_soon_threadsafe(gate.set)
+        run(queue.join())
+        assert slow.messages == ["slow"]
+
+    def test_unknown_channel(self, run, create_queue):
+        queue = create_queue([])
+        queue.submit(1, "msg")
+        run(queue.join())
+        assert queue.failed == 1
+        assert queue.depth == 0
+
+        # Channel not found is quarantined and skipped afterwards
+        queue.submit(1, "msg")
+        run(queue.join())
+        assert queue.failed == 1
+        assert queue.quarantined == 1
+
+    def test_quarantine_forbidden_channel(self, run, create_queue):
+        forbidden, ok = FakeChannel(1, status=403), FakeChannel(2)
+        queue = create_queue([forbidden, ok])
+        queue.submit(1, "m0")
+        run(queue.join())
+        assert queue.channels.is_quarantined(1)
+
+        queue.submit(1, "m1")
+        queue.submit(2, "m2")
+        run(queue.join())
+        assert queue.failed == 1
+        assert queue.quarantined == 1
+        assert ok.messages == ["m2"]
+        assert queue.depth == 0
+
+    def test_drop_newest(self, loop, run, create_queue):
+        gate = run(_create_event())
+        ch = FakeChannel(1, gate)
+        queue = create_queue([ch], maxsize=2, backpressure="drop_newest")
+        for i in range(4):
+            queue.submit(1, f"m{i}")
+        assert queue.dropped == 2
+
+        loop.call_soon_threadsafe(gate.set)
+        run(queue.join())
+        assert ch.messages == ["m0", "m1"]
+
+    def test_drop_oldest(self, loop, run, create_queue):
+        gate = run(_create_event())
+        ch = FakeChannel(1, gate)
+        queue = create_queue([ch], maxsize=2, backpressure="drop_oldest")
+        queue.submit(1, "m0")
+        # m0 is being sent and only queued messages are dropped
+        run(_wait_for(lambda: not queue._lanes[1]))
+        for i in range(1, 4):
+            queue.submit(1, f"m{i}")
+        run(_wait_for(lambda: queue.dropped == 2))
+
+        loop.call_soon_threadsafe(gate.set)
+        run(queue.join())
+        assert ch.messages == ["m0", "m3"]
+
+    def test_coalesce_burst(self, run, create_queue):
+        ch = FakeChannel(1)
+        queue = create_queue([ch], coalesce_seconds=0.1)
+        for i in range(5):
+            queue.submit(1, f"m{i}")
+        run(queue.join())
+
+        assert ch.sent == ["m0\nm1\nm2\nm3\nm4"]
+        assert queue.delivered == 5
+        assert queue.sent_messages == 1
+
+    def test_coalesce_under_max_message_length(self, run, create_queue):
+        ch = FakeChannel(1)
+        queue = create_queue([ch], coalesce_seconds=0.1)
+        msgs = [f"{i}" * 900 for i in range(5)]
+        for msg in msgs:
+            queue.submit(1, msg)
+        run(queue.join())
+
+        assert all(len(sent) <= 2000 for sent in ch.sent)
+        assert len(ch.sent) == 3
+        assert ch.messages == msgs
+
+    def test_block_timeout(self, loop, run, create_queue):
+        gate = run(_create_event())
+        ch = FakeChannel(1, gate)
+        queue = create_queue([ch], maxsize=1, backpressure="block", block_timeout=0.1)
+        queue.submit(1, "m0")
+        queue.submit(1, "m1")
+        assert queue.dropped == 1
+
+        loop.call_soon_threadsafe(gate.set)
+        run(queue.join())
+        assert ch.messages == ["m0"]
+
+    def test_skip_duplicated_status(self, run, create_queue):
+        ch = FakeChannel(1)
+        queue = create_queue([ch], dedup=DedupCache(10))
+        queue.submit(1, "m0", 100)
+        queue.submit(1, "m0", 100)
+        queue.submit(1, "m1", 101)
+        run(queue.join())
+
+        assert ch.messages == ["m0", "m1"]
+        assert queue.duplicates == 1
+
+    def test_resend_status_not_delivered(self, loop, run, create_queue):
+        gate = run(_create_event())
+        failing, ok = FakeChannel(1, gate, status=500), FakeChannel(2)
+        queue = create_queue(
+            [failing, ok],
+            maxsize=1,
+            backpressure="drop_newest",
+            dedup=DedupCache(10),
+        )
+        queue.submit(1, "m0", 100)
+        # Dropped while the slot is taken
+        queue.submit(2, "m1", 101)
+        loop.call_soon_threadsafe(gate.set)
+        run(queue.join())
+        assert queue.failed == 1
+        assert queue.dropped == 1
+
+        # Statuses failed or dropped are not skipped as duplicates
+        failing.status = None
+        queue.submit(1, "m0", 100)
+        run(queue.join())
+        queue.submit(2, "m1", 101)
+        run(queue.join())
+        assert failing.messages == ["m0"]
+        assert ok.messages == ["m1"]
+        assert queue.duplicates == 0
+
+    def test_trace_sent_status(self, tmp_path, run, create_queue):
+        path = str(tmp_path / "trace.log")
+        tracer = Tracer(path, 1.0)
+        ch = FakeChannel(1)
+        queue = create_queue([ch], tracer=tracer)
+        tracer.received(100)
+        tracer.matched(100, [1])
+        queue.submit(1, "m0", 100)
+        run(queue.join())
+        tracer.close()
+
+        with open(path) as f:
+            records = parse(f)
+        assert len(records) == 1
+        assert records[0]["enqueued"] <= records[0]["sent"]
+
+    def test_replay_journal(self, tmp_path, run, create_queue):
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path)
+        journal.append(1, "m0", 100)
+        journal.append(2, "m1", 101)
+        journal.close()
+
+        ch1, ch2 = FakeChannel(1), FakeChannel(2)
+        dedup = DedupCache(10)
+        dedup.check(1, 100)
+        queue = create_queue([ch1, ch2], dedup=dedup, journal=DeliveryJournal(path))
+        run(queue.join())
+        run(queue.close_journal())
+
+        # Replayed messages are not skipped as duplicates
+        assert ch1.messages == ["m0"]
+        assert ch2.messages == ["m1"]
+        assert queue.replayed == 2
+        assert DeliveryJournal(path).unacked == []
+
+    def test_keep_failed_message_in_journal(self, tmp_path, run, create_queue):
+        path = str(tmp_path / "journal.db")
+        failing, forbidden, ok = (
+            FakeChannel(1, status=500),
+            FakeChannel(2, status=403),
+            FakeChannel(3),
+        )
+        queue = create_queue([failing, forbidden, ok], journal=DeliveryJournal(path))
+        queue.submit(1, "m0", 100)
+        queue.submit(2, "m1", 101)
+        queue.submit(3, "m2", 102)
+        run(queue.join())
+        run(queue.close_journal())
+
+        # Only the message failed by an error of Discord is sent after restart
+        assert [e[1:] for e in DeliveryJournal(path).unacked] == [(1, "m0", 100)]
+
+
+async def _create_event():
+    return asyncio.Event()
+
+
+async def _wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)
@@ -0,0 +1,99 @@
+import sqlite3
+import time
+
+from tcbot import journal as journal_module
+from tcbot.journal import DeliveryJournal
+
+
+def _rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT seq, channel_id, message, status_id FROM deliveries ORDER BY seq;"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+class _FailingConnection:
+    # Fails the writes of the first group commit
+    def __init__(self, conn):
+        self.conn = conn
+        self.failures = 1
+
+    def executemany(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        return self.conn.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class TestDeliveryJournal:
+    def test_unacked_survive_reopen(self, tmp_path):
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path)
+        assert journal.unacked == []
+        s1 = journal.append(1, "m1", 100)
+        s2 = journal.append(2, "m2")
+        journal.ack([s1])
+        journal.close()
+
+        reopened = DeliveryJournal(path)
+        assert reopened.unacked == [(s2, 2, "m2", None)]
+        # Sequence continues from the entries left
+        assert reopened.append(1, "m3") > s2
+        reopened.close()
+
+    def test_group_commit(self, tmp_path):
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path, commit_seconds=0.2)
+        seqs = [journal.append(1, f"m{i}", i) for i in range(100)]
+        _wait_for(lambda: journal.commits == 1)
+        assert len(_rows(path)) == 100
+
+        journal.ack(seqs)
+        _wait_for(lambda: journal.commits == 2)
+        assert _rows(path) == []
+        journal.close()
+
+    def test_acked_before_commit_never_written(self, tmp_path):
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path, commit_seconds=0.2)
+        seq = journal.append(1, "m0")
+        journal.ack([seq])
+        journal.close()
+
+        assert journal.commits == 0
+        assert _rows(path) == []
+
+    def test_close_writes_pending(self, tmp_path):
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path, commit_seconds=10)
+        seq = journal.append(1, "m0", 100)
+        journal.close()
+        assert _rows(path) == [(seq, 1, "m0", 100)]
+
+    def test_retry_failed_commit(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(journal_module, "WRITE_RETRY_SECONDS", 0.1)
+        path = str(tmp_path / "journal.db")
+        journal = DeliveryJournal(path, commit_seconds=0.01)
+        journal._conn = _FailingConnection(journal._conn)
+        s1 = journal.append(1, "m1")
+        s2 = journal.append(1, "m2")
+        time.sleep(0.05)
+        # Acknowledged while the failed batch waits for the retry
+        journal.ack([s1])
+        _wait_for(lambda: journal.commits == 1)
+        assert journal.pending == 0
+        assert _rows(path) == [(s2, 1, "m2", None)]
+        journal.close()
@@ -0,0 +1,172 @@
+from tcbot import matcher as matcher_module
+from tcbot.matcher import (
+    PATTERN_BUDGET_VIOLATIONS,
+    PATTERN_TIMING_INTERVAL,
+    MonitorMatcher,
+    pattern_id,
+)
+
+
+def _monitor(channel_id, twitter_id, match_ptn):
+    return {"channel_id": channel_id, "twitter_id": twitter_id, "match_ptn": match_ptn}
+
+
+def _channels(monitors):
+    return sorted(m["channel_id"] for m in monitors)
+
+
+class TestMonitorMatcher:
+    def test_build_user_id_map(self):
+        monitors = [_monitor(1, 10, None), _monitor(2, 10, "a"), _monitor(1, 20, None)]
+        matcher = MonitorMatcher(monitors)
+        assert matcher.user_id_map == {10: monitors[:2], 20: monitors[2:]}
+        assert 10 in matcher
+        assert 30 not in matcher
+
+    def test_match_not_monitored_user(self):
+        matcher = MonitorMatcher([_monitor(1, 10, None)])
+        assert matcher.match(20, "text") == []
+
+    def test_match_without_pattern(self):
+        matcher = MonitorMatcher([_monitor(1, 10, None), _monitor(2, 10, "")])
+        assert _channels(matcher.match(10, "text")) == [1, 2]
+
+    def test_match_with_patterns(self):
+        matcher = MonitorMatcher(
+            [
+                _monitor(1, 10, r"mildom\.com"),
+                _monitor(2, 10, r"youtube\.com"),
+                _monitor(3, 10, None),
+            ]
+        )
+        assert _channels(matcher.match(10, "live on mildom.com/123")) == [1, 3]
+        assert _channels(matcher.match(10, "live on youtube.com/x")) == [2, 3]
+        assert _channels(matcher.match(10, "no links")) == [3]
+
+    def test_match_with_duplicated_patterns(self):
+        matcher = MonitorMatcher(
+            [_monitor(1, 10, r"mildom\.com"), _monitor(2, 10, r"mildom\.com")]
+        )
+        assert _channels(matcher.match(10, "mildom.com")) == [1, 2]
+        assert _channels(matcher.match(10, "youtube.com")) == []
+
+    def test_match_with_backreference(self):
+        matcher = MonitorMatcher([_monitor(1, 10, r"(a)b"), _monitor(2, 10, r"(x)\1")])
+        assert _channels(matcher.match(10, "xx")) == [2]
+
+    def test_match_with_global_flag(self):
+        matcher = MonitorMatcher(
+            [_monitor(1, 10, r"(?i)MILDOM"), _monitor(2, 10, r"youtube")]
+        )
+        assert _channels(matcher.match(10, "mildom")) == [1]
+
+    def test_skip_invalid_pattern(self):
+        matcher = MonitorMatcher([_monitor(1, 10, r"("), _monitor(2, 10, r"a")])
+        assert _channels(matcher.match(10, "a(")) == [2]
+
+    def test_add_monitor(self):
+        matcher = MonitorMatcher([_monitor(1, 10, r"mildom\.com")])
+        assert matcher.add(_monitor(2, 10, None)) is False
+        assert matcher.add(_monitor(1, 20, None)) is True
+        assert _channels(matcher.match(10, "text")) == [2]
+        assert _channels(matcher.match(20, "text")) == [1]
+        assert sorted(matcher.follow_ids()) == ["10", "20"]
+
+    def test_add_monitor_replaces_same_channel(self):
+        matcher = MonitorMatcher([_monitor(1, 10, r"mildom\.com")])
+        assert matcher.add(_monitor(1, 10, None)) is False
+        assert matcher.user_id_map[10] == [_monitor(1, 10, None)]
+
+    def test_remove_monitor(self):
+        matcher = MonitorMatcher([_monitor(1, 10, None), _monitor(2, 10, None)])
+        assert matcher.remove(1, 10) is False
+        assert _channels(matcher.match(10, "text")) == [2]
+        assert matcher.remove(2, 10) is True
+        assert 10 not in matcher
+        assert matcher.follow_ids() == []
+
+    def test_remove_not_monitored_user(self):
+        matcher = MonitorMatcher([_monitor(1, 10, None)])
+        assert matcher.remove(1, 20) is False
+
+    def test_disable_slow_pattern(self, monkeypatch):
+        # Every evaluation exceeds the budget
+        monkeypatch.setattr(matcher_module, "PATTERN_BUDGET_SECONDS", -1)
+        disabled = []
+        monitors = [
+            _monitor(1, 10, "slow"),
+            _monitor(2, 20, "slow"),
+            _monitor(3, 10, None),
+        ]
+        matcher = MonitorMatcher(
+            monitors, on_disabled=lambda ptn, ms: disabled.append((ptn, ms))
+        )
+
+        for _ in range(PATTERN_BUDGET_VIOLATIONS - 1):
+            assert _channels(matcher.match(10, "slow")) == [1, 3]
+        assert disabled == []
+
+        assert _channels(matcher.match(10, "slow")) == [1, 3]
+        assert disabled == [("slow", monitors[:2])]
+        assert matcher.disabled_patterns() == ["slow"]
+        assert _channels(matcher.match(10, "slow")) == [3]
+        assert matcher.match(20, "slow") == []
+
+    def test_disable_slow_pattern_on_timed_match(self, monkeypatch):
+        # Only the text backtracking catastrophically exceeds the budget
+        monkeypatch.setattr(matcher_module, "PATTERN_BUDGET_SECONDS", 0.005)
+        monkeypatch.setattr(matcher_module, "PATTERN_BUDGET_VIOLATIONS", 1)
+        disabled = []
+        monitors = [_monitor(1, 10, r"(a+)+$")]
+        matcher = MonitorMatcher(
+            monitors, on_disabled=lambda ptn, ms: disabled.append((ptn, ms))
+        )
+
+        for _ in range(PATTERN_TIMING_INTERVAL - 1):
+            assert matcher.match(10, "x") == []
+        assert disabled == []
+
+        # Patterns are timed one by one on every interval
+        matcher.match(10, "a" * 18 + "b")
+        assert disabled == [(r"(a+)+$", monitors)]
+        assert matcher.disabled_patterns() == [r"(a+)+$"]
+
+    def test_time_next_match_after_slow_prefilter(self, monkeypatch):
+        monkeypatch.setattr(matcher_module, "PATTERN_BUDGET_SECONDS", 0.005)
+        monkeypatch.setattr(matcher_module, "PATTERN_BUDGET_VIOLATIONS", 1)
+        disabled = []
+        monitors = [_monitor(1, 10, "x"), _monitor(2, 10, r"(a+)+$")]
+        matcher = MonitorMatcher(
+            monitors, on_disabled=lambda ptn, ms: disabled.append((ptn, ms))
+        )
+
+        # Slow pattern is not known without running patterns again
+        text = "a" * 18 + "b"
+        assert matcher.match(10, text) == []
+        assert disabled == []
+
+        # Next match is timed pattern by pattern
+        assert matcher.match(10, text) == []
+        assert disabled == [(r"(a+)+$", monitors[1:])]
+        assert matcher.pattern_stats["x"].evaluations == 1
+
+    def test_quarantine_channel(self):
+        matcher = MonitorMatcher(
+            [_monitor(1, 10, None), _monitor(2, 10, "a"), _monitor(1, 20, None)]
+        )
+        matcher.quarantine(1)
+        assert _channels(matcher.match(10, "a")) == [2]
+        assert matcher.match(20, "a") == []
+        # Monitors added to the quarantined channel are not matched either
+        matcher.add(_monitor(1, 30, None))
+        assert matcher.match(30, "a") == []
+
+        matcher.release(1)
+        assert _channels(matcher.match(10, "a")) == [1, 2]
+        assert _channels(matcher.match(30, "a")) == [1]
+
+
+def test_pattern_id():
+    assert pattern_id(r"mildom\.com") == pattern_id(r"mildom\.com")
+    assert pattern_id(r"mildom\.com") != pattern_id(r"mildom")
+    assert "mildom" not in pattern_id(r"mildom\.com")
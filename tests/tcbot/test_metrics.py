@@ -0,0 +1,60 @@
+import urllib.request
+
+import pytest
+
+from tcbot.metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+
+
+class TestMetrics:
+    def test_counter(self):
+        counter = Counter("test_total", "Test.", ("reason",))
+        counter.inc(reason="a")
+        counter.inc(2, reason="a")
+        assert counter.get(reason="a") == 3
+        assert counter.get(reason="b") == 0
+
+    def test_invalid_labels(self):
+        counter = Counter("test_total", "Test.", ("reason",))
+        with pytest.raises(ValueError):
+            counter.inc(other="a")
+
+    def test_gauge_function(self):
+        gauge = Gauge("test_depth", "Test.")
+        gauge.set_function(lambda: 5)
+        assert gauge.get() == 5
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test.", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        assert histogram.count() == 4
+        assert histogram.sum() == pytest.approx(6.05)
+        assert histogram.quantile(0.5) == 1
+        assert histogram.quantile(0.25) == 0.1
+
+    def test_render(self):
+        reg = Registry()
+        reg.counter("test_total", "Test counter.", ("reason",)).inc(reason='a"b')
+        reg.histogram("test_seconds", "Test histogram.", buckets=(0.1,)).observe(0.05)
+        reg.collector(
+            "test_follows", "Test collector.", "gauge", lambda: [({"shard": 0}, 3)]
+        )
+        text = reg.render()
+
+        assert "# TYPE test_total counter\n" in text
+        assert 'test_total{reason="a\\"b"} 1.0\n' in text
+        assert 'test_seconds_bucket{le="0.1"} 1.0\n' in text
+        assert 'test_seconds_bucket{le="+Inf"} 1.0\n' in text
+        assert "test_seconds_count 1.0\n" in text
+        assert 'test_follows{shard="0"} 3.0\n' in text
+
+    def test_server(self):
+        server = MetricsServer(0)
+        server.start()
+        try:
+            url = f"http://127.0.0.1:{server.port}/metrics"
+            with urllib.request.urlopen(url) as res:
+                body = res.read().decode()
+        finally:
+            server.close()
+        assert "# TYPE tcbot_tweets_received_total counter\n" in body
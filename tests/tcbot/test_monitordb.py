@@ -1,21 +1,25 @@
+import time
+
 import pytest
 
 from tcbot.monitordb import MonitorDB
+from tcbot.snapshot import MonitorSnapshot
 from tcbot.exception import TCBotError
 
 
+@pytest.fixture(scope="module", params=["postgresql", "sqlite"])
+def db_url(request, tmp_path_factory):
+    # Same tests run on each storage backend
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path_factory.mktemp('monitordb')}/monitors.db"
+    return request.getfixturevalue("config").db_url
+
+
 @pytest.fixture(scope="module")
-def _empty_db_with_monitor_table(config):
+def _empty_db_with_monitor_table(db_url):
     table_name = "test_monitors"
-    db = MonitorDB(config.db_url, table_name)
-    db._do_sql(
-        f"CREATE TABLE {table_name}("
-        "channel_id bigint not null,"
-        "twitter_id bigint not null,"
-        "match_ptn text,"
-        "PRIMARY KEY(channel_id, twitter_id)"
-        ");"
-    )
+    db = MonitorDB(db_url, table_name)
+    db.create_table()
     yield db
     db._do_sql(f"DROP TABLE {table_name};")
 
@@ -29,8 +33,8 @@ def empty_monitor_db(_empty_db_with_monitor_table):
 
 
 class TestMonitorDB:
-    def test_connect_to_db_with_valid_url(self, config):
-        MonitorDB(config.db_url, "test_monitors")
+    def test_connect_to_db_with_valid_url(self, db_url):
+        MonitorDB(db_url, "test_monitors")
 
     def test_connect_to_db_with_invalid_url(self):
         with pytest.raises(
@@ -39,6 +43,13 @@ class TestMonitorDB:
         ):
             MonitorDB("postgresql://INVALID_URL", "test_monitors")
 
+    def test_connect_to_sqlite_with_invalid_path(self, tmp_path):
+        url = f"sqlite:///{tmp_path}/INVALID_DIR/monitors.db"
+        with pytest.raises(
+            TCBotError, match=r"^Failed to connect database\. url: sqlite:///.*$"
+        ):
+            MonitorDB(url, "test_monitors")
+
     # INSERT
     def test_insert_invalid_channel_id_with_None(self, empty_monitor_db):
         db = empty_monitor_db
@@ -123,3 +134,126 @@ class TestMonitorDB:
                 "match_ptn": r"mildom\.com",
             }
         ]
+
+    def test_insert_match_ptn_with_quote(self, empty_monitor_db):
+        db = empty_monitor_db
+        db.insert(123, 456, r"it's")
+        assert db.select() == [
+            {
+                "channel_id": 123,
+                "twitter_id": 456,
+                "match_ptn": r"it's",
+            }
+        ]
+
+    # SELECT
+    def test_select_with_keys(self, empty_monitor_db):
+        db = empty_monitor_db
+        db.insert(1, 10, None)
+        db.insert(1, 20, None)
+        db.insert(2, 10, None)
+        assert sorted(m["twitter_id"] for m in db.select(channel_id=1)) == [10, 20]
+        assert sorted(m["channel_id"] for m in db.select(twitter_id=10)) == [1, 2]
+        assert db.select(channel_id=2, twitter_id=10) == [
+            {"channel_id": 2, "twitter_id": 10, "match_ptn": None}
+        ]
+        assert db.select(channel_id=2, twitter_id=20) == []
+
+    def test_select_after_raw_sql(self, empty_monitor_db):
+        db = empty_monitor_db
+        db.insert(123, 456, None)
+        db._do_sql(f"DELETE FROM {db.table_name};")
+        assert db.select() == []
+
+    def test_select_changes_by_other_instance(self, db_url, empty_monitor_db):
+        db = empty_monitor_db
+        other = MonitorDB(db_url, db.table_name)
+        assert other.select() == []
+
+        changes = []
+        other.add_listener(lambda op, row: changes.append((op, row)))
+        other.start_listening()
+        time.sleep(1)
+
+        db.insert(123, 456, None)
+        for _ in range(50):
+            if changes:
+                break
+            time.sleep(0.1)
+
+        assert changes == [
+            ("insert", {"channel_id": 123, "twitter_id": 456, "match_ptn": None})
+        ]
+        assert other.select() == db.select()
+        other.close()
+
+    def test_ignore_own_changes(self, db_url, empty_monitor_db):
+        db = MonitorDB(db_url, empty_monitor_db.table_name)
+        assert db.select() == []
+
+        changes = []
+        db.add_listener(lambda op, row: changes.append((op, row)))
+        db.start_listening()
+        time.sleep(1)
+
+        db.insert(123, 456, None)
+        time.sleep(2)
+        # Changes by the instance itself are already in cache
+        assert changes == []
+        assert db.select() == [
+            {"channel_id": 123, "twitter_id": 456, "match_ptn": None}
+        ]
+        db.close()
+
+    # SNAPSHOT
+    def test_start_from_snapshot_without_db(self, tmp_path):
+        path = str(tmp_path / "monitors.snapshot")
+        MonitorSnapshot(path, "test_monitors").save(
+            [{"channel_id": 123, "twitter_id": 456, "match_ptn": None}]
+        )
+
+        db = MonitorDB("postgresql://INVALID_URL", "test_monitors", snapshot_path=path)
+        assert db.is_warm
+        assert db.select() == [
+            {"channel_id": 123, "twitter_id": 456, "match_ptn": None}
+        ]
+        with pytest.raises(TCBotError, match=r"^Failed to select rows\.$"):
+            db.reconcile()
+        # Cache of the snapshot is kept while the database is down
+        assert db.select() == [
+            {"channel_id": 123, "twitter_id": 456, "match_ptn": None}
+        ]
+
+    def test_reconcile_snapshot_with_db(self, db_url, empty_monitor_db, tmp_path):
+        db = empty_monitor_db
+        db.insert(1, 10, None)
+        path = str(tmp_path / "monitors.snapshot")
+        MonitorSnapshot(path, db.table_name).save(
+            [{"channel_id": 2, "twitter_id": 20, "match_ptn": None}]
+        )
+
+        warm = MonitorDB(db_url, db.table_name, snapshot_path=path)
+        changes = []
+        warm.add_listener(lambda op, row: changes.append((op, row)))
+        assert warm.select() == [{"channel_id": 2, "twitter_id": 20, "match_ptn": None}]
+        assert warm.reconcile() == db.select()
+        assert not warm.is_warm
+        assert changes == [
+            ("delete", {"channel_id": 2, "twitter_id": 20, "match_ptn": None}),
+            ("insert", {"channel_id": 1, "twitter_id": 10, "match_ptn": None}),
+        ]
+        assert MonitorSnapshot(path, db.table_name).load() == db.select()
+        warm.close()
+
+    def test_refresh_snapshot_on_change(self, db_url, empty_monitor_db, tmp_path):
+        path = str(tmp_path / "monitors.snapshot")
+        db = MonitorDB(db_url, empty_monitor_db.table_name, snapshot_path=path)
+        db.select()
+        db.insert_many([(1, 10, None), (1, 20, "pattern")])
+        db.delete(1, 10)
+
+        snapshot = MonitorSnapshot(path, db.table_name)
+        assert snapshot.load() == [
+            {"channel_id": 1, "twitter_id": 20, "match_ptn": "pattern"}
+        ]
+        db.close()
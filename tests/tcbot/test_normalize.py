@@ -0,0 +1,126 @@
+from tcbot.normalize import (
+    URL_FIELD_DISPLAY,
+    URL_FIELD_EXPANDED,
+    expand_urls,
+    normalize_status,
+    peek_user_ids,
+)
+
+
+def _url(text, short, expanded, display):
+    start = text.index(short)
+    return {
+        "url": short,
+        "expanded_url": expanded,
+        "display_url": display,
+        "indices": [start, start + len(short)],
+    }
+
+
+TEXT = "配信開始 https://t.co/a と https://t.co/b"
+URLS = [
+    _url(
+        TEXT, "https://t.co/a", "https://www.mildom.com/10000001", "mildom.com/10000001"
+    ),
+    _url(
+        TEXT,
+        "https://t.co/b",
+        "https://example.com/very/long/path",
+        "example.com/very/…",
+    ),
+]
+
+
+class TestNormalize:
+    def test_expand_urls(self):
+        assert expand_urls(TEXT, URLS) == (
+            "配信開始 https://www.mildom.com/10000001 と https://example.com/very/long/path"
+        )
+
+    def test_expand_urls_with_display_url(self):
+        assert expand_urls(TEXT, URLS, URL_FIELD_DISPLAY) == (
+            "配信開始 mildom.com/10000001 と example.com/very/…"
+        )
+
+    def test_expand_unordered_urls(self):
+        assert expand_urls(TEXT, URLS[::-1]) == expand_urls(TEXT, URLS)
+
+    def test_expand_urls_with_wrong_indices(self):
+        urls = [dict(URLS[0], indices=[0, 3]), URLS[1]]
+        assert expand_urls(TEXT, urls) == expand_urls(TEXT, URLS)
+
+    def test_extended_tweet(self):
+        full_text = "あ" * 150 + " https://t.co/a"
+        data = {
+            "text": "あ" * 139 + "…",
+            "truncated": True,
+            "entities": {"urls": []},
+            "extended_tweet": {
+                "full_text": full_text,
+                "entities": {
+                    "urls": [
+                        _url(
+                            full_text,
+                            "https://t.co/a",
+                            "https://mildom.com/1",
+                            "mildom.com/1",
+                        )
+                    ]
+                },
+            },
+        }
+        assert normalize_status(data) == "あ" * 150 + " https://mildom.com/1"
+
+    def test_full_text(self):
+        data = {"full_text": "full", "entities": {"urls": []}}
+        assert normalize_status(data) == "full"
+
+    def test_quoted_status(self):
+        data = {
+            "text": TEXT,
+            "entities": {"urls": URLS},
+            "quoted_status": {
+                "text": "quoted https://t.co/c",
+                "entities": {"urls": []},
+            },
+        }
+        assert normalize_status(data, URL_FIELD_EXPANDED) == (
+            expand_urls(TEXT, URLS) + "\nquoted https://t.co/c"
+        )
+
+    def test_retweeted_status(self):
+        data = {
+            "text": "RT @user: 配信開始 https://t.co/a と…",
+            "entities": {"urls": []},
+            "retweeted_status": {
+                "text": TEXT,
+                "user": {"screen_name": "user"},
+                "entities": {"urls": URLS},
+            },
+        }
+        assert normalize_status(data) == "RT @user: " + expand_urls(TEXT, URLS)
+
+    def test_peek_user_ids(self):
+        raw = (
+            '{"id":1,"text":"RT @b: a","user":{"id":10,"screen_name":"a"},'
+            '"retweeted_status":{"id":2,"user":{"id":20,"screen_name":"b"}}}'
+        )
+        assert peek_user_ids(raw) == [10, 20]
+        assert peek_user_ids(raw.encode()) == [10, 20]
+
+    def test_peek_user_ids_with_author_after_nested_user(self):
+        raw = (
+            '{"id":1,"quoted_status":{"id":2,"user":{"id":20,"screen_name":"b"}},'
+            '"text":"a","user":{"id":10,"screen_name":"a"}}'
+        )
+        assert peek_user_ids(raw) == [20, 10]
+
+    def test_peek_user_ids_without_leading_id(self):
+        raw = (
+            '{"id":1,"retweeted_status":{"id":2,"user":{"id":20}},'
+            '"user":{"screen_name":"a","id":10}}'
+        )
+        assert peek_user_ids(raw) is None
+
+    def test_peek_user_ids_of_other_message(self):
+        assert peek_user_ids('{"delete":{"status":{"id":1,"user_id":10}}}') is None
@@ -0,0 +1,34 @@
+import re
+
+from tcbot.patterns import (
+    ADVERSARIAL_LENGTH,
+    ENGINE_RE2,
+    adversarial_inputs,
+    check_pattern,
+    compile_pattern,
+    re2_available,
+)
+
+
+class TestPatterns:
+    def test_adversarial_inputs(self):
+        inputs = adversarial_inputs(r"(ab)+$")
+        assert "a" * ADVERSARIAL_LENGTH + "!" in inputs
+        assert "b" * ADVERSARIAL_LENGTH + "\n" in inputs
+        assert "ab" * (ADVERSARIAL_LENGTH // 2) + "!" in inputs
+
+    def test_compile_pattern_with_backreference(self):
+        # re is used if re2 does not support the pattern or is not installed
+        regex = compile_pattern(r"(a)\1", ENGINE_RE2)
+        assert regex.search("aa")
+        if not re2_available():
+            assert isinstance(regex, re.Pattern)
+
+    def test_admit_pattern(self):
+        assert check_pattern(r"mildom\.com/\d+")
+
+    def test_reject_catastrophic_pattern(self):
+        assert not check_pattern(r"(a+)+$", timeout=1)
+
+    def test_reject_slow_pattern(self):
+        assert not check_pattern(r"(a|a)*b", max_seconds=0.001)
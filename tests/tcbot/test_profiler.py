@@ -0,0 +1,87 @@
+import asyncio
+import pstats
+import threading
+import time
+
+import pytest
+
+from tcbot.exception import TCBotError
+from tcbot.profiler import FORMAT_PSTATS, SamplingProfiler
+
+
+def _busy_thread(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def _blocking_callback():
+    time.sleep(0.3)
+
+
+@pytest.fixture
+def profiled(loop, run):
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy_thread, args=(stop,), name="busy_thread")
+    thread.start()
+
+    profiler = SamplingProfiler(loop, interval=0.005, slow_callback_seconds=0.1)
+
+    async def run_profiler():
+        task = loop.create_task(profiler.run(0.6))
+        await asyncio.sleep(0.1)
+        _blocking_callback()
+        await task
+
+    try:
+        run(run_profiler())
+    finally:
+        stop.set()
+        thread.join()
+    return profiler
+
+
+class TestSamplingProfiler:
+    def test_sample_threads(self, profiled):
+        threads = {name for name, _ in profiled.samples}
+        assert "busy_thread" in threads
+        assert threading.main_thread().name in threads
+        assert profiled.sample_count > 0
+
+    def test_slow_callback(self, profiled):
+        assert len(profiled.slow_callbacks) == 1
+        duration, stack = profiled.slow_callbacks[0]
+        assert duration >= 0.2
+        assert "_blocking_callback" in stack
+
+    def test_write_collapsed(self, profiled, tmp_path):
+        path = tmp_path / "profile.collapsed"
+        profiled.write(str(path))
+        lines = path.read_text().splitlines()
+        assert any(
+            line.startswith("busy_thread;") and "_busy_thread (" in line
+            for line in lines
+        )
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == (
+            profiled.sample_count
+        )
+
+    def test_write_pstats(self, profiled, tmp_path):
+        path = tmp_path / "profile.pstats"
+        profiled.write(str(path), FORMAT_PSTATS)
+        stats = pstats.Stats(str(path))
+        assert any(name == "_busy_thread" for _, _, name in stats.stats)
+
+    def test_start_twice(self, loop, run):
+        profiler = SamplingProfiler(loop)
+
+        async def start_twice():
+            profiler.start()
+            try:
+                with pytest.raises(
+                    TCBotError, match=r"^Profiler is already running\.$"
+                ):
+                    profiler.start()
+            finally:
+                await profiler.stop()
+
+        run(start_twice())
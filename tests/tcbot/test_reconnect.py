@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+
+from tcbot import reconnect
+from tcbot.reconnect import (
+    Backoff,
+    ReconnectScheduler,
+    create_backoff,
+    ERROR_HTTP,
+    ERROR_NETWORK,
+    ERROR_RATE_LIMIT,
+    JITTER_RATIO,
+)
+
+
+@pytest.fixture
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(reconnect, "create_backoff", lambda kind: Backoff(0.05, 0.05))
+
+
+def _wait_until(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+async def _cancel(scheduler):
+    scheduler.cancel()
+    await asyncio.sleep(0)
+
+
+def _assert_delays(backoff, expected):
+    for delay in expected:
+        actual = backoff.next()
+        assert delay <= actual <= delay * (1 + JITTER_RATIO)
+
+
+class TestBackoff:
+    def test_network(self):
+        _assert_delays(create_backoff(ERROR_NETWORK), [0.25, 0.5, 0.75, 1.0])
+
+    def test_network_maximum(self):
+        backoff = create_backoff(ERROR_NETWORK)
+        for _ in range(100):
+            backoff.next()
+        _assert_delays(backoff, [16])
+
+    def test_http(self):
+        _assert_delays(create_backoff(ERROR_HTTP), [5, 10, 20, 40, 80, 160, 320, 320])
+
+    def test_rate_limit(self):
+        _assert_delays(create_backoff(ERROR_RATE_LIMIT), [60, 120, 240])
+
+    def test_reset(self):
+        backoff = create_backoff(ERROR_HTTP)
+        _assert_delays(backoff, [5, 10])
+        backoff.reset()
+        _assert_delays(backoff, [5])
+
+
+class TestReconnectScheduler:
+    def test_reconnect(self, loop, short_backoff):
+        scheduler = ReconnectScheduler(loop)
+        called = []
+        scheduler.schedule(0, ERROR_NETWORK, lambda: called.append(0))
+        _wait_until(lambda: called)
+        assert scheduler.reconnects == 1
+        assert scheduler.in_progress() == 1
+
+        scheduler.connected(0)
+        _wait_until(lambda: scheduler.in_progress() == 0)
+        assert scheduler.last_duration > 0
+        assert scheduler.stats()["reconnects"] == 1
+
+    def test_ignore_duplicated_schedule(self, loop, run, short_backoff):
+        scheduler = ReconnectScheduler(loop)
+        called = []
+        for _ in range(3):
+            scheduler.schedule(0, ERROR_NETWORK, lambda: called.append(0))
+        _wait_until(lambda: called)
+        time.sleep(0.1)
+        assert called == [0]
+        run(_cancel(scheduler))
+
+    def test_bound_concurrent_reconnects(self, loop, short_backoff):
+        scheduler = ReconnectScheduler(loop, max_concurrent=2)
+        connecting = 0
+        peak = 0
+        done = []
+
+        def _on_connect(key):
+            nonlocal connecting
+            connecting -= 1
+            done.append(key)
+            scheduler.connected(key)
+
+        def _reconnect(key):
+            # Stream thread is spawned and connected later
+            nonlocal connecting, peak
+            connecting += 1
+            peak = max(peak, connecting)
+            loop.call_later(0.05, _on_connect, key)
+
+        for key in range(5):
+            scheduler.schedule(key, ERROR_HTTP, lambda key=key: _reconnect(key))
+        _wait_until(lambda: len(done) == 5)
+        assert peak == 2
+
+    def test_release_slot_on_connect_timeout(self, loop, run, short_backoff):
+        scheduler = ReconnectScheduler(loop, max_concurrent=1, connect_timeout=0.05)
+        called = []
+        for key in range(3):
+            scheduler.schedule(key, ERROR_HTTP, lambda key=key: called.append(key))
+        _wait_until(lambda: len(called) == 3)
+        run(_cancel(scheduler))
+
+    def test_release_slot_on_lost_again(self, loop, run, short_backoff):
+        scheduler = ReconnectScheduler(loop, max_concurrent=1)
+        called = []
+        scheduler.schedule(0, ERROR_HTTP, lambda: called.append(0))
+        _wait_until(lambda: called == [0])
+        scheduler.schedule(1, ERROR_HTTP, lambda: called.append(1))
+        time.sleep(0.1)
+        assert called == [0]
+
+        # Stream 0 fails before connected and is scheduled again
+        scheduler.schedule(0, ERROR_HTTP, lambda: called.append(0))
+        _wait_until(lambda: called == [0, 1])
+        scheduler.connected(1)
+        _wait_until(lambda: called == [0, 1, 0])
+        run(_cancel(scheduler))
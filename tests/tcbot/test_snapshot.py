@@ -0,0 +1,65 @@
+import json
+
+from tcbot.snapshot import MonitorSnapshot
+
+ROWS = [
+    {"channel_id": 2, "twitter_id": 20, "match_ptn": None},
+    {"channel_id": 1, "twitter_id": 10, "match_ptn": "配信"},
+    {"channel_id": 1, "twitter_id": 20, "match_ptn": r"mildom\.com"},
+]
+
+
+def _sorted(rows):
+    return sorted(rows, key=lambda r: (r["channel_id"], r["twitter_id"]))
+
+
+class TestMonitorSnapshot:
+    def test_save_and_load(self, tmp_path):
+        path = str(tmp_path / "monitors.snapshot")
+        MonitorSnapshot(path, "monitors").save(ROWS)
+
+        snapshot = MonitorSnapshot(path, "monitors")
+        assert _sorted(snapshot.load()) == _sorted(ROWS)
+        assert snapshot.saved_at is not None
+
+    def test_load_missing_file(self, tmp_path):
+        snapshot = MonitorSnapshot(str(tmp_path / "monitors.snapshot"), "monitors")
+        assert snapshot.load() is None
+
+    def test_save_empty(self, tmp_path):
+        path = str(tmp_path / "monitors.snapshot")
+        MonitorSnapshot(path, "monitors").save([])
+        assert MonitorSnapshot(path, "monitors").load() == []
+
+    def test_same_map_same_bytes(self, tmp_path):
+        path1 = tmp_path / "1.snapshot"
+        path2 = tmp_path / "2.snapshot"
+        MonitorSnapshot(str(path1), "monitors").save(ROWS)
+        MonitorSnapshot(str(path2), "monitors").save(list(reversed(ROWS)))
+        assert path1.read_bytes().split(b"\n")[1] == path2.read_bytes().split(b"\n")[1]
+
+    def test_ignore_corrupted_body(self, tmp_path):
+        path = tmp_path / "monitors.snapshot"
+        MonitorSnapshot(str(path), "monitors").save(ROWS)
+        path.write_bytes(path.read_bytes().replace(b"10,", b"11,"))
+        assert MonitorSnapshot(str(path), "monitors").load() is None
+
+    def test_ignore_truncated_file(self, tmp_path):
+        path = tmp_path / "monitors.snapshot"
+        MonitorSnapshot(str(path), "monitors").save(ROWS)
+        path.write_bytes(path.read_bytes()[:-10])
+        assert MonitorSnapshot(str(path), "monitors").load() is None
+
+    def test_ignore_other_version(self, tmp_path):
+        path = tmp_path / "monitors.snapshot"
+        MonitorSnapshot(str(path), "monitors").save(ROWS)
+        header, body = path.read_bytes().split(b"\n", 1)
+        header = json.loads(header)
+        header["version"] += 1
+        path.write_bytes(json.dumps(header).encode() + b"\n" + body)
+        assert MonitorSnapshot(str(path), "monitors").load() is None
+
+    def test_ignore_other_table(self, tmp_path):
+        path = str(tmp_path / "monitors.snapshot")
+        MonitorSnapshot(path, "monitors").save(ROWS)
+        assert MonitorSnapshot(path, "other_monitors").load() is None
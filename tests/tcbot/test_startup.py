@@ -0,0 +1,96 @@
+import asyncio
+import concurrent.futures
+import subprocess
+import sys
+import threading
+import time
+
+from tcbot.main import _attach
+from tcbot.startup import StartupTimer
+
+
+def test_phases_ordered_by_start():
+    timer = StartupTimer()
+
+    def connect(name: str, seconds: float):
+        with timer.phase(name):
+            time.sleep(seconds)
+
+    threads = [
+        threading.Thread(target=connect, args=("db", 0.2)),
+        threading.Thread(target=connect, args=("twitter", 0.1)),
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(0.01)
+    for t in threads:
+        t.join()
+    timer.mark("ready")
+
+    phases = timer.phases()
+    assert [name for name, _, _ in phases] == ["db", "twitter", "ready"]
+    _, db_start, db_end = phases[0]
+    _, tw_start, tw_end = phases[1]
+    # Phases run at once overlap
+    assert tw_start < db_end
+    assert db_end - db_start >= 0.2
+    assert phases[2][1] == phases[2][2] >= db_end
+
+
+def test_first_run_recorded():
+    timer = StartupTimer()
+    timer.mark("discord_ready")
+    first = timer.phases()[0]
+    time.sleep(0.01)
+    timer.mark("discord_ready")
+    assert timer.phases() == [first]
+
+
+def test_report():
+    timer = StartupTimer(origin=time.perf_counter() - 1.0)
+    with timer.phase("db"):
+        pass
+    timer.mark("streams_started")
+
+    report = timer.report()
+    assert report.startswith("Started in 1.")
+    assert "db: 0.000s (1." in report
+    assert "streams_started: at 1." in report
+
+
+def test_main_defers_heavy_imports():
+    code = (
+        "import sys, tcbot.main; "
+        "print(any(m in sys.modules for m in ('discord', 'tweepy', 'psycopg2')))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "False"
+
+
+class FakeBotClient:
+    def __init__(self):
+        self.aborted = False
+
+    def attach(self, monitor_db, tw_auth, stream_auths=None):
+        raise OSError("unexpected")
+
+    async def abort(self):
+        self.aborted = True
+
+
+def test_abort_on_unexpected_error():
+    bot_cli = FakeBotClient()
+    db_future = concurrent.futures.Future()
+    db_future.set_result("db")
+    auth_future = concurrent.futures.Future()
+    auth_future.set_result("auth")
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_attach(bot_cli, db_future, [auth_future]))
+    finally:
+        loop.close()
+    # Bot exits instead of leaving commands waiting for the attachment
+    assert bot_cli.aborted
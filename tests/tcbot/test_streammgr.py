@@ -0,0 +1,23 @@
+from tcbot.matcher import MonitorMatcher
+from tcbot.streammgr import StreamManager
+
+
+def _monitor(channel_id, twitter_id, match_ptn=None):
+    return {"channel_id": channel_id, "twitter_id": twitter_id, "match_ptn": match_ptn}
+
+
+class TestStreamManager:
+    def test_apply_changes_received_before_start(self, loop):
+        streams = StreamManager(None, [], None, loop)
+        streams.add(_monitor(1, 10))
+        streams.add(_monitor(1, 20))
+        streams.remove(1, 30)
+        streams.remove(1, 20)
+
+        # Monitors may be selected before or after the changes
+        matcher = MonitorMatcher([_monitor(1, 10), _monitor(1, 30)])
+        streams.start(matcher)
+        assert matcher.user_id_map == {10: [_monitor(1, 10)]}
+
+        streams.add(_monitor(1, 40))
+        assert 40 in matcher
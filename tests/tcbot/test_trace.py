@@ -0,0 +1,70 @@
+import pytest
+
+from tcbot.exception import TCBotError
+from tcbot.trace import Tracer, parse, snowflake_to_ms, summarize
+
+STATUS_ID = 1212092628029698048
+
+
+def _read(path):
+    with open(path) as f:
+        return parse(f)
+
+
+class TestTracer:
+    def test_snowflake_to_ms(self):
+        assert snowflake_to_ms(STATUS_ID) == 1577820376771
+
+    def test_disabled(self, tmp_path):
+        tracer = Tracer(str(tmp_path / "trace.log"), 0.0)
+        assert not tracer.enabled
+        tracer.received(STATUS_ID)
+        tracer.matched(STATUS_ID, [1])
+        assert not (tmp_path / "trace.log").exists()
+
+    def test_trace_all_stages(self, tmp_path):
+        path = str(tmp_path / "trace.log")
+        tracer = Tracer(path, 1.0)
+        tracer.received(STATUS_ID)
+        tracer.matched(STATUS_ID, [1, 2])
+        tracer.enqueued(STATUS_ID, 1)
+        tracer.enqueued(STATUS_ID, 2)
+        tracer.sent(STATUS_ID, 1)
+        tracer.sent(STATUS_ID, 2, ok=False)
+        tracer.close()
+
+        records = _read(path)
+        assert [r["channel_id"] for r in records] == [1, 2]
+        assert records[0]["created"] == 1577820376771000
+        assert records[0]["created"] <= records[0]["received"] <= records[0]["matched"]
+        assert records[0]["matched"] <= records[0]["enqueued"] <= records[0]["sent"]
+        assert records[1]["sent"] is None
+
+    def test_trace_unmatched(self, tmp_path):
+        path = str(tmp_path / "trace.log")
+        tracer = Tracer(path, 1.0)
+        tracer.received(STATUS_ID)
+        tracer.matched(STATUS_ID, [])
+        tracer.close()
+
+        records = _read(path)
+        assert len(records) == 1
+        assert records[0]["channel_id"] is None
+        assert records[0]["matched"] is not None
+
+    def test_summarize(self):
+        lines = [
+            "# comment",
+            "1 10 1000 3000 3100 3200 5200",
+            "2 10 1000 5000 5100 - -",
+        ]
+        summary = summarize(parse(lines))
+        assert summary["twitter"]["count"] == 2
+        assert summary["twitter"]["max"] == 4.0
+        assert summary["discord"]["count"] == 1
+        assert summary["discord"]["p50"] == 2.0
+        assert summary["total"]["p99"] == 4.2
+
+    def test_parse_invalid_line(self):
+        with pytest.raises(TCBotError, match=r"^Invalid trace line\. line: 1 2 3$"):
+            parse(["1 2 3"])